@@ -0,0 +1,214 @@
+"""
+Offline micro-benchmarks of the SDK's encoding and signing hot paths.
+
+Run from the python directory:
+    python -m benchmarks.bench_sdk                                    # print results
+    python -m benchmarks.bench_sdk --save benchmarks/baseline_sdk.json
+    python -m benchmarks.bench_sdk --compare benchmarks/baseline_sdk.json
+
+Nothing touches the network: the SDK is built against an unreachable RPC url and every
+benchmarked method is pure encoding/hashing/signing with fixed keys and addresses. Each
+case is timed as the best of --repeat runs of at least --min-time seconds and reported as
+ops/sec (one op = one input, so batch cases are comparable to single ones). Allocated
+bytes per op come from a separate tracemalloc pass so they do not skew the timings.
+
+--compare exits with status 1 when any case is slower than the baseline by more than
+--threshold, or its peak allocation grew by more than --threshold. Baselines are machine
+specific, save them on the machine that compares against them.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+from utils.sdk import peaq_service_sdk, PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
+
+
+OWNER_PRIVATE_KEY = "0x" + "11" * 32
+EOA_ADDRESS = "0x2B5AD5c4795c026514f8317c7a215E218DcCD6cF"
+GAS_STATION_ADDRESS = "0x6c0CA4C0dbf7EB64cD87863110E4c93379ef897d"
+MACHINE_ADDRESS = "0x1f9840a85d5aF5bf1D1762F925BDADdC4201F984"
+BATCH_SIZE = 64
+
+
+def make_sdk():
+    # The RPC url is never dialled: none of the benchmarked methods make a call
+    return peaq_service_sdk(
+        "http://127.0.0.1:1",
+        "http://127.0.0.1:1",
+        "service-key",
+        "project-key",
+        GAS_STATION_ADDRESS,
+        None,
+        OWNER_PRIVATE_KEY,
+    )
+
+
+def address(i):
+    return "0x" + "{:040x}".format(0x1000 + i)
+
+
+def cases(sdk):
+    """
+    Returns { name: (fn, ops per call) }.
+    """
+    did_calldata = sdk.create_did_calldata("peaq", "did-hash", MACHINE_ADDRESS)
+    storage_calldata = sdk.add_storage_calldata("ITEM_TYPE", "MY_ITEM")
+    email_signature = "0x" + "ab" * 65
+    did_signature = "0x" + "cd" * 65
+
+    eoas = [address(i) for i in range(BATCH_SIZE)]
+    nonces = list(range(1000, 1000 + BATCH_SIZE))
+    items = [("ITEM_TYPE_{}".format(i), "item value {}".format(i) * 4) for i in range(BATCH_SIZE)]
+    did_hashes = ["did-hash-{}".format(i) * 8 for i in range(BATCH_SIZE)]
+
+    return {
+        "create_did_hash": (
+            lambda: sdk.create_did_hash(EOA_ADDRESS, did_signature, email_signature, MACHINE_ADDRESS), 1),
+        "create_did_hash[batch]": (
+            lambda: [sdk.create_did_hash(eoa, did_signature, email_signature, MACHINE_ADDRESS) for eoa in eoas], BATCH_SIZE),
+        "create_did_calldata": (
+            lambda: sdk.create_did_calldata("peaq", "did-hash", MACHINE_ADDRESS), 1),
+        "create_did_calldata[batch]": (
+            lambda: [sdk.create_did_calldata("peaq", did_hash, MACHINE_ADDRESS) for did_hash in did_hashes], BATCH_SIZE),
+        "add_storage_calldata": (
+            lambda: sdk.add_storage_calldata("ITEM_TYPE", "MY_ITEM"), 1),
+        "add_storage_calldata[batch]": (
+            lambda: sdk.add_storage_calldatas(items), BATCH_SIZE),
+        "generate_eoa_signature": (
+            lambda: sdk.generate_eoa_signature(MACHINE_ADDRESS, PRECOMPILE_ADDRESS_DID, did_calldata, 7), 1),
+        "generate_eoa_signature[batch]": (
+            lambda: [sdk.generate_eoa_signature(MACHINE_ADDRESS, PRECOMPILE_ADDRESS_STORAGE, storage_calldata, nonce) for nonce in nonces], BATCH_SIZE),
+        "generate_owner_signature": (
+            lambda: sdk.generate_owner_signature(EOA_ADDRESS, PRECOMPILE_ADDRESS_DID, did_calldata, 7), 1),
+        "generate_owner_signature[batch]": (
+            lambda: [sdk.generate_owner_signature(EOA_ADDRESS, PRECOMPILE_ADDRESS_STORAGE, storage_calldata, nonce) for nonce in nonces], BATCH_SIZE),
+        "generate_owner_deploy_signature": (
+            lambda: sdk.generate_owner_deploy_signature(EOA_ADDRESS, 7), 1),
+        "generate_owner_deploy_signature[batch]": (
+            lambda: sdk.generate_owner_deploy_signatures(eoas, nonces), BATCH_SIZE),
+    }
+
+
+def time_case(fn, ops, repeat, min_time):
+    # Calibrate the number of calls per run so a run lasts about min_time
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or calls >= 1 << 20:
+            break
+        calls *= 2
+    calls = max(1, int(calls * min_time / max(elapsed, 1e-9)))
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return calls * ops / best
+
+
+def allocations_case(fn, ops):
+    fn()  # warm caches so one-time allocations are not counted
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    # Peak is the high-water mark of live allocations during the call, retained is what the results keep
+    return {"peak_bytes_per_op": (peak - start) / ops, "retained_bytes_per_op": (current - start) / ops}
+
+
+def run(names=None, repeat=5, min_time=0.2):
+    sdk = make_sdk()
+    results = {}
+    for name, (fn, ops) in cases(sdk).items():
+        if names and not any(name.startswith(wanted) for wanted in names):
+            continue
+        result = {"ops_per_sec": time_case(fn, ops, repeat, min_time)}
+        result.update(allocations_case(fn, ops))
+        results[name] = result
+        print("{:<40} {:>14,.0f} ops/s {:>12,.0f} peak B/op {:>10,.0f} retained B/op".format(
+            name, result["ops_per_sec"], result["peak_bytes_per_op"], result["retained_bytes_per_op"]))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the list of regressions of results against baseline, as printable strings.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        speed = result["ops_per_sec"] / base["ops_per_sec"]
+        if speed < 1 - threshold:
+            regressions.append("{}: {:,.0f} ops/s vs {:,.0f} baseline ({:+.1f}%)".format(
+                name, result["ops_per_sec"], base["ops_per_sec"], 100 * (speed - 1)))
+        base_peak = base.get("peak_bytes_per_op")
+        if base_peak and result["peak_bytes_per_op"] > base_peak * (1 + threshold):
+            regressions.append("{}: {:,.0f} peak bytes/op vs {:,.0f} baseline".format(
+                name, result["peak_bytes_per_op"], base_peak))
+    return regressions
+
+
+def environment():
+    from importlib.metadata import version, PackageNotFoundError
+
+    packages = {}
+    for package in ("web3", "eth-abi", "eth-account", "protobuf"):
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            packages[package] = None
+    return {"python": platform.python_version(), "machine": platform.machine(), "packages": packages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline SDK micro-benchmarks.")
+    parser.add_argument("names", nargs="*", help="only run cases whose name starts with one of these")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case, the best one counts")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed run")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown/allocation growth, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    # The SDK logs every encoded value at DEBUG to a file, which would dominate the timings
+    logging.getLogger("utils.sdk").setLevel(logging.WARNING)
+
+    results = run(args.names, args.repeat, args.min_time)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved baseline to {}".format(args.save))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if baseline.get("environment") != environment():
+            print("Note: baseline was recorded with {}".format(baseline.get("environment")))
+        if regressions:
+            print("Regressions against {}:".format(args.compare))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions against {}".format(args.compare))
+
+
+if __name__ == "__main__":
+    main()
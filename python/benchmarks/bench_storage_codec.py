@@ -0,0 +1,81 @@
+"""
+Gas comparison of raw vs storage-codec encoded peaq storage items.
+
+Run from the python directory:
+    python -m benchmarks.bench_storage_codec
+
+Gas is estimated from the addItem calldata (16 gas per non-zero byte, 4 per zero byte)
+plus the 21000 base cost of every extra transaction a chunked item needs. Raw items above
+the storage size limit are reported as failing, since the precompile rejects them.
+
+Payloads that already fit raw cost about the same encoded, typically no less: the codec
+is what makes oversized items storable at all, not a way to save gas on small ones.
+"""
+import json
+import random
+
+from eth_abi import encode
+from eth_utils import keccak
+
+from utils import storage_codec
+
+
+ADD_ITEM_SELECTOR = keccak(text="addItem(bytes,bytes)")[:4]
+TX_BASE_GAS = 21000
+
+
+def calldata_gas(calldata):
+    return sum(16 if byte else 4 for byte in calldata)
+
+
+def add_item_calldata(item_type, item):
+    return ADD_ITEM_SELECTOR + encode(['bytes', 'bytes'], [item_type.encode("utf-8"), item])
+
+
+def realistic_payloads():
+    rng = random.Random(7)
+    quests = [
+        {"quest": "quest-{}".format(i), "completed": True, "points": rng.randint(10, 500), "tag": "TEST",
+         "timestamp": 1730000000 + i * 3600}
+        for i in range(40)
+    ]
+    return {
+        "short_item": "MY_ITEM",
+        "quest_status": json.dumps({"quest": "daily-login", "completed": True, "streak": 12}),
+        "quest_summary": json.dumps(quests[:3]),
+        "quest_history": json.dumps(quests),
+        "device_readings": ",".join("{:.2f}".format(20 + rng.random() * 5) for _ in range(300)),
+        "profile_text": "peaq machine owner profile. " * 30,
+    }
+
+
+def run():
+    fit_raw = fit_encoded = 0
+    total_raw = total_encoded = 0
+    print("codec: {}".format(storage_codec.DEFAULT_CODEC))
+    print("{:<16} {:>8} {:>10} {:>8} {:>12} {:>10}".format("payload", "bytes", "raw gas", "chunks", "encoded gas", "saved"))
+    for item_type, item in realistic_payloads().items():
+        raw = item.encode("utf-8")
+        raw_gas = calldata_gas(add_item_calldata(item_type, raw)) + TX_BASE_GAS
+        chunks = storage_codec.encode_item(raw, item_type)
+        encoded_gas = sum(calldata_gas(add_item_calldata(key, payload)) + TX_BASE_GAS for key, payload in chunks)
+
+        fits = len(raw) <= storage_codec.DEFAULT_MAX_ITEM_SIZE
+        saved = "{:.1f}%".format(100.0 * (raw_gas - encoded_gas) / raw_gas) if fits else "raw fails"
+        print("{:<16} {:>8} {:>10} {:>8} {:>12} {:>10}".format(item_type, len(raw), raw_gas, len(chunks), encoded_gas, saved))
+        total_raw += raw_gas
+        total_encoded += encoded_gas
+        if fits:
+            fit_raw += raw_gas
+            fit_encoded += encoded_gas
+
+        assert storage_codec.decode_item(item_type, dict(chunks).get) == raw
+
+    print("gas saved on payloads that fit raw: {} ({:.1f}%)".format(
+        fit_raw - fit_encoded, 100.0 * (fit_raw - fit_encoded) / fit_raw))
+    print("gas saved on all payloads, ignoring the size limit: {} ({:.1f}%)".format(
+        total_raw - total_encoded, 100.0 * (total_raw - total_encoded) / total_raw))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,312 @@
+"""
+Open-loop load generator for python_server/event_listener.py.
+
+Run from the python directory, against the offline simulator and a local server it starts:
+    python -m benchmarks.load_test --spawn --rate 5 --duration 60
+
+or against a server that is already running:
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rate 2 --duration 30
+
+A virtual user keeps talking to one server, so a comma separated --url spreads users over
+several servers the way a load balancer with sticky sessions per eoa would. --spawn with
+--workers N starts N such servers sharing one eoa index (EOA_INDEX_PATH); prepared
+transactions live in the worker that built them, so unpinned uvicorn workers would not do.
+
+Virtual users arrive at --rate per second (Poisson arrivals, or evenly spaced with
+--constant) whether or not earlier ones finished, so a slow server shows up as growing
+latency and concurrency instead of a quietly lower request rate. Each virtual user has
+its own EOA key and walks the real flow, signing every returned message locally:
+
+    signup            POST /api/signup
+    did_message       POST /api/generate-eoa-tx-message   (DID precompile)
+    did_execute       POST /api/test                      (DID precompile)
+    storage_message   POST /api/storage-transaction
+    storage_execute   POST /api/test                      (storage precompile)
+
+The report gives requests, errors, throughput and p50/p95/p99 latency per step, plus the
+most common error messages (a wrong-signature error under load is what a nonce race
+looks like).
+"""
+import argparse
+import collections
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from utils.config import PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
+
+
+STEPS = ("signup", "did_message", "did_execute", "storage_message", "storage_execute")
+
+
+class StepStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.messages = collections.Counter()
+        self.completed_users = 0
+        self.dropped_users = 0
+        self.max_active = 0
+
+    def record(self, step, latency, error=None):
+        with self.lock:
+            self.latencies[step].append(latency)
+            if error is not None:
+                self.errors[step] += 1
+                self.messages["{}: {}".format(step, error)[:200]] += 1
+
+
+class VirtualUser:
+    """
+    One wallet walking the signup → DID → storage flow.
+    """
+    def __init__(self, base_url, stats, session, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.session = session
+        self.timeout = timeout
+        self.account = Account.create()
+        self.email = "vu-{}@loadtest.local".format(uuid.uuid4().hex[:12])
+
+    def run(self):
+        address = self.account.address
+        response = self.post("signup", "/api/signup", {"email": self.email, "eoa_address": address, "tag": "TEST"})
+        if response is None:
+            return False
+        did_signature = self.sign_text(response["did_tx_message"])
+
+        response = self.post("did_message", "/api/generate-eoa-tx-message",
+                             {"signature": did_signature, "eoa_address": address, "target": PRECOMPILE_ADDRESS_DID})
+        if response is None:
+            return False
+        response = self.post("did_execute", "/api/test",
+                             {"signature": self.sign_hash(response["eoa_tx_message"]), "eoa_address": address, "target": PRECOMPILE_ADDRESS_DID})
+        if response is None:
+            return False
+
+        response = self.post("storage_message", "/api/storage-transaction",
+                             {"eoa_address": address, "target": PRECOMPILE_ADDRESS_STORAGE, "item_type": "LOAD_TEST", "item": uuid.uuid4().hex})
+        if response is None:
+            return False
+        response = self.post("storage_execute", "/api/test",
+                             {"signature": self.sign_hash(response["eoa_tx_message"]), "eoa_address": address, "target": PRECOMPILE_ADDRESS_STORAGE})
+        return response is not None
+
+    def post(self, step, path, body):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+            content = response.json()
+            error = None
+            if response.status_code != 200 or content.get("status") != "success":
+                error = "{} {}".format(response.status_code, content.get("message"))
+        except (requests.RequestException, ValueError) as e:
+            content = None
+            error = type(e).__name__
+        self.stats.record(step, time.perf_counter() - start, error)
+        return content if error is None else None
+
+    def sign_text(self, message):
+        return self.account.sign_message(encode_defunct(text=message)).signature.hex()
+
+    def sign_hash(self, message_hash):
+        # Same as the frontend's personal_sign over the 32 byte message
+        return self.account.sign_message(encode_defunct(hexstr=message_hash)).signature.hex()
+
+
+def run_load(base_url, rate, duration, constant=False, max_users=1000, timeout=120, seed=None):
+    """
+    Starts virtual users at `rate` per second for `duration` seconds and waits for them.
+    base_url may be a list, users are then assigned to the servers round robin.
+    Returns (stats, elapsed seconds).
+    """
+    base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+    arrivals = itertools.count()
+    stats = StepStats()
+    rng = random.Random(seed)
+    active = []
+    active_lock = threading.Lock()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_users))
+
+    def user_thread(user_url):
+        try:
+            ok = VirtualUser(user_url, stats, session, timeout).run()
+        finally:
+            with active_lock:
+                active.remove(threading.current_thread())
+        if ok:
+            with stats.lock:
+                stats.completed_users += 1
+
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < duration:
+        now = time.perf_counter()
+        if next_arrival > now:
+            time.sleep(next_arrival - now)
+        with active_lock:
+            if len(active) >= max_users:
+                # Arrivals are never delayed (that would hide the slowdown), only dropped and counted
+                stats.dropped_users += 1
+                thread = None
+            else:
+                user_url = base_urls[next(arrivals) % len(base_urls)]
+                thread = threading.Thread(target=user_thread, args=(user_url,), daemon=True)
+                active.append(thread)
+                stats.max_active = max(stats.max_active, len(active))
+        if thread is not None:
+            thread.start()
+        next_arrival += 1.0 / rate if constant else rng.expovariate(rate)
+
+    while True:
+        with active_lock:
+            remaining = list(active)
+        if not remaining:
+            break
+        remaining[0].join(timeout=1)
+    return stats, time.perf_counter() - start
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def report(stats, elapsed):
+    rows = {}
+    for step in STEPS:
+        latencies = sorted(stats.latencies[step])
+        rows[step] = {
+            "requests": len(latencies),
+            "errors": stats.errors[step],
+            "throughput": (len(latencies) - stats.errors[step]) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+    return {
+        "elapsed": elapsed,
+        "completed_users": stats.completed_users,
+        "dropped_users": stats.dropped_users,
+        "max_concurrent_users": stats.max_active,
+        "steps": rows,
+        "top_errors": stats.messages.most_common(10),
+    }
+
+
+def print_report(result):
+    print("{:<16} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}".format("step", "requests", "errors", "ok/s", "p50 ms", "p95 ms", "p99 ms"))
+    for step, row in result["steps"].items():
+        print("{:<16} {:>8} {:>7} {:>9.2f} {:>9} {:>9} {:>9}".format(
+            step, row["requests"], row["errors"], row["throughput"],
+            *("-" if row[p] is None else "{:.0f}".format(row[p] * 1000) for p in ("p50", "p95", "p99"))))
+    print("{} users completed in {:.1f}s, {} dropped at the concurrency cap, {} concurrent at most".format(
+        result["completed_users"], result["elapsed"], result["dropped_users"], result["max_concurrent_users"]))
+    for message, count in result["top_errors"]:
+        print("  {:>5}x {}".format(count, message))
+
+
+def spawn_stack(port, block_time, latency, workers):
+    """
+    Starts the simulator in-process and `workers` single-worker API servers on consecutive
+    ports from `port`, as uvicorn subprocesses pointed at it and sharing one eoa index.
+    Returns (simulator, server processes, base urls).
+    """
+    from simulator import Simulator, SimulatorConfig
+
+    simulator = Simulator(SimulatorConfig(block_time=block_time, latency=latency)).start()
+    owner = Account.create()
+    env = dict(os.environ)
+    env.update({
+        "AGUNG_RPC_URL": simulator.rpc_url,
+        "PEAQ_SERVICE_URL": simulator.service_url,
+        "SERVICE_API_KEY": "load-test",
+        "PROJECT_API_KEY": "load-test",
+        "GAS_STATION_ADDRESS": "0x6c0CA4C0dbf7EB64cD87863110E4c93379ef897d",
+        "GAS_STATION_OWNER_PUBLIC_KEY": owner.address,
+        "GAS_STATION_OWNER_PRIVATE_KEY": owner.key.hex(),
+        "TX_JOURNAL_PATH": "",
+    })
+    if workers > 1:
+        env["EOA_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load-test-"), "eoa.index")
+    servers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "python_server.event_listener:app", "--port", str(port + offset),
+             "--log-level", "warning"],
+            env=env,
+        )
+        for offset in range(workers)
+    ]
+    base_urls = ["http://127.0.0.1:{}".format(port + offset) for offset in range(workers)]
+    deadline = time.monotonic() + 30
+    waiting = list(base_urls)
+    while waiting and time.monotonic() < deadline:
+        try:
+            requests.get(waiting[0] + "/metrics", timeout=1)
+            waiting.pop(0)
+        except requests.RequestException:
+            time.sleep(0.2)
+    if not waiting:
+        return simulator, servers, base_urls
+    for server in servers:
+        server.terminate()
+    simulator.stop()
+    raise RuntimeError("Server did not come up on {}".format(waiting[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test of the signup/DID/storage flow.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server(s) to load, comma separated; ignored with --spawn")
+    parser.add_argument("--spawn", action="store_true", help="start the simulator and a local server to load")
+    parser.add_argument("--port", type=int, default=8765, help="first port of the spawned servers")
+    parser.add_argument("--workers", type=int, default=1, help="spawned servers, users are pinned to one each")
+    parser.add_argument("--block-time", type=float, default=1.0, help="simulated block time of the spawned stack")
+    parser.add_argument("--rpc-latency", type=float, default=0.02, help="simulated latency per RPC/service call")
+    parser.add_argument("--rate", type=float, default=2.0, help="virtual users started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting users")
+    parser.add_argument("--constant", action="store_true", help="evenly spaced arrivals instead of Poisson")
+    parser.add_argument("--max-users", type=int, default=1000, help="concurrent users above which arrivals are dropped")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, help="seed for the arrival process")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    simulator = None
+    servers = []
+    base_urls = [url.strip() for url in args.url.split(",") if url.strip()]
+    if args.spawn:
+        simulator, servers, base_urls = spawn_stack(args.port, args.block_time, args.rpc_latency, args.workers)
+    try:
+        stats, elapsed = run_load(base_urls, args.rate, args.duration, args.constant, args.max_users, args.timeout, args.seed)
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+        if simulator is not None:
+            simulator.stop()
+
+    result = report(stats, elapsed)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
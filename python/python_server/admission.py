@@ -0,0 +1,150 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when an endpoint is saturated. Carries the HTTP status and Retry-After seconds.
+    """
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded in-flight limit plus a bounded FIFO wait queue for one endpoint.
+
+    A request that finds the queue full is rejected immediately with 429; one that
+    waited longer than `queue_timeout` for a slot is rejected with 503.
+    """
+    def __init__(self, name, max_in_flight, max_queue, queue_timeout):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self._waiters = []
+
+        # metrics
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.service_time_avg = 0.0  # exponentially weighted, used for Retry-After
+
+    @asynccontextmanager
+    async def admit(self):
+        waited = await self._acquire()
+        self.admitted += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.service_time_avg = elapsed if not self.service_time_avg else 0.8 * self.service_time_avg + 0.2 * elapsed
+            self._release()
+
+    def check(self):
+        """
+        Raises AdmissionRejected (429) when a request arriving now would find the queue full.
+        For endpoints that take their slot later, once their streaming response starts.
+        """
+        if (self.in_flight >= self.max_in_flight or self._waiters) and len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("Server busy, too many {} requests queued".format(self.name), 429, self.retry_after())
+
+    def retry_after(self):
+        # Rough time until the current queue has drained through the in-flight slots
+        backlog = len(self._waiters) + 1
+        estimate = self.service_time_avg * backlog / max(self.max_in_flight, 1)
+        return max(1, math.ceil(estimate))
+
+    def metrics(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_time_avg": self.wait_time_total / self.admitted if self.admitted else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "service_time_avg": self.service_time_avg,
+        }
+
+    async def _acquire(self):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("Server busy, too many {} requests queued".format(self.name), 429, self.retry_after())
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up
+                if timed_out:
+                    return time.perf_counter() - start
+                self._release()
+                raise
+            self._waiters.remove(waiter)
+            waiter.cancel()
+            if timed_out:
+                self.rejected_timeout += 1
+                raise AdmissionRejected("Timed out waiting for a free {} slot".format(self.name), 503, self.retry_after())
+            raise
+        return time.perf_counter() - start
+
+    def _release(self):
+        # Hand the slot directly to the next waiter so in_flight never dips below the limit under load
+        while self._waiters:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+_controllers = {}
+
+
+def get_admission(name, max_in_flight=4, max_queue=16, queue_timeout=30.0):
+    """
+    Returns the controller for an endpoint, creating it on first use.
+
+    Limits can be overridden per endpoint with ADMISSION_<NAME>_MAX_IN_FLIGHT,
+    ADMISSION_<NAME>_MAX_QUEUE and ADMISSION_<NAME>_QUEUE_TIMEOUT.
+    """
+    controller = _controllers.get(name)
+    if controller is None:
+        prefix = "ADMISSION_{}_".format(name.upper())
+        controller = AdmissionController(
+            name,
+            int(os.getenv(prefix + "MAX_IN_FLIGHT", max_in_flight)),
+            int(os.getenv(prefix + "MAX_QUEUE", max_queue)),
+            float(os.getenv(prefix + "QUEUE_TIMEOUT", queue_timeout)),
+        )
+        _controllers[name] = controller
+    return controller
+
+
+def admission_metrics():
+    return {name: controller.metrics() for name, controller in _controllers.items()}
@@ -1,12 +1,51 @@
 from fastapi import FastAPI, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 
-from utils.user_signup import user_signup
-from utils.create_tx import create_tx
-from utils.send_tx import send_tx
+from utils.config import get_config
+from utils.startup import lazy, prewarm
+from utils.tx_journal import get_tx_journal
+from utils.prepared_tx import PreparedTransaction
+from utils import tx_events
+from utils import metrics
+from utils import tracing
+from python_server.admission import AdmissionRejected, get_admission, admission_metrics
+from python_server.tx_scheduler import get_tx_scheduler, priority_for_target, PRIORITY_DEPLOY, PRIORITY_DID, PRIORITY_STORAGE
+
+from python_server.single_flight import SingleFlight
+from python_server.http_metrics import HttpMetricsMiddleware
+from python_server.http_tracing import HttpTracingMiddleware
+from python_server.profiler import ProfilerMiddleware, get_profiler, install_signal_handler
+from starlette.concurrency import run_in_threadpool
 
 from threading import Lock
+from contextlib import AsyncExitStack
+import asyncio
+import hmac
+import json
+import logging
+import os
+
+# Load .env before anything reads the environment
+get_config()
+
+logger = logging.getLogger(__name__)
+
+# -- The web3 stack is most of the import time, so it is loaded on first use (and pre-warmed on startup) --
+user_signup = lazy("utils.user_signup", "user_signup")
+user_signup_chunk = lazy("utils.user_signup", "user_signup_chunk")
+create_tx = lazy("utils.create_tx", "create_tx")
+create_storage_txs = lazy("utils.create_tx", "create_storage_txs")
+count_storage_txs = lazy("utils.create_tx", "count_storage_txs")
+send_tx = lazy("utils.send_tx", "send_tx")
+send_txs = lazy("utils.send_tx", "send_txs")
+recover_txs = lazy("utils.send_tx", "recover_txs")
+check_tx_signature = lazy("utils.send_tx", "check_tx_signature")
+check_budget = lazy("utils.send_tx", "check_budget")
+assign_tag = lazy("utils.gas_budget", "assign_tag")
+get_service_sdk = lazy("utils.sdk", "get_service_sdk")
+start_storage_index_reconciler = lazy("utils.storage_index", "start_reconciler")
+get_eoa_index = lazy("utils.eoa_index", "get_eoa_index")
 
 app = FastAPI()
 
@@ -15,10 +54,28 @@ nonce = 335  # Initial value
 nonce_lock = Lock()  # To prevent race conditions
 
 # -- In-memory data stores (replace with DB in production) --
+# With several workers and EOA_INDEX_PATH set, wallets (machine address, DID state, email, tag)
+# and the meta-tx nonce counter are shared through utils/eoa_index.py. Prepared transactions
+# are not: generate-eoa-tx-message / storage-transaction and the execute call that follows
+# must reach the same worker, so route requests sticky per eoa_address.
 eoa_data_store = {}       # { eoa_address: {... eoa_object ...} }
 pending_did_messages = {} # { eoa_address: did_message }
 pending_eoa_messages = {} # { eoa_address: eoa_tx_message }
 
+# -- Admission control for the endpoints that deploy/execute and wait on a receipt --
+signup_admission = get_admission("signup")
+execute_admission = get_admission("execute")
+signup_batch_admission = get_admission("signup_batch", max_in_flight=1, max_queue=2)
+
+# -- Every deploy/execute goes through the scheduler so signups are not stuck behind storage spam --
+tx_scheduler = get_tx_scheduler()
+
+# -- Duplicate (endpoint, eoa_address, target) requests share one computation --
+request_flight = SingleFlight(ttl=10.0)
+
+def is_success(response):
+    return response["status"] == "success"
+
 # -- CORS configuration --
 app.add_middleware(
     CORSMiddleware,
@@ -28,6 +85,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -- Per-endpoint latency/error/in-flight metrics, exposed at /metrics --
+app.add_middleware(HttpMetricsMiddleware, routes=app.router.routes)
+
+# -- Root span per request when TRACE_EXPORT_PATH is set, see utils/tracing.py --
+app.add_middleware(HttpTracingMiddleware)
+
+# -- Lets /admin/profile sample only while requests to one route are in flight --
+profiler = get_profiler()
+app.add_middleware(ProfilerMiddleware, routes=app.router.routes, profiler=profiler)
+
 # --------------------------------------------------------------------
 # 1) Helper Functions
 # --------------------------------------------------------------------
@@ -35,17 +102,86 @@ app.add_middleware(
 
 # Increment and get the global nonce atomically
 def get_and_increment_nonce():
+    return reserve_nonces(1)[0]
+
+# Reserve a contiguous block of gas station nonces atomically
+def reserve_nonces(count: int):
     global nonce
     with nonce_lock:
-        current_nonce = nonce
-        nonce += 1
-    return current_nonce
+        index = get_eoa_index()
+        if index is not None:
+            # Shared by every worker; the local value stays a floor (see recover_from_journal)
+            nonces = index.reserve_counter("meta_nonce", count, floor=nonce)
+        else:
+            nonces = list(range(nonce, nonce + count))
+        if nonces:
+            nonce = nonces[-1] + 1
+    return nonces
+
+def save_eoa_object(eoa_address: str, eoa_object: dict):
+    """
+    Store the EOA object in memory and snapshot it to the tx journal (if enabled) for crash recovery.
+    """
+    eoa_data_store[eoa_address] = eoa_object
+    journal = get_tx_journal()
+    if journal is not None:
+        journal.eoa(eoa_object)
+    # Other workers only learn about the wallet through the shared eoa index (if enabled)
+    index = get_eoa_index()
+    if index is not None and eoa_object.get("machine_address"):
+        did_registered = eoa_object.get("did_registered", False)
+        profile = {"email": eoa_object.get("email"), "tag": eoa_object.get("tag")}
+        indexed = index.get(eoa_address)
+        if indexed is None or indexed["email"] != profile["email"] or indexed["tag"] != profile["tag"]:
+            index.put(eoa_address, eoa_object["machine_address"], did_registered, profile)
+        elif (indexed["machine_address"] or "").lower() != eoa_object["machine_address"].lower() or indexed["did_registered"] != did_registered:
+            index.put(eoa_address, eoa_object["machine_address"], did_registered)
+
+def get_indexed_wallet(eoa_address: str):
+    """
+    The shared eoa index entry of a wallet, or None when there is none (or no index).
+    """
+    index = get_eoa_index()
+    if index is None or not eoa_address:
+        return None
+    try:
+        return index.get(eoa_address)
+    except ValueError:
+        # Not an address, so never indexed
+        return None
 
 def get_eoa_object(eoa_address: str):
     """
-    Retrieve the EOA object from in-memory store or return None if it doesn't exist.
+    Retrieve the EOA object from in-memory store, rebuilt from the shared eoa index when another
+    worker signed the wallet up, or return None if it doesn't exist.
     """
-    return eoa_data_store.get(eoa_address)
+    eoa_object = eoa_data_store.get(eoa_address)
+    if eoa_object is not None:
+        return eoa_object
+    wallet = get_indexed_wallet(eoa_address)
+    if wallet is None or not wallet["machine_address"]:
+        return None
+    eoa_object = {
+        "email": wallet["email"],
+        "eoa_address": eoa_address,
+        "tag": wallet["tag"],
+        "machine_address": wallet["machine_address"],
+        "did_registered": wallet["did_registered"],
+    }
+    return eoa_data_store.setdefault(eoa_address, eoa_object)
+
+def lookup_eoa(eoa_address: str):
+    """
+    Machine address and DID state of a wallet signed up through this or any other worker, or None.
+    """
+    # The index first: another worker may have registered the DID since this one cached the wallet
+    wallet = get_indexed_wallet(eoa_address)
+    if wallet is not None and wallet["machine_address"]:
+        return {"machine_address": wallet["machine_address"], "did_registered": wallet["did_registered"]}
+    eoa_object = eoa_data_store.get(eoa_address)
+    if eoa_object and eoa_object.get("machine_address"):
+        return {"machine_address": eoa_object["machine_address"], "did_registered": eoa_object.get("did_registered", False)}
+    return None
 
 def respond_with_success(data: dict, status_code: int = 200):
     """
@@ -62,6 +198,92 @@ def respond_with_error(message: str, status_code: int = 400):
     content = {"status": "error", "message": message}
     return JSONResponse(content=content, status_code=status_code)
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """
+    Fail fast with 429/503 and a Retry-After hint when an endpoint is saturated.
+    """
+    response = respond_with_error(exc.message, exc.status_code)
+    response.headers["Retry-After"] = str(exc.retry_after)
+    return response
+
+@app.on_event("startup")
+async def prewarm_imports():
+    """
+    Load the SDK in the background once the worker is up, instead of before it can bind.
+    """
+    prewarm("utils.user_signup", "utils.create_tx", "utils.send_tx")
+
+@app.on_event("startup")
+async def install_profiler_signal():
+    """
+    kill -USR2 <worker pid> writes a 30s profile of that worker, see python_server/profiler.py.
+    """
+    install_signal_handler()
+
+@app.on_event("startup")
+async def start_storage_index():
+    """
+    Re-check the local storage index against the chain every STORAGE_INDEX_RECONCILE_SECONDS.
+    """
+    if float(os.getenv("STORAGE_INDEX_RECONCILE_SECONDS", "0")):
+        await run_in_threadpool(lambda: start_storage_index_reconciler(get_service_sdk()))
+
+@app.on_event("startup")
+async def start_eoa_index():
+    """
+    Publish the shared eoa index from whichever worker holds its writer lock, see utils/eoa_index.py.
+    """
+    if os.getenv("EOA_INDEX_PATH"):
+        await run_in_threadpool(lambda: get_eoa_index().start())
+        # Seeds the shared meta-tx nonce counter, so utils/bulk_import.py never starts below our nonces
+        await run_in_threadpool(reserve_nonces, 0)
+
+@app.on_event("startup")
+async def recover_from_journal():
+    """
+    Restore the wallet store and re-attach receipt watchers to transactions that were
+    in flight when the server went down, instead of resending them.
+    """
+    global nonce
+    journal = get_tx_journal()
+    if journal is None:
+        return
+    _, eoa_objects = journal.replay()
+    used_nonces = [journal.max_meta_nonce] if journal.max_meta_nonce is not None else []
+    for eoa_object in eoa_objects.values():
+        # Transactions sent after the restart are charged to the wallet's tag again
+        assign_tag(eoa_object["eoa_address"], eoa_object.get("tag"))
+        # Prepared transactions were journaled as JSON
+        if eoa_object.get("prepared"):
+            eoa_object["prepared"] = PreparedTransaction.from_json(eoa_object["prepared"])
+            used_nonces.append(eoa_object["prepared"].nonce)
+        if eoa_object.get("batch_prepared"):
+            eoa_object["batch_prepared"] = [PreparedTransaction.from_json(prepared) for prepared in eoa_object["batch_prepared"]]
+            used_nonces.extend(prepared.nonce for prepared in eoa_object["batch_prepared"])
+    eoa_data_store.update(eoa_objects)
+    if used_nonces:
+        # Meta-tx nonces handed out before the restart are spent (or reserved by a prepared transaction)
+        with nonce_lock:
+            nonce = max(nonce, max(used_nonces) + 1)
+        await run_in_threadpool(reserve_nonces, 0)
+
+    def on_settled(record, machine_address):
+        # A deployment that confirmed while we were down still needs its machine address stored.
+        # The journal has the checksummed eoa while the store is keyed by what the client sent.
+        if not machine_address:
+            return
+        eoa_address = next((key for key in eoa_data_store if key.lower() == record["eoa"].lower()), record["eoa"])
+        eoa_object = eoa_data_store.get(eoa_address) or {"email": None, "eoa_address": eoa_address, "tag": "TEST"}
+        if not eoa_object.get("machine_address"):
+            eoa_object["machine_address"] = machine_address
+            save_eoa_object(eoa_address, eoa_object)
+
+    pending = await run_in_threadpool(recover_txs, on_settled)
+    journal.compact()
+    logger.info("Recovered {} wallets and {} in-flight transactions from the journal".format(len(eoa_objects), len(pending)))
+
+
 # --------------------------------------------------------------------
 # 2) Signup & DID Generation
 # --------------------------------------------------------------------
@@ -71,6 +293,7 @@ async def signup(request: Request):
     email = data.get("email")
     eoa_address = data.get("eoa_address")
     tag = data.get("tag", "TEST")  # Default "TEST" if not provided
+    tracing.set_attribute("eoa", eoa_address)
 
     if not eoa_address:
         return respond_with_error("Missing eoa_address")
@@ -81,17 +304,119 @@ async def signup(request: Request):
         "tag": tag,
     }
 
-    response = user_signup(eoa_object, nonce)
-    get_and_increment_nonce()
+    async def run_signup():
+        # Checked here rather than up front, so a retry within the ttl still gets the cached message
+        if lookup_eoa(eoa_address):
+            return {"status": "failure", "message": "Already signed up"}
+        async with signup_admission.admit():
+            current_nonce = get_and_increment_nonce()
+            job = tx_scheduler.submit(PRIORITY_DEPLOY, eoa_address, user_signup, eoa_object, current_nonce)
+            response = await asyncio.wrap_future(job)
+        if response["status"] == "success":
+            # Save the eoa_object in memory
+            save_eoa_object(eoa_address, eoa_object)
+        return response
+
+    # An empty gas station answers right away instead of after a queued deployment fails
+    error = await run_in_threadpool(check_budget, tag)
+    if error:
+        return respond_with_error(error, 503)
+
+    # A double click waits on the first deployment instead of deploying a second account
+    response = await request_flight.do(("signup", eoa_address, None), run_signup, is_success)
     if response["status"] == "success":
-        # Save the eoa_object in memory
-        eoa_data_store[eoa_address] = eoa_object
         # Return the message to sign
         return respond_with_success({"did_tx_message": response["message"]})
     else:
         return respond_with_error(response["message"])
 
 
+@app.post("/api/signup/batch")
+async def signup_batch(request: Request):
+    """
+    Bulk signup. Body: {"users": [{"email", "eoa_address", "tag"}, ...]}.
+    Deployments are queued on the scheduler in chunks of PIPELINE_WINDOW, each chunk
+    pipelined as one job. Streams one NDJSON line per eoa as its chunk completes.
+    """
+    from web3 import Web3
+
+    data = await request.json()
+    users = data.get("users") or []
+
+    eoa_objects = []
+    seen = set()
+    rejected = []
+    for user in users:
+        eoa_address = user.get("eoa_address")
+        if not eoa_address or not Web3.is_address(eoa_address):
+            rejected.append({"status": "failure", "eoa_address": eoa_address, "message": "Missing or invalid eoa_address"})
+            continue
+        if eoa_address.lower() in seen or lookup_eoa(eoa_address):
+            rejected.append({"status": "failure", "eoa_address": eoa_address, "message": "Already signed up"})
+            continue
+        seen.add(eoa_address.lower())
+        eoa_objects.append({
+            "email": user.get("email"),
+            "eoa_address": eoa_address,
+            "tag": user.get("tag", "TEST"),
+        })
+
+    if not eoa_objects and not rejected:
+        return respond_with_error("Missing users")
+    for tag in {eoa_object["tag"] for eoa_object in eoa_objects}:
+        error = await run_in_threadpool(check_budget, tag)
+        if error:
+            return respond_with_error(error, 503)
+
+    # Saturation still answers 429 before streaming starts. The slot itself is taken inside the
+    # stream, so a client that goes away before the body is read never holds it.
+    signup_batch_admission.check()
+    eoa_objects_by_address = {eoa_object["eoa_address"]: eoa_object for eoa_object in eoa_objects}
+
+    async def stream_results():
+        for result in rejected:
+            yield json.dumps(result) + "\n"
+        if not eoa_objects:
+            return
+        async with AsyncExitStack() as admission:
+            try:
+                await admission.enter_async_context(signup_batch_admission.admit())
+            except AdmissionRejected as e:
+                # Lost the race for the last queue place after check(), the response already started
+                for eoa_object in eoa_objects:
+                    yield json.dumps({"status": "failure", "eoa_address": eoa_object["eoa_address"], "message": e.message}) + "\n"
+                return
+
+            from utils.sdk import PIPELINE_WINDOW
+
+            nonces = reserve_nonces(len(eoa_objects))
+            # All chunks are queued up front; single signups still get their turn between them
+            chunks = []
+            for start in range(0, len(eoa_objects), PIPELINE_WINDOW):
+                chunk = eoa_objects[start:start + PIPELINE_WINDOW]
+                eoa_addresses = [eoa_object["eoa_address"] for eoa_object in chunk]
+                job = tx_scheduler.submit_batch(PRIORITY_DEPLOY, eoa_addresses, user_signup_chunk, chunk, nonces[start:start + PIPELINE_WINDOW])
+                chunks.append((eoa_addresses, job))
+
+            for eoa_addresses, job in chunks:
+                try:
+                    results = await asyncio.wrap_future(job)
+                except Exception as e:
+                    results = [{"status": "failure", "eoa_address": eoa_address, "message": str(e)} for eoa_address in eoa_addresses]
+                for result in results:
+                    if result["status"] == "success":
+                        save_eoa_object(result["eoa_address"], eoa_objects_by_address[result["eoa_address"]])
+                        result = {
+                            "status": "success",
+                            "eoa_address": result["eoa_address"],
+                            "machine_address": result["machine_address"],
+                            "did_tx_message": result["message"],
+                        }
+                    yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 # --------------------------------------------------------------------
 # 3) Generate EOA Tx Message
 # --------------------------------------------------------------------
@@ -101,17 +426,28 @@ async def generate_eoa_tx_message(request: Request):
     signature = data.get("signature")
     eoa_address = data.get("eoa_address")
     target = data.get("target")
+    tracing.set_attribute("eoa", eoa_address)
+    tracing.set_attribute("target", target)
 
     eoa_object = get_eoa_object(eoa_address)
     if not eoa_object:
         return respond_with_error("No eoa_event found for this wallet.")
     
-    print("EOA NONCE", nonce)
-    response = create_tx(eoa_object, signature, target, nonce, "")
+    async def run_create_tx():
+        # The nonce is reserved now and travels with the prepared transaction, so concurrent
+        # wallets never sign messages over the same nonce
+        current_nonce = get_and_increment_nonce()
+        logger.debug("EOA nonce {}".format(current_nonce))
+        response = await run_in_threadpool(create_tx, eoa_object, signature, target, current_nonce, "")
+        if response["status"] == "success":
+            # Save the prepared transaction in memory to be executed later
+            eoa_object["prepared"] = response["prepared"]
+            save_eoa_object(eoa_address, eoa_object)
+        return response
+
+    # The signature is part of the key: a request with another signature must not get this one's message
+    response = await request_flight.do(("generate-eoa-tx-message", eoa_address, target, signature), run_create_tx, is_success)
     if response["status"] == "success":
-        # Save the calldata in memory to be referenced later
-        eoa_object["calldata"] = response["calldata"]
-        eoa_data_store[eoa_address] = eoa_object
         return respond_with_success({"eoa_tx_message": response["message"]})
     else:
         return respond_with_error(response["message"])
@@ -126,6 +462,8 @@ async def test_endpoint(request: Request):
     eoa_signature = data.get("signature")
     eoa_address = data.get("eoa_address")
     target = data.get("target")
+    tracing.set_attribute("eoa", eoa_address)
+    tracing.set_attribute("target", target)
 
     eoa_object = get_eoa_object(eoa_address)
     if not eoa_object:
@@ -133,13 +471,37 @@ async def test_endpoint(request: Request):
 
     print("My object:", eoa_object)
     print("Target: ", target)
-    print("Nonce: ", nonce)
-    response = send_tx(eoa_object, eoa_signature, target, nonce)
-    get_and_increment_nonce()
+    try:
+        priority = priority_for_target(target)
+    except TypeError as e:
+        return respond_with_error(str(e))
+
+    prepared = eoa_object.get("prepared")
+    if not eoa_signature or prepared is None:
+        return respond_with_error("Missing signature or no pending transaction for this wallet.")
+    if prepared.target.lower() != target.lower():
+        return respond_with_error("The pending transaction for this wallet is for target {}.".format(prepared.target))
+    print("Nonce: ", prepared.nonce)
+
+    async with execute_admission.admit():
+        # Reject a wrong signature before it queues behind real work or touches the chain
+        error = await run_in_threadpool(check_tx_signature, prepared, eoa_signature)
+        if error:
+            return respond_with_error(error)
+        error = await run_in_threadpool(check_budget, eoa_object.get("tag"))
+        if error:
+            return respond_with_error(error, 503)
+        job = tx_scheduler.submit(priority, eoa_address, send_tx, prepared, eoa_signature)
+        response = await asyncio.wrap_future(job)
     if response["status"] == "success":
-        # delete the previously stored calldata
-        del eoa_object["calldata"]
-        eoa_data_store[eoa_address] = eoa_object
+        # delete the previously prepared transaction, unless a newer one replaced it meanwhile
+        if eoa_object.get("prepared") is prepared:
+            del eoa_object["prepared"]
+        if priority == PRIORITY_DID:
+            eoa_object["did_registered"] = True
+        save_eoa_object(eoa_address, eoa_object)
+        # The prepared transaction is spent, so cached messages for this target are stale now
+        request_flight.forget(("generate-eoa-tx-message", eoa_address, target))
         return respond_with_success({"message": response["message"]})
     else:
         return respond_with_error(response["message"])
@@ -153,6 +515,8 @@ async def storage_transaction(request: Request):
     data = await request.json()
     eoa_address = data.get("eoa_address")
     target = data.get("target")
+    tracing.set_attribute("eoa", eoa_address)
+    tracing.set_attribute("target", target)
     item_type = data.get("item_type")
     item = data.get("item")
     quest_data = {}
@@ -166,20 +530,229 @@ async def storage_transaction(request: Request):
     if not eoa_object:
         return respond_with_error("No eoa_event found for this wallet.")
     
+    current_nonce = get_and_increment_nonce()
     print("My object:", eoa_object)
     print("Target: ", target)
-    print("Nonce: ", nonce)
+    print("Nonce: ", current_nonce)
     print("Nonce: ", quest_data)
     
-    response = create_tx(eoa_object, "", target, nonce, quest_data)
+    # Owner signing and a peaq service round trip, which may wait on the service limiter
+    response = await run_in_threadpool(create_tx, eoa_object, "", target, current_nonce, quest_data)
     if response["status"] == "success":
-        # Save the calldata in memory to be referenced later
-        eoa_object["calldata"] = response["calldata"]
-        eoa_data_store[eoa_address] = eoa_object
+        # Save the prepared transaction in memory to be executed later
+        eoa_object["prepared"] = response["prepared"]
+        save_eoa_object(eoa_address, eoa_object)
         return respond_with_success({"eoa_tx_message": response["message"]})
     else:
         return respond_with_error(response["message"])
 
+@app.post("/api/storage-transaction/batch")
+async def storage_transaction_batch(request: Request):
+    """
+    Body: {"eoa_address", "items": [{"item_type", "item", "encode"}, ...]}.
+    Returns one message per stored item for the EOA to sign, in item order. Items sent with
+    "encode": true are compressed/chunked by the storage codec and may need several messages.
+    """
+    data = await request.json()
+    eoa_address = data.get("eoa_address")
+    items = data.get("items") or []
+    tracing.set_attribute("eoa", eoa_address)
+
+    eoa_object = get_eoa_object(eoa_address)
+    if not eoa_object:
+        return respond_with_error("No eoa_event found for this wallet.")
+    if not items or any(not item.get("item_type") or item.get("item") is None for item in items):
+        return respond_with_error("Missing items")
+
+    nonces = reserve_nonces(count_storage_txs(items))
+    response = await run_in_threadpool(create_storage_txs, eoa_object, items, nonces)
+    if response["status"] == "success":
+        # Save the prepared transactions (with their reserved nonces) in memory to be executed later
+        eoa_object["batch_prepared"] = response["prepared"]
+        save_eoa_object(eoa_address, eoa_object)
+        return respond_with_success({"eoa_tx_messages": response["messages"], "item_types": response["item_types"]})
+    else:
+        return respond_with_error(response["message"])
+
+
+@app.post("/api/storage-transaction/batch/execute")
+async def storage_transaction_batch_execute(request: Request):
+    """
+    Body: {"eoa_address", "signatures": [...]} with one EOA signature per message returned by
+    /api/storage-transaction/batch. All addItem calls are sent pipelined.
+    """
+    data = await request.json()
+    eoa_address = data.get("eoa_address")
+    eoa_signatures = data.get("signatures") or []
+    tracing.set_attribute("eoa", eoa_address)
+
+    eoa_object = get_eoa_object(eoa_address)
+    if not eoa_object or "batch_prepared" not in eoa_object:
+        return respond_with_error("No storage batch found for this wallet.")
+    prepared_txs = eoa_object["batch_prepared"]
+    if len(eoa_signatures) != len(prepared_txs):
+        return respond_with_error("Expected one signature per storage item")
+
+    error = await run_in_threadpool(check_budget, eoa_object.get("tag"))
+    if error:
+        return respond_with_error(error, 503)
+
+    async with execute_admission.admit():
+        job = tx_scheduler.submit(PRIORITY_STORAGE, eoa_address, send_txs, prepared_txs, eoa_signatures)
+        response = await asyncio.wrap_future(job)
+
+    # Successful items used their nonces; a retry prepares a fresh batch and gets new signatures
+    if eoa_object.get("batch_prepared") is prepared_txs:
+        del eoa_object["batch_prepared"]
+    save_eoa_object(eoa_address, eoa_object)
+    if response["status"] == "success":
+        return respond_with_success({"results": response["results"]})
+    else:
+        return JSONResponse(content={"status": "error", "message": "Some storage transactions failed", "results": response["results"]}, status_code=400)
+
+
+# --------------------------------------------------------------------
+# 6) Transaction Status Events (Server-Sent Events)
+# --------------------------------------------------------------------
+@app.get("/api/events/{eoa_address}")
+async def transaction_events(eoa_address: str, request: Request):
+    """
+    Streams queued/submitted/mined/failed events for a wallet's transactions as SSE.
+    An idle connection is just a parked coroutine, so clients can keep it open instead of polling.
+    """
+    async def event_stream():
+        queue = tx_events.subscribe(eoa_address)
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: {}\ndata: {}\n\n".format(event["status"], json.dumps(event))
+        finally:
+            tx_events.unsubscribe(eoa_address, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --------------------------------------------------------------------
+# 7) Admission Metrics
+# --------------------------------------------------------------------
+@app.get("/api/admission/metrics")
+async def get_admission_metrics():
+    return respond_with_success({"admission": admission_metrics(), "scheduler": tx_scheduler.metrics()})
+
+
+# --------------------------------------------------------------------
+# 8) Prometheus Metrics
+# --------------------------------------------------------------------
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Latency histograms, error counters and in-flight gauges for the API endpoints and the
+    SDK stages (estimate_gas, get_chain_data, signing, send_raw_transaction, receipt wait,
+    peaq service calls) in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# --------------------------------------------------------------------
+# 9) Admin: Sampling Profiler
+# --------------------------------------------------------------------
+def is_admin(request: Request):
+    """
+    Admin endpoints are disabled unless ADMIN_TOKEN is set, and need it in X-Admin-Token.
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    given = request.headers.get("x-admin-token", "")
+    return bool(admin_token) and hmac.compare_digest(given.encode(), admin_token.encode())
+
+@app.post("/admin/profile")
+async def start_profile(request: Request, seconds: float = 30.0, interval: float = 0.01, path: str = None, requests: int = 1):
+    """
+    Starts a sampling profile of this worker: for `seconds`, or with `path` (a route
+    template such as /api/test) while the next `requests` requests to it run, `seconds`
+    being the timeout then. Download the result from GET /admin/profile/download.
+    Each uvicorn worker profiles only itself; the response says which pid answered.
+    """
+    if not is_admin(request):
+        return respond_with_error("Forbidden", 403)
+    if path is not None and path not in {route.path for route in app.router.routes}:
+        return respond_with_error("Unknown route {}".format(path), 404)
+    try:
+        state = profiler.start(seconds=seconds, interval=interval, path=path, requests=requests)
+    except RuntimeError as e:
+        return respond_with_error(str(e), 409)
+    return respond_with_success({"pid": os.getpid(), "profile": state})
+
+@app.get("/admin/profile")
+async def get_profile_status(request: Request):
+    if not is_admin(request):
+        return respond_with_error("Forbidden", 403)
+    return respond_with_success({"pid": os.getpid(), "profile": profiler.status()})
+
+@app.get("/admin/profile/download")
+async def download_profile(request: Request):
+    """
+    Collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl or speedscope.
+    """
+    if not is_admin(request):
+        return respond_with_error("Forbidden", 403)
+    if profiler.status()["status"] != "finished":
+        return respond_with_error("No finished profile on worker {}".format(os.getpid()), 409)
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": 'attachment; filename="profile-{}.collapsed"'.format(os.getpid())},
+    )
+
+
+# --------------------------------------------------------------------
+# 10) Wallet Lookup
+# --------------------------------------------------------------------
+@app.get("/api/eoa/{eoa_address}")
+async def wallet_lookup(eoa_address: str):
+    """
+    Machine address and DID state of a wallet, answered from memory or the shared eoa index.
+    """
+    from web3 import Web3
+
+    if not Web3.is_address(eoa_address):
+        return respond_with_error("Invalid eoa_address")
+    wallet = lookup_eoa(eoa_address)
+    if wallet is None:
+        return respond_with_error("No eoa_event found for this wallet.", 404)
+    return respond_with_success({"eoa_address": eoa_address, "machine_address": wallet["machine_address"], "did_registered": wallet["did_registered"]})
+
+
+# --------------------------------------------------------------------
+# 11) Storage Items
+# --------------------------------------------------------------------
+@app.get("/api/storage/{eoa_address}")
+async def storage_items(eoa_address: str, item_type: str = Query(None)):
+    """
+    How many peaq storage items a wallet's Machine Smart Account has, and whether item_type
+    is one of them, answered from the local storage index without a chain or service call.
+    """
+    from web3 import Web3
+
+    if not Web3.is_address(eoa_address):
+        return respond_with_error("Invalid eoa_address")
+    wallet = lookup_eoa(eoa_address)
+    if wallet is None:
+        return respond_with_error("No eoa_event found for this wallet.", 404)
+    service_sdk = get_service_sdk()
+    content = {
+        "eoa_address": eoa_address,
+        "machine_address": wallet["machine_address"],
+        "count": service_sdk.storage_item_count(wallet["machine_address"]),
+    }
+    if item_type is not None:
+        content["item_type"] = item_type
+        content["exists"] = service_sdk.storage_item_exists(wallet["machine_address"], item_type)
+    return respond_with_success(content)
 
 
 # Start the server with:
@@ -0,0 +1,54 @@
+import time
+
+from starlette.routing import Match
+
+from utils import metrics
+
+
+request_seconds = metrics.histogram("http_request_seconds", "Latency of API requests, until the response is fully sent.", ["path"])
+request_errors = metrics.counter("http_request_errors_total", "API requests answered with a 4xx/5xx status or that raised.", ["path"])
+requests_in_flight = metrics.gauge("http_requests_in_flight", "API requests currently being handled.", ["path"])
+responses = metrics.counter("http_responses_total", "API responses by status code.", ["path", "status"])
+
+
+class HttpMetricsMiddleware:
+    """
+    Plain ASGI middleware (no per-request task or body buffering) recording latency,
+    errors and in-flight requests per route. Requests are labelled with the route
+    template, e.g. /api/events/{eoa_address}, so wallet addresses do not become labels.
+    """
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes  # the app's live route list
+
+    def route_path(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = self.route_path(scope)
+        status = 500
+        start = time.perf_counter()
+        requests_in_flight.inc(path)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec(path)
+            request_seconds.observe(time.perf_counter() - start, path)
+            responses.inc(path, str(status))
+            if status >= 400:
+                request_errors.inc(path)
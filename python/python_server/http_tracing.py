@@ -0,0 +1,28 @@
+from utils import tracing
+
+
+class HttpTracingMiddleware:
+    """
+    Plain ASGI middleware opening the root span of every API request. Everything the
+    endpoint does (SDK calls, RPC, peaq service calls, scheduler jobs) is recorded under
+    it, and the trace id is returned in the X-Trace-Id header so a slow request can be
+    looked up in the trace file.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracing.span("{} {}".format(scope["method"], scope["path"]), tracing.SPAN_KIND_SERVER, http_method=scope["method"]) as span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http_status_code", message["status"])
+                    if span.trace_id:
+                        message.setdefault("headers", [])
+                        message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
@@ -0,0 +1,233 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from starlette.routing import Match
+
+
+logger = logging.getLogger(__name__)
+
+# Bounds that keep a profile cheap on a loaded worker whatever the admin asks for
+MAX_SECONDS = 300.0
+MIN_INTERVAL = 0.001
+MAX_DEPTH = 128
+MAX_STACKS = 20000
+
+
+def _frame_label(code):
+    # Collapsed stacks use ";" between frames, keep it out of the labels
+    filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    return "{} ({}:{})".format(code.co_name, filename, code.co_firstlineno).replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for a running worker.
+
+    A daemon thread wakes every `interval` seconds, reads the stack of every other thread
+    (sys._current_frames) and counts each distinct stack, so the cost is one stack walk
+    per thread per tick, independent of how much work the server does. The result is in
+    the collapsed stack format ("thread;outer;...;inner count" per line) that flamegraph.pl,
+    speedscope and similar tools read.
+
+    One profile runs at a time. A profile either runs for `seconds`, or (with `path`) keeps
+    samples only while a request to that route is in flight and stops after `requests` of
+    them finished or `seconds` passed. Samples are not tied to a single request, so other
+    requests handled at the same time show up too.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.state = None    # description of the running or last profile
+        self.stacks = None   # { collapsed stack: samples } of the running or last profile
+        # Route (template) filter of a running request profile
+        self.path = None
+        self._requests_left = 0
+        self._matching_in_flight = 0
+
+    def start(self, seconds=30.0, interval=0.01, path=None, requests=None):
+        """
+        Starts a profile, raising RuntimeError if one is already running.
+        """
+        seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+        interval = max(float(interval), MIN_INTERVAL)
+        with self._lock:
+            if self.running():
+                raise RuntimeError("A profile is already running")
+            self._stop.clear()
+            self.stacks = {}
+            self.path = path
+            self._requests_left = int(requests or 1) if path else 0
+            self._matching_in_flight = 0
+            self.state = {
+                "status": "running",
+                "started": time.time(),
+                "seconds": seconds,
+                "interval": interval,
+                "path": path,
+                "requests": self._requests_left if path else None,
+                "samples": 0,
+                "dropped_samples": 0,
+            }
+            self._thread = threading.Thread(target=self._run, args=(seconds, interval), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return dict(self.state)
+
+    def stop(self):
+        self._stop.set()
+        self.wait()
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        with self._lock:
+            return dict(self.state) if self.state else {"status": "idle"}
+
+    def collapsed(self):
+        """
+        Returns the collapsed stacks of the last profile, hottest first.
+        """
+        with self._lock:
+            stacks = dict(self.stacks or {})
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+    # Route filter, called by ProfilerMiddleware
+
+    def wants(self, path):
+        return self.path is not None and self._requests_left > 0 and path == self.path
+
+    def request_started(self):
+        """
+        Returns a token for request_finished, so a request outliving its profile does not
+        count against the next one.
+        """
+        with self._lock:
+            self._matching_in_flight += 1
+            return self.state
+
+    def request_finished(self, token):
+        with self._lock:
+            if token is not self.state:
+                return
+            self._matching_in_flight -= 1
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._stop.set()
+
+    # Sampling
+
+    def _run(self, seconds, interval):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                if self.path is None or self._matching_in_flight > 0:
+                    self._sample(own_ident)
+                self._stop.wait(interval)
+        finally:
+            with self._lock:
+                self.path = None
+                self.state["status"] = "finished"
+                self.state["finished"] = time.time()
+
+    def _sample(self, own_ident):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        samples = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, "thread-{}".format(ident)).replace(";", ":").replace(" ", "_"))
+            samples.append(";".join(reversed(labels)))
+        del frame
+
+        with self._lock:
+            for stack in samples:
+                if stack in self.stacks:
+                    self.stacks[stack] += 1
+                elif len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] = 1
+                else:
+                    self.state["dropped_samples"] += 1
+                    continue
+                self.state["samples"] += 1
+
+
+class ProfilerMiddleware:
+    """
+    Plain ASGI middleware telling the profiler when a request to the profiled route runs.
+    Costs one attribute check per request when no request profile is running.
+    """
+    def __init__(self, app, routes, profiler):
+        self.app = app
+        self.routes = routes
+        self.profiler = profiler
+
+    def route_path(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.profiler.path is None or not self.profiler.wants(self.route_path(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        token = self.profiler.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_finished(token)
+
+
+_profiler = SamplingProfiler()
+
+def get_profiler():
+    return _profiler
+
+
+def install_signal_handler(signum=getattr(signal, "SIGUSR2", None)):
+    """
+    `kill -USR2 <worker pid>` profiles that worker for PROFILE_SIGNAL_SECONDS (30) and writes
+    the collapsed stacks to PROFILE_OUTPUT_DIR (./python_server/logs), for when the event loop
+    is too busy to answer the admin endpoint. Does nothing outside the main thread.
+    """
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(signum, frame):
+        seconds = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+        output_dir = os.getenv("PROFILE_OUTPUT_DIR", "./python_server/logs")
+        threading.Thread(target=_profile_to_file, args=(seconds, output_dir), name="sampling-profiler-signal", daemon=True).start()
+
+    signal.signal(signum, handle)
+    return True
+
+
+def _profile_to_file(seconds, output_dir):
+    try:
+        _profiler.start(seconds=seconds)
+    except RuntimeError as e:
+        logger.warning("Profile on signal skipped: {}".format(e))
+        return
+    _profiler.wait()
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, "profile-{}-{}.collapsed".format(os.getpid(), int(time.time())))
+    with open(path, "w") as f:
+        f.write(_profiler.collapsed())
+    logger.info("Wrote profile to {}".format(path))
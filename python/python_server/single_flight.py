@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one computation.
+
+    Callers arriving while a computation is running wait on it and share its result.
+    Successful results are then kept for `ttl` seconds so quick retries (double
+    clicks, client timeouts) are answered without redoing the work.
+    """
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self._in_flight = {}  # { key: asyncio.Task }
+        self._results = {}    # { key: (expires_at, result) }
+
+    async def do(self, key, fn, cacheable=None):
+        """
+        Runs the coroutine function fn once per key. cacheable(result) decides whether
+        the result is kept for the ttl window; exceptions are never cached.
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                return cached[1]
+            del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done, cacheable))
+        # Shield so one caller going away does not cancel the work the others wait on
+        return await asyncio.shield(task)
+
+    def forget(self, key):
+        """
+        Drops the cached results of key, and of every longer key starting with it, once the
+        state they were computed from has changed.
+        """
+        for cached_key in [k for k in self._results if k[:len(key)] == key]:
+            del self._results[cached_key]
+
+    def _finish(self, key, task, cacheable):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if cacheable is not None and not cacheable(result):
+            return
+
+        now = time.monotonic()
+        if len(self._results) > 1024:
+            for stale_key in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+                del self._results[stale_key]
+        self._results[key] = (now + self.ttl, result)
@@ -0,0 +1,212 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.config import PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
+from utils import tx_events
+from python_server.admission import AdmissionRejected
+
+
+# Priority classes, lower runs first
+PRIORITY_DEPLOY = 0
+PRIORITY_DID = 1
+PRIORITY_STORAGE = 2
+PRIORITY_NAMES = {PRIORITY_DEPLOY: "deploy", PRIORITY_DID: "did", PRIORITY_STORAGE: "storage"}
+
+
+def priority_for_target(target):
+    """
+    Maps the precompile a funded transaction calls to its priority class.
+    """
+    if target == PRECOMPILE_ADDRESS_DID:
+        return PRIORITY_DID
+    if target == PRECOMPILE_ADDRESS_STORAGE:
+        return PRIORITY_STORAGE
+    raise TypeError("Target is not known")
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Takes a token, returns 0 on success or the seconds until one is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class TxScheduler:
+    """
+    Orders everything that spends the gas station owner's nonce sequence.
+
+    Jobs start strictly by priority class (deploy > DID > storage). Within a class the
+    scheduler round-robins over EOAs so one busy EOA cannot starve the others, and
+    each EOA is held to a token bucket rate cap.
+
+    `workers` dispatchers hand jobs to a pool of up to `max_in_flight` threads. A
+    dispatcher waits until its job has sent its transaction (tx_events.sent()) or
+    finished, then starts the next one, so at most `workers` jobs estimate, sign and
+    send at a time while the receipts of up to `max_in_flight` jobs are awaited.
+    Owner nonces stay in order because the sdk reserves them (_reserve_account_nonce).
+    """
+    def __init__(self, workers=4, eoa_rate=0.5, eoa_burst=5, max_in_flight=64):
+        self.eoa_rate = eoa_rate
+        self.eoa_burst = eoa_burst
+        # { priority: OrderedDict{ eoa or batch key: deque[(future, context, eoas, fn, args, kwargs)] } }
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._buckets = {}
+        self._cond = threading.Condition()
+        self._completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self._in_flight = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="tx-job")
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name="tx-scheduler-{}".format(i), daemon=True)
+            thread.start()
+
+    def submit(self, priority, eoa, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) for an EOA and returns a Future with its result.
+        Raises AdmissionRejected (429) when the EOA is over its rate cap.
+        """
+        eoa = eoa.lower()
+        future = Future()
+        with self._cond:
+            if len(self._buckets) > 10000:
+                self._prune_buckets()
+            bucket = self._buckets.get(eoa)
+            if bucket is None:
+                bucket = self._buckets[eoa] = _TokenBucket(self.eoa_rate, self.eoa_burst)
+            wait = bucket.take()
+            if wait:
+                raise AdmissionRejected("Too many transactions for {}".format(eoa), 429, max(1, round(wait)))
+            self._enqueue(priority, eoa, (eoa,), future, fn, args, kwargs)
+        tx_events.publish(eoa, "queued", kind=PRIORITY_NAMES[priority])
+        return future
+
+    def submit_batch(self, priority, eoas, fn, *args, **kwargs):
+        """
+        Queues one job acting for several EOAs, e.g. a chunk of pipelined deployments, and
+        returns a Future with its result. Each EOA gets its queued event. The per-EOA rate
+        cap does not apply, batch endpoints have their own admission limit.
+        """
+        eoas = tuple(eoa.lower() for eoa in eoas)
+        future = Future()
+        with self._cond:
+            # Round robin treats the whole chunk as one more EOA
+            self._enqueue(priority, "batch:" + eoas[0], eoas, future, fn, args, kwargs)
+        for eoa in eoas:
+            tx_events.publish(eoa, "queued", kind=PRIORITY_NAMES[priority])
+        return future
+
+    def _enqueue(self, priority, key, eoas, future, fn, args, kwargs):
+        # The job runs in the submitter's context so its spans stay in the request's trace
+        context = contextvars.copy_context()
+        self._queues[priority].setdefault(key, deque()).append((future, context, eoas, fn, args, kwargs))
+        self._cond.notify()
+
+    def metrics(self):
+        with self._cond:
+            result = {
+                PRIORITY_NAMES[priority]: {
+                    "queued": sum(len(jobs) for jobs in queue.values()),
+                    "eoas": len(queue),
+                    "completed": self._completed[priority],
+                }
+                for priority, queue in self._queues.items()
+            }
+            result["in_flight"] = self._in_flight
+            return result
+
+    def _prune_buckets(self):
+        # Buckets that refilled completely carry no state worth keeping
+        now = time.monotonic()
+        for eoa, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[eoa]
+
+    def _next_job(self):
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            # Round robin: take the head EOA's oldest job and move that EOA to the back
+            key, jobs = queue.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                queue[key] = jobs
+            return priority, job
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                next_job = self._next_job()
+                while next_job is None:
+                    self._cond.wait()
+                    next_job = self._next_job()
+
+            priority, (future, context, eoas, fn, args, kwargs) = next_job
+            if not future.set_running_or_notify_cancel():
+                continue
+            released = threading.Event()
+            with self._cond:
+                self._in_flight += 1
+            self._pool.submit(self._execute, released, priority, future, context, eoas, fn, args, kwargs)
+            # The next job starts once this one sent its transaction, not once it is mined
+            released.wait()
+
+    def _execute(self, released, priority, future, context, eoas, fn, args, kwargs):
+        def call():
+            tx_events.on_sent(released.set)
+            return fn(*args, **kwargs)
+
+        try:
+            future.set_result(context.run(call))
+        except Exception as e:
+            # Failures of a sent transaction were already published by the sdk, with its tx_hash;
+            # this covers the ones that happened before anything was sent
+            if not tx_events.failure_published(e):
+                for eoa in eoas:
+                    tx_events.publish(eoa, "failed", kind=PRIORITY_NAMES[priority], error=str(e))
+            future.set_exception(e)
+        finally:
+            released.set()
+            with self._cond:
+                self._in_flight -= 1
+                self._completed[priority] += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_tx_scheduler():
+    """
+    Returns the process wide scheduler. Workers, jobs awaiting receipts and per-EOA caps can
+    be set with TX_SCHEDULER_WORKERS, TX_SCHEDULER_MAX_IN_FLIGHT, TX_SCHEDULER_EOA_RATE (tx/s)
+    and TX_SCHEDULER_EOA_BURST.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TxScheduler(
+                workers=int(os.getenv("TX_SCHEDULER_WORKERS", 4)),
+                eoa_rate=float(os.getenv("TX_SCHEDULER_EOA_RATE", 0.5)),
+                eoa_burst=int(os.getenv("TX_SCHEDULER_EOA_BURST", 5)),
+                max_in_flight=int(os.getenv("TX_SCHEDULER_MAX_IN_FLIGHT", 64)),
+            )
+        return _scheduler
@@ -0,0 +1,9 @@
+"""
+Offline stand-in for an agung node and the get-real peaq service, for performance testing
+peaq_service_sdk and the server without network access. See simulator/__main__.py.
+"""
+from .chain import SimulatedChain, RpcError
+from .service import FakePeaqService
+from .server import Simulator, SimulatorConfig
+
+__all__ = ["SimulatedChain", "RpcError", "FakePeaqService", "Simulator", "SimulatorConfig"]
@@ -0,0 +1,62 @@
+"""
+Run the simulator from the python directory:
+    python -m simulator --port 8545 --block-time 2 --latency 0.05 --jitter 0.02 \
+        --method-latency eth_sendRawTransaction=0.3 --error-rate /v1/sign=0.05
+
+then point the server or scripts at it:
+    AGUNG_RPC_URL=http://127.0.0.1:8545/rpc PEAQ_SERVICE_URL=http://127.0.0.1:8545
+"""
+import argparse
+import time
+
+from simulator.server import Simulator, SimulatorConfig
+
+
+def key_values(pairs):
+    values = {}
+    for pair in pairs:
+        key, _, value = pair.rpartition("=")
+        if not key:
+            raise argparse.ArgumentTypeError("Expected KEY=VALUE, got {}".format(pair))
+        values[key] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated agung node and peaq service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--chain-id", type=int, default=9990)
+    parser.add_argument("--block-time", type=float, default=0.0, help="seconds between blocks, 0 mines on every send")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--method-latency", nargs="*", default=[], metavar="KEY=SECONDS",
+                        help="latency for one RPC method or service path")
+    parser.add_argument("--error-rate", nargs="*", default=[], metavar="KEY=RATE",
+                        help="probability of failing an RPC method or service path")
+    parser.add_argument("--http-error-status", type=int, default=503, help="status of injected service errors")
+    parser.add_argument("--seed", type=int, help="seed for jitter and error injection")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        chain_id=args.chain_id,
+        block_time=args.block_time,
+        latency=args.latency,
+        jitter=args.jitter,
+        method_latency=key_values(args.method_latency),
+        error_rates=key_values(args.error_rate),
+        http_error_status=args.http_error_status,
+        seed=args.seed,
+    )
+    simulator = Simulator(config, args.host, args.port).start()
+    print("Simulated RPC at {} and peaq service at {}".format(simulator.rpc_url, simulator.service_url))
+    try:
+        while True:
+            time.sleep(60)
+            print("Block {}: {}".format(simulator.chain.block_number, simulator.stats))
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import threading
+import time
+
+import rlp
+from eth_abi import encode, decode
+from eth_account import Account
+from eth_utils import keccak, to_checksum_address
+
+from utils.config import PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
+
+
+DEPLOY_SELECTOR = keccak(text="deployMachineSmartAccount(address,uint256,bytes)")[:4]
+EXECUTE_SELECTOR = keccak(text="executeTransaction(address,address,address,bytes,uint256,bytes,bytes)")[:4]
+ADD_ATTRIBUTE_SELECTOR = keccak(text="addAttribute(address,bytes,bytes,uint32)")[:4]
+READ_ATTRIBUTE_SELECTOR = keccak(text="readAttribute(address,bytes)")[:4]
+ADD_ITEM_SELECTOR = keccak(text="addItem(bytes,bytes)")[:4]
+GET_ITEM_SELECTOR = keccak(text="getItem(address,bytes)")[:4]
+
+MACHINE_DEPLOYED_TOPIC = keccak(text="MachineSmartAccountDeployed(address)")
+META_TX_EXECUTED_TOPIC = keccak(text="MetaTransactionExecuted(address,address,bytes,uint256)")
+
+# Gas the stand-in charges; close to what the real calls use on agung
+GAS_DEPLOY = 420000
+GAS_EXECUTE = 180000
+GAS_TRANSFER = 21000
+
+
+class RpcError(Exception):
+    """
+    Turned into a JSON-RPC error object by the server.
+    """
+    def __init__(self, message, code=-32000, data=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.data = data
+
+
+class SimulatedChain:
+    """
+    In-memory stand-in for an agung node, covering the JSON-RPC calls peaq_service_sdk makes.
+
+    Sent transactions wait in a mempool and are mined every block_time seconds (immediately
+    when block_time is 0). Gas station calls have the effects the SDK relies on:
+    deployMachineSmartAccount emits MachineSmartAccountDeployed, executeTransaction applies
+    addAttribute/addItem to the DID/storage precompiles, and a reused meta-tx nonce reverts.
+    """
+    def __init__(self, chain_id=9990, gas_price=10 ** 9, block_time=0.0, balance=10 ** 24):
+        self.chain_id = chain_id
+        self.gas_price = gas_price
+        self.block_time = block_time
+        self.default_balance = balance
+        self.block_number = 1
+        self._lock = threading.Lock()
+        self._nonces = {}          # { sender: next account nonce including the mempool }
+        self._mined_nonces = {}    # { sender: next account nonce in mined blocks }
+        self._balances = {}
+        self._mempool = []         # pending transactions, in arrival order
+        self._transactions = {}    # { tx hash: transaction }
+        self._receipts = {}        # { tx hash: receipt }
+        self._used_meta_nonces = set()
+        self._machines = {}        # { eoa: machine address }
+        self.attributes = {}       # { (did account, name): value }
+        self.items = {}            # { (owner, item type): item }
+        self._stop = threading.Event()
+        self._miner = None
+        if block_time > 0:
+            self._miner = threading.Thread(target=self._mine_forever, name="simulated-miner", daemon=True)
+            self._miner.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # -- JSON-RPC --
+
+    def handle(self, method, params):
+        handler = getattr(self, "rpc_" + method, None)
+        if handler is None:
+            raise RpcError("the method {} does not exist/is not available".format(method), -32601)
+        return handler(*params)
+
+    def rpc_eth_chainId(self):
+        return hex(self.chain_id)
+
+    def rpc_net_version(self):
+        return str(self.chain_id)
+
+    def rpc_eth_gasPrice(self):
+        return hex(self.gas_price)
+
+    def rpc_eth_blockNumber(self):
+        return hex(self.block_number)
+
+    def rpc_eth_getBalance(self, address, block="latest"):
+        with self._lock:
+            return hex(self._balances.get(to_checksum_address(address), self.default_balance))
+
+    def rpc_eth_getTransactionCount(self, address, block="latest"):
+        address = to_checksum_address(address)
+        with self._lock:
+            nonces = self._nonces if block == "pending" else self._mined_nonces
+            return hex(nonces.get(address, 0))
+
+    def rpc_eth_estimateGas(self, tx, block=None):
+        data = _hex_bytes(tx.get("data") or tx.get("input"))
+        with self._lock:
+            self._check_call(data)
+        return hex(self._gas_for(data))
+
+    def rpc_eth_call(self, tx, block="latest"):
+        to = to_checksum_address(tx["to"])
+        data = _hex_bytes(tx.get("data") or tx.get("input"))
+        with self._lock:
+            if to == to_checksum_address(PRECOMPILE_ADDRESS_DID) and data[:4] == READ_ATTRIBUTE_SELECTOR:
+                did_account, name = decode(['address', 'bytes'], data[4:])
+                value = self.attributes.get((to_checksum_address(did_account), name))
+                if value is None:
+                    raise RpcError("execution reverted: attribute not found", 3)
+                return "0x" + encode(['(bytes,bytes,uint32,uint256)'], [(name, value, 0, self.block_number)]).hex()
+            if to == to_checksum_address(PRECOMPILE_ADDRESS_STORAGE) and data[:4] == GET_ITEM_SELECTOR:
+                owner, item_type = decode(['address', 'bytes'], data[4:])
+                item = self.items.get((to_checksum_address(owner), item_type))
+                if item is None:
+                    raise RpcError("execution reverted: item not found", 3)
+                return "0x" + encode(['bytes'], [item]).hex()
+        return "0x"
+
+    def rpc_eth_sendRawTransaction(self, raw_transaction):
+        raw = _hex_bytes(raw_transaction)
+        tx = self._decode_transaction(raw)
+        with self._lock:
+            expected = self._nonces.get(tx["from"], self._mined_nonces.get(tx["from"], 0))
+            if tx["nonce"] < expected:
+                raise RpcError("nonce too low")
+            if tx["nonce"] > expected:
+                # A real node would park it in the queue; the SDK never leaves gaps on purpose
+                raise RpcError("nonce too high: expected {}, got {}".format(expected, tx["nonce"]))
+            if tx["hash"] in self._transactions:
+                raise RpcError("already known")
+            self._nonces[tx["from"]] = tx["nonce"] + 1
+            self._transactions[tx["hash"]] = tx
+            self._mempool.append(tx)
+            if self.block_time <= 0:
+                self._mine_block()
+        return tx["hash"]
+
+    def rpc_eth_getTransactionReceipt(self, tx_hash):
+        with self._lock:
+            return self._receipts.get(tx_hash.lower())
+
+    def rpc_eth_getTransactionByHash(self, tx_hash):
+        with self._lock:
+            tx = self._transactions.get(tx_hash.lower())
+            if tx is None:
+                return None
+            receipt = self._receipts.get(tx["hash"])
+            return {
+                "hash": tx["hash"],
+                "from": tx["from"],
+                "to": tx["to"],
+                "nonce": hex(tx["nonce"]),
+                "gas": hex(tx["gas"]),
+                "gasPrice": hex(tx["gas_price"]),
+                "input": "0x" + tx["data"].hex(),
+                "value": hex(tx["value"]),
+                "blockNumber": receipt["blockNumber"] if receipt else None,
+                "blockHash": receipt["blockHash"] if receipt else None,
+                "transactionIndex": receipt["transactionIndex"] if receipt else None,
+            }
+
+    def rpc_eth_getBlockByNumber(self, block="latest", full=False):
+        number = self.block_number if block in ("latest", "pending", "safe", "finalized") else int(block, 16)
+        return {
+            "number": hex(number),
+            "hash": _block_hash(number),
+            "parentHash": _block_hash(number - 1),
+            "timestamp": hex(int(time.time())),
+            "gasLimit": hex(30000000),
+            "gasUsed": "0x0",
+            "baseFeePerGas": hex(self.gas_price),
+            "transactions": [],
+        }
+
+    # -- Mining --
+
+    def _mine_forever(self):
+        while not self._stop.wait(self.block_time):
+            with self._lock:
+                self._mine_block()
+
+    def _mine_block(self):
+        # Caller holds self._lock
+        self.block_number += 1
+        block_hash = _block_hash(self.block_number)
+        mempool, self._mempool = self._mempool, []
+        cumulative_gas = 0
+        for index, tx in enumerate(mempool):
+            logs, status = self._apply(tx)
+            gas_used = min(tx["gas"], self._gas_for(tx["data"]))
+            cumulative_gas += gas_used
+            self._mined_nonces[tx["from"]] = tx["nonce"] + 1
+            self._balances[tx["from"]] = self._balances.get(tx["from"], self.default_balance) - gas_used * tx["gas_price"]
+            self._receipts[tx["hash"]] = {
+                "transactionHash": tx["hash"],
+                "transactionIndex": hex(index),
+                "blockHash": block_hash,
+                "blockNumber": hex(self.block_number),
+                "from": tx["from"],
+                "to": tx["to"],
+                "cumulativeGasUsed": hex(cumulative_gas),
+                "gasUsed": hex(gas_used),
+                "effectiveGasPrice": hex(tx["gas_price"]),
+                "contractAddress": None,
+                "logs": [
+                    dict(log, blockHash=block_hash, blockNumber=hex(self.block_number), transactionHash=tx["hash"],
+                         transactionIndex=hex(index), logIndex=hex(log_index), removed=False)
+                    for log_index, log in enumerate(logs)
+                ],
+                "logsBloom": "0x" + "00" * 256,
+                "status": hex(status),
+                "type": "0x0",
+            }
+
+    def _apply(self, tx):
+        """
+        Returns (logs, status) for a transaction being mined.
+        """
+        data = tx["data"]
+        try:
+            self._check_call(data)
+        except RpcError:
+            return [], 0
+
+        if data[:4] == DEPLOY_SELECTOR:
+            eoa, meta_nonce, _ = decode(['address', 'uint256', 'bytes'], data[4:])
+            eoa = to_checksum_address(eoa)
+            self._used_meta_nonces.add(meta_nonce)
+            machine_address = self._machines.get(eoa) or to_checksum_address(keccak(bytes.fromhex(eoa[2:]) + meta_nonce.to_bytes(32, "big"))[12:])
+            self._machines[eoa] = machine_address
+            return [{
+                "address": tx["to"],
+                "topics": ["0x" + MACHINE_DEPLOYED_TOPIC.hex(), "0x" + encode(['address'], [machine_address]).hex()],
+                "data": "0x",
+            }], 1
+
+        if data[:4] == EXECUTE_SELECTOR:
+            eoa, machine_address, target, call_data, meta_nonce, _, _ = decode(
+                ['address', 'address', 'address', 'bytes', 'uint256', 'bytes', 'bytes'], data[4:])
+            self._used_meta_nonces.add(meta_nonce)
+            target = to_checksum_address(target)
+            if target == to_checksum_address(PRECOMPILE_ADDRESS_DID) and call_data[:4] == ADD_ATTRIBUTE_SELECTOR:
+                did_account, name, value, _ = decode(['address', 'bytes', 'bytes', 'uint32'], call_data[4:])
+                self.attributes[(to_checksum_address(did_account), name)] = value
+            elif target == to_checksum_address(PRECOMPILE_ADDRESS_STORAGE) and call_data[:4] == ADD_ITEM_SELECTOR:
+                item_type, item = decode(['bytes', 'bytes'], call_data[4:])
+                self.items[(to_checksum_address(machine_address), item_type)] = item
+            return [{
+                "address": tx["to"],
+                "topics": ["0x" + META_TX_EXECUTED_TOPIC.hex()],
+                "data": "0x" + encode(['address', 'address', 'bytes', 'uint256'], [eoa, target, call_data, meta_nonce]).hex(),
+            }], 1
+
+        return [], 1
+
+    def _check_call(self, data):
+        # Caller holds self._lock. Mirrors the gas station's replay protection
+        if data[:4] == DEPLOY_SELECTOR:
+            _, meta_nonce, _ = decode(['address', 'uint256', 'bytes'], data[4:])
+        elif data[:4] == EXECUTE_SELECTOR:
+            meta_nonce = decode(['address', 'address', 'address', 'bytes', 'uint256', 'bytes', 'bytes'], data[4:])[4]
+        else:
+            return
+        if meta_nonce in self._used_meta_nonces:
+            raise RpcError("execution reverted: Nonce already used", 3, "0x")
+
+    def _gas_for(self, data):
+        if data[:4] == DEPLOY_SELECTOR:
+            return GAS_DEPLOY
+        if data[:4] == EXECUTE_SELECTOR:
+            return GAS_EXECUTE + 16 * len(data)
+        return GAS_TRANSFER + 16 * len(data)
+
+    def _decode_transaction(self, raw):
+        if raw[0] >= 0xc0:
+            nonce, gas_price, gas, to, value, data = rlp.decode(raw)[:6]
+        elif raw[0] == 0x02:
+            _, nonce, _, gas_price, gas, to, value, data = rlp.decode(raw[1:])[:8]
+        else:
+            raise RpcError("unsupported transaction type {}".format(raw[0]))
+        return {
+            "hash": "0x" + keccak(raw).hex(),
+            "from": Account.recover_transaction(raw),
+            "to": to_checksum_address(to) if to else None,
+            "nonce": _int(nonce),
+            "gas_price": _int(gas_price),
+            "gas": _int(gas),
+            "value": _int(value),
+            "data": bytes(data),
+        }
+
+
+def _int(value):
+    return int.from_bytes(value, "big")
+
+
+def _hex_bytes(value):
+    if not value:
+        return b""
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def _block_hash(number):
+    return "0x" + keccak(b"simulated-block" + number.to_bytes(8, "big")).hex()
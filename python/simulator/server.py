@@ -0,0 +1,162 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from simulator.chain import SimulatedChain, RpcError
+from simulator.service import FakePeaqService
+
+
+class SimulatorConfig:
+    """
+    Knobs for a simulator run.
+
+    latency/jitter are seconds added to every request; method_latency overrides latency
+    for one JSON-RPC method or service path (e.g. {"eth_sendRawTransaction": 0.3,
+    "/v1/sign": 0.15}). error_rates maps a method or path to the probability of failing
+    it: JSON-RPC calls get an error object, service calls get http_error_status.
+    """
+    def __init__(self, chain_id=9990, gas_price=10 ** 9, block_time=0.0, latency=0.0, jitter=0.0,
+                 method_latency=None, error_rates=None, http_error_status=503, retry_after=1, seed=None):
+        self.chain_id = chain_id
+        self.gas_price = gas_price
+        self.block_time = block_time
+        self.latency = latency
+        self.jitter = jitter
+        self.method_latency = dict(method_latency or {})
+        self.error_rates = dict(error_rates or {})
+        self.http_error_status = http_error_status
+        self.retry_after = retry_after
+        self.seed = seed
+
+
+class Simulator:
+    """
+    One HTTP server serving both the JSON-RPC stand-in (POST /rpc, or /) and the fake peaq
+    service (POST /v1/...). Point AGUNG_RPC_URL at rpc_url and PEAQ_SERVICE_URL at service_url.
+    """
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or SimulatorConfig()
+        self.chain = SimulatedChain(self.config.chain_id, self.config.gas_price, self.config.block_time)
+        self.service = FakePeaqService(self.chain)
+        self._random = random.Random(self.config.seed)
+        self._random_lock = threading.Lock()
+        self.stats = {}  # { method or path: [requests, injected errors] }
+        self._stats_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def rpc_url(self):
+        return self.url + "/rpc"
+
+    @property
+    def service_url(self):
+        return self.url
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.chain.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def rpc(self, request):
+        """
+        Answers one JSON-RPC request object.
+        """
+        method = request.get("method")
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        self._delay(method)
+        if self._inject_error(method):
+            response["error"] = {"code": -32000, "message": "simulated error in {}".format(method)}
+            return response
+        try:
+            response["result"] = self.chain.handle(method, request.get("params") or [])
+        except RpcError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+            if e.data is not None:
+                response["error"]["data"] = e.data
+        return response
+
+    def call_service(self, path, body):
+        """
+        Returns (status code, headers, response body) for a fake peaq service request.
+        """
+        self._delay(path)
+        if self._inject_error(path):
+            headers = {"Retry-After": str(self.config.retry_after)} if self.config.http_error_status in (429, 503) else {}
+            return self.config.http_error_status, headers, {"status": "error", "message": "simulated error in {}".format(path)}
+        status, response = self.service.handle(path, body)
+        return status, {}, response
+
+    def _delay(self, key):
+        latency = self.config.method_latency.get(key, self.config.latency)
+        if self.config.jitter:
+            with self._random_lock:
+                latency += self._random.uniform(0, self.config.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _inject_error(self, key):
+        rate = self.config.error_rates.get(key, 0.0)
+        with self._random_lock:
+            failed = rate > 0 and self._random.random() < rate
+        with self._stats_lock:
+            stats = self.stats.setdefault(key, [0, 0])
+            stats[0] += 1
+            stats[1] += failed
+        return failed
+
+
+def _handler(simulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"null")
+            except ValueError:
+                self._reply(400, {}, {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+                return
+
+            if self.path.startswith("/v1/"):
+                status, headers, response = simulator.call_service(self.path, body or {})
+                self._reply(status, headers, response)
+            elif isinstance(body, list):
+                self._reply(200, {}, [simulator.rpc(request) for request in body])
+            else:
+                self._reply(200, {}, simulator.rpc(body or {}))
+
+        def _reply(self, status, headers, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # One line per RPC call would drown everything else
+            pass
+
+    return Handler
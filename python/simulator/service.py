@@ -0,0 +1,86 @@
+import threading
+
+from eth_utils import keccak, to_checksum_address
+
+
+class FakePeaqService:
+    """
+    Stand-in for the get-real peaq service endpoints the SDK calls.
+
+    /v1/sign returns a deterministic 65 byte signature and remembers which machine address
+    an email/tag signed up with, /v1/data/store remembers the item types registered for it,
+    and the verify endpoints answer from the simulated chain's DID attributes and storage items.
+    """
+    def __init__(self, chain):
+        self.chain = chain
+        self._lock = threading.Lock()
+        self._machines = {}    # { (email, tag): machine address }
+        self._item_types = {}  # { (email, tag): [item type, ...] }
+
+    def handle(self, path, body):
+        """
+        Returns (status code, response body).
+        """
+        handler = {
+            "/v1/sign": self.sign,
+            "/v1/data/store": self.store,
+            "/v1/verify/did": self.verify_did,
+            "/v1/data/verify": self.verify_storage,
+            "/v1/data/verify-count": self.verify_storage_count,
+        }.get(path)
+        if handler is None:
+            return 404, {"status": "error", "message": "Not found"}
+        missing = [field for field in self._required(path) if not body.get(field)]
+        if missing:
+            return 400, {"status": "error", "message": "Missing {}".format(", ".join(missing))}
+        return 200, handler(body)
+
+    def sign(self, body):
+        machine_address = to_checksum_address(body["did_address"])
+        with self._lock:
+            self._machines[(body["email"], body.get("tag"))] = machine_address
+        digest = keccak(text="{}|{}|{}".format(body["email"], machine_address, body.get("tag")))
+        signature = digest + keccak(digest) + b"\x1b"
+        return {"status": "success", "data": {"signature": "0x" + signature.hex()}}
+
+    def store(self, body):
+        key = (body["email"], body.get("tag"))
+        with self._lock:
+            item_types = self._item_types.setdefault(key, [])
+            if body["item_type"] not in item_types:
+                item_types.append(body["item_type"])
+        return {"status": "success", "data": {"email": body["email"], "item_type": body["item_type"], "tag": body.get("tag")}}
+
+    def verify_did(self, body):
+        machine_address = self._machine(body)
+        verified = machine_address is not None and any(
+            did_account == machine_address for did_account, _ in list(self.chain.attributes)
+        )
+        return {"status": "success", "data": {"verified": verified}}
+
+    def verify_storage(self, body):
+        return {"status": "success", "data": {"verified": self._stored_count(body) > 0}}
+
+    def verify_storage_count(self, body):
+        count = self._stored_count(body)
+        return {"status": "success", "data": {"verified": count >= int(body.get("expected_count") or 0), "count": count}}
+
+    def _machine(self, body):
+        # The SDK sends the email in the "address" field of verify requests
+        with self._lock:
+            return self._machines.get((body["address"], body.get("tag")))
+
+    def _stored_count(self, body):
+        machine_address = self._machine(body)
+        if machine_address is None:
+            return 0
+        with self._lock:
+            item_types = list(self._item_types.get((body["address"], body.get("tag")), ()))
+        return sum(1 for item_type in item_types if (machine_address, item_type.encode("utf-8")) in self.chain.items)
+
+    def _required(self, path):
+        if path == "/v1/sign":
+            return ("email", "did_address")
+        if path == "/v1/data/store":
+            return ("email", "item_type")
+        return ("address",)
@@ -0,0 +1,47 @@
+"""
+Shared fixtures. Run from the python directory:
+    python -m pytest tests
+
+Nothing touches the network: chain and peaq service calls go to the offline simulator
+(simulator/), started on a free local port per test.
+"""
+import pytest
+
+from simulator import Simulator, SimulatorConfig
+
+
+OWNER_PRIVATE_KEY = "0x" + "11" * 32
+GAS_STATION_ADDRESS = "0x6c0CA4C0dbf7EB64cD87863110E4c93379ef897d"
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    # Process wide singletons would otherwise carry nonces, budgets and files between tests
+    from utils import sdk, gas_budget, eoa_index
+    for name in ("EOA_INDEX_PATH", "TX_JOURNAL_PATH", "GAS_BUDGET_TAG_QUOTAS", "CASSETTE_RECORD", "CASSETTE_REPLAY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(sdk, "_account_nonces", {})
+    monkeypatch.setattr(gas_budget, "_budgets", {})
+    monkeypatch.setattr(eoa_index, "_index", None)
+
+
+@pytest.fixture
+def simulator():
+    simulator = Simulator(SimulatorConfig(block_time=0.05, seed=1)).start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def sdk(simulator):
+    from utils.sdk import peaq_service_sdk
+    return peaq_service_sdk(
+        simulator.rpc_url,
+        simulator.service_url,
+        "service-key",
+        "project-key",
+        GAS_STATION_ADDRESS,
+        None,
+        OWNER_PRIVATE_KEY,
+    )
+
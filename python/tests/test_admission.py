@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from python_server.admission import AdmissionController, AdmissionRejected
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def hold(controller, started, release, order=None, label=None):
+    async with controller.admit():
+        if order is not None:
+            order.append(label)
+        started.set()
+        await release.wait()
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, asyncio.Event(), release))
+        waiter = asyncio.create_task(hold(controller, asyncio.Event(), release))
+        await asyncio.sleep(0.01)
+        assert controller.in_flight == 1 and len(controller._waiters) == 1
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.check()
+        assert rejected.value.status_code == 429
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert controller.in_flight == 0
+        assert controller.metrics()["rejected_queue_full"] == 2
+
+    run(scenario())
+
+
+def test_waiting_past_the_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, asyncio.Event(), release))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        assert rejected.value.status_code == 503
+        assert controller._waiters == []
+
+        release.set()
+        await holder
+        assert controller.in_flight == 0
+
+    run(scenario())
+
+
+def test_slots_are_handed_to_waiters_in_arrival_order():
+    async def scenario():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=8, queue_timeout=5)
+        release = asyncio.Event()
+        order = []
+        tasks = []
+        for label in range(5):
+            tasks.append(asyncio.create_task(hold(controller, asyncio.Event(), release, order, label)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        assert controller.in_flight == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2, 3, 4]
+        assert controller.in_flight == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    async def scenario():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=4, queue_timeout=5)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, asyncio.Event(), release))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(hold(controller, asyncio.Event(), release))
+        await asyncio.sleep(0.01)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller._waiters == []
+
+        release.set()
+        await holder
+        assert controller.in_flight == 0
+        async with controller.admit():
+            assert controller.in_flight == 1
+
+    run(scenario())
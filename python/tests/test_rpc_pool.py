@@ -0,0 +1,82 @@
+import time
+
+from web3 import Web3
+
+from simulator import Simulator, SimulatorConfig
+from utils.rpc_pool import RpcPoolProvider, make_rpc_provider
+
+
+# Nothing listens there, connecting fails right away
+DEAD_URL = "http://127.0.0.1:1"
+
+
+def test_fails_over_to_the_next_endpoint(simulator):
+    provider = RpcPoolProvider([DEAD_URL, simulator.rpc_url], max_consecutive_failures=1, cooldown=60, request_timeout=2)
+    w3 = Web3(provider)
+
+    for _ in range(3):
+        assert w3.eth.block_number >= 1
+
+    dead, alive = provider.stats()
+    assert not dead["healthy"]
+    assert alive["healthy"]
+    # Ejected after its first failure, the dead endpoint is not tried again
+    assert len(provider.endpoints[0].samples) == 1
+    assert len(provider.endpoints[1].samples) == 3
+
+
+def test_failed_endpoint_is_tried_last_before_it_is_ejected(simulator):
+    provider = RpcPoolProvider([DEAD_URL, simulator.rpc_url], max_consecutive_failures=3, request_timeout=2)
+    w3 = Web3(provider)
+
+    for _ in range(3):
+        assert w3.eth.block_number >= 1
+
+    assert provider.stats()[0]["healthy"]
+    assert provider.stats()[0]["latency"] == float("inf")
+    assert len(provider.endpoints[0].samples) == 1
+
+
+def test_ejected_endpoint_is_re_added_after_its_cooldown(simulator):
+    provider = RpcPoolProvider([DEAD_URL, simulator.rpc_url], max_consecutive_failures=1, cooldown=0.1, request_timeout=2)
+    w3 = Web3(provider)
+
+    w3.eth.block_number
+    assert not provider.stats()[0]["healthy"]
+    time.sleep(0.15)
+    w3.eth.block_number
+    # Tried again with a clean history, and ejected again
+    assert list(provider.endpoints[0].samples) and not provider.endpoints[0].samples[-1][1]
+
+
+def test_json_rpc_errors_do_not_eject_an_endpoint():
+    with Simulator(SimulatorConfig(error_rates={"eth_blockNumber": 1.0})) as simulator:
+        provider = RpcPoolProvider([simulator.rpc_url, simulator.url], max_consecutive_failures=1)
+        for _ in range(3):
+            response = provider.make_request("eth_blockNumber", [])
+            assert "error" in response
+        assert all(endpoint["healthy"] for endpoint in provider.stats())
+
+
+def test_sticky_methods_stay_on_the_endpoint_that_answered_them():
+    with Simulator() as first, Simulator() as second:
+        provider = RpcPoolProvider([first.rpc_url, second.rpc_url])
+        provider.make_request("eth_getTransactionCount", ["0x" + "00" * 20, "pending"])
+        sticky = provider._sticky
+        # Reads keep going to the fastest endpoint, which may make the other one look better
+        for endpoint in provider.endpoints:
+            if endpoint is not sticky:
+                endpoint.samples.append((0.0, True))
+        for _ in range(5):
+            provider.make_request("eth_getTransactionCount", ["0x" + "00" * 20, "pending"])
+            assert provider._sticky is sticky
+        requests_per_simulator = [simulator.stats["eth_getTransactionCount"][0] for simulator in (first, second) if "eth_getTransactionCount" in simulator.stats]
+        assert requests_per_simulator == [6]
+
+
+def test_make_rpc_provider_shares_one_pool_per_url_list():
+    single = make_rpc_provider("http://127.0.0.1:8545")
+    assert not isinstance(single, RpcPoolProvider)
+    pool = make_rpc_provider("http://127.0.0.1:8545, http://127.0.0.1:8546")
+    assert isinstance(pool, RpcPoolProvider)
+    assert make_rpc_provider(["http://127.0.0.1:8545", "http://127.0.0.1:8546"]) is pool
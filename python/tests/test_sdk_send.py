@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+from web3 import Web3
+
+from utils import sdk as sdk_module
+
+
+def deploy_tx(sdk, i, meta_nonce=None):
+    eoa = Web3.to_checksum_address("0x{:040x}".format(0x1000 + i))
+    return sdk.gas_station.functions.deployMachineSmartAccount(eoa, 1000 + i if meta_nonce is None else meta_nonce, b"\x00" * 65)
+
+
+def owner_nonce(simulator, sdk):
+    return int(simulator.chain.rpc_eth_getTransactionCount(sdk.owner_account.address, "pending"), 16)
+
+
+def sent_nonces(simulator):
+    return sorted(tx["nonce"] for tx in simulator.chain._transactions.values())
+
+
+def test_concurrent_sends_use_consecutive_owner_nonces(simulator, sdk):
+    # The simulator rejects nonce gaps, so every send succeeding means they reached it in order
+    receipts, errors = [], []
+
+    def send(i):
+        try:
+            receipts.append(sdk.send_transaction(deploy_tx(sdk, i)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [receipt["status"] for receipt in receipts] == [1] * 8
+    assert sent_nonces(simulator) == list(range(8))
+
+
+def test_workers_sharing_an_eoa_index_share_the_owner_nonce_counter(simulator, sdk, tmp_path, monkeypatch):
+    monkeypatch.setenv("EOA_INDEX_PATH", str(tmp_path / "eoa_index"))
+    other_worker = sdk_module.peaq_service_sdk(
+        simulator.rpc_url, simulator.service_url, "service-key", "project-key",
+        sdk.gas_station_address, None, "0x" + "11" * 32,
+    )
+    errors = []
+
+    def send(worker, i):
+        try:
+            worker.send_transaction(deploy_tx(worker, i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(worker, i)) for i, worker in enumerate([sdk, other_worker] * 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sent_nonces(simulator) == list(range(8))
+    index = sdk_module.get_eoa_index()
+    assert index.read_counter("account-" + sdk.owner_account.address) == 8
+
+
+def test_stale_nonce_counter_is_resynced_from_the_chain(simulator, sdk, monkeypatch):
+    sdk.send_transaction(deploy_tx(sdk, 0))
+    # A counter ahead of the chain (e.g. a send that never arrived) leaves a gap the node rejects
+    monkeypatch.setitem(sdk_module._account_nonces, sdk.owner_account.address, 5)
+
+    with pytest.raises(Exception, match="nonce too high"):
+        sdk.send_transaction(deploy_tx(sdk, 1))
+
+    receipt = sdk.send_transaction(deploy_tx(sdk, 1))
+    assert receipt["status"] == 1
+    assert sent_nonces(simulator) == [0, 1]
+
+
+def test_send_transactions_keeps_at_most_a_window_in_flight(simulator, sdk, monkeypatch):
+    count = sdk_module.PIPELINE_WINDOW + 8
+    state = {"sent": 0, "yielded": 0, "max_outstanding": 0}
+    sign_and_send = sdk._sign_and_send
+
+    def counting_sign_and_send(*args, **kwargs):
+        tx_hash = sign_and_send(*args, **kwargs)
+        state["sent"] += 1
+        state["max_outstanding"] = max(state["max_outstanding"], state["sent"] - state["yielded"])
+        return tx_hash
+
+    monkeypatch.setattr(sdk, "_sign_and_send", counting_sign_and_send)
+
+    indexes = []
+    for index, receipt, error in sdk.send_transactions([deploy_tx(sdk, i) for i in range(count)]):
+        assert error is None
+        assert receipt["status"] == 1
+        state["yielded"] += 1
+        indexes.append(index)
+
+    assert sorted(indexes) == list(range(count))
+    # The second window is only sent once every receipt of the first one was yielded
+    assert state["max_outstanding"] == sdk_module.PIPELINE_WINDOW
+    assert sent_nonces(simulator) == list(range(count))
+
+
+def test_send_transactions_failure_does_not_use_up_a_nonce(simulator, sdk):
+    sdk.send_transaction(deploy_tx(sdk, 0, meta_nonce=7))
+    # Reuses meta nonce 7, so gas estimation reverts before an owner nonce is reserved
+    txs = [deploy_tx(sdk, 1), deploy_tx(sdk, 2, meta_nonce=7), deploy_tx(sdk, 3)]
+
+    results = {index: (receipt, error) for index, receipt, error in sdk.send_transactions(txs)}
+
+    assert results[1][0] is None and results[1][1] is not None
+    assert results[0][1] is None and results[2][1] is None
+    assert owner_nonce(simulator, sdk) == 3
+    assert sent_nonces(simulator) == [0, 1, 2]
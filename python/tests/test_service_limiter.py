@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from utils.service_limiter import AimdLimiter, ServiceOverloaded, parse_retry_after
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def respond(status_code):
+    # A steady latency, so only the status (not timer noise) moves the limit
+    def call():
+        time.sleep(0.01)
+        return Response(status_code)
+    return call
+
+
+def test_fast_successes_raise_the_limit_additively():
+    limiter = AimdLimiter("test", initial=4, maximum=8)
+    for _ in range(8):
+        limiter.call(respond(200))
+    assert 5.5 < limiter.limit < 6.5
+
+
+def test_overload_halves_the_limit_once_per_latency():
+    limiter = AimdLimiter("test", initial=16, max_retries=0)
+    limiter.call(respond(200))
+    limiter.call(respond(503))
+    limit = limiter.limit
+    assert limit == pytest.approx(16.0625 / 2, rel=0.01)
+    # A burst of errors from the same overload only counts once
+    limiter._avg_latency = 60.0
+    limiter.call(respond(503))
+    assert limiter.limit == limit
+
+
+def test_connection_errors_count_as_overload():
+    limiter = AimdLimiter("test", initial=8)
+
+    def refuse():
+        raise requests.exceptions.ConnectionError("refused")
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        limiter.call(refuse)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_429_is_retried_after_its_retry_after():
+    limiter = AimdLimiter("test", initial=8, max_retries=2)
+    responses = [Response(429, {"Retry-After": "0.1"}), Response(200)]
+    start = time.monotonic()
+
+    response = limiter.call(responses.pop, 0)
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.1
+    assert limiter.in_flight == 0
+
+
+def test_last_retryable_response_is_returned_as_is():
+    limiter = AimdLimiter("test", initial=8, max_retries=1, retry_delay=0.01)
+    calls = []
+
+    def busy():
+        calls.append(1)
+        return Response(503)
+
+    assert limiter.call(busy).status_code == 503
+    assert len(calls) == 2
+
+
+def test_waiting_past_the_queue_timeout_raises_service_overloaded():
+    limiter = AimdLimiter("test", initial=1, queue_timeout=0.05)
+    limiter.acquire()
+    with pytest.raises(ServiceOverloaded):
+        limiter.acquire()
+    assert limiter.metrics()["queued"] == 0
+    limiter.release(None)
+    assert limiter.in_flight == 0
+
+
+def test_freed_slots_go_to_the_oldest_waiter():
+    limiter = AimdLimiter("test", initial=1, queue_timeout=5)
+    limiter.acquire()
+    order = []
+
+    def wait(label):
+        limiter.acquire()
+        order.append(label)
+        limiter.release(None)
+
+    threads = []
+    for label in range(4):
+        thread = threading.Thread(target=wait, args=(label,))
+        thread.start()
+        threads.append(thread)
+        while limiter.metrics()["queued"] < label + 1:
+            time.sleep(0.001)
+
+    limiter.release(None)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2, 3]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("3600") == 60.0
+    assert parse_retry_after("not a date") is None
+    assert parse_retry_after(None) is None
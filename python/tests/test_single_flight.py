@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from python_server.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    async def scenario():
+        single_flight = SingleFlight(ttl=10)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return "result"
+
+        results = await asyncio.gather(*(single_flight.do(("verify", "a"), compute) for _ in range(10)))
+        assert results == ["result"] * 10
+        assert len(calls) == 1
+
+        # Answered from the ttl window without computing again
+        assert await single_flight.do(("verify", "a"), compute) == "result"
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_exceptions_and_uncacheable_results_are_not_kept():
+    async def scenario():
+        single_flight = SingleFlight(ttl=10)
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            raise ValueError("boom")
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await single_flight.do("key", fail)
+        assert len(calls) == 2
+
+        async def pending():
+            calls.append(1)
+            return {"status": "pending"}
+
+        for _ in range(2):
+            await single_flight.do("other", pending, cacheable=lambda result: result["status"] != "pending")
+        assert len(calls) == 4
+
+    asyncio.run(scenario())
+
+
+def test_forget_drops_the_key_and_longer_keys():
+    async def scenario():
+        single_flight = SingleFlight(ttl=10)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return len(calls)
+
+        await single_flight.do(("machine", "a"), compute)
+        await single_flight.do(("machine", "a", "count"), compute)
+        await single_flight.do(("machine", "b"), compute)
+        single_flight.forget(("machine", "a"))
+
+        assert await single_flight.do(("machine", "a"), compute) == 4
+        assert await single_flight.do(("machine", "a", "count"), compute) == 5
+        assert await single_flight.do(("machine", "b"), compute) == 3
+
+    asyncio.run(scenario())
+
+
+def test_a_caller_going_away_does_not_cancel_the_others():
+    async def scenario():
+        single_flight = SingleFlight(ttl=10)
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(single_flight.do("key", compute))
+        second = asyncio.create_task(single_flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
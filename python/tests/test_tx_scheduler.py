@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from python_server.admission import AdmissionRejected
+from python_server.tx_scheduler import TxScheduler, PRIORITY_DEPLOY, PRIORITY_DID, PRIORITY_STORAGE
+from utils import tx_events
+
+
+TIMEOUT = 5
+
+
+def blocker(scheduler):
+    """
+    Queues a job that holds the only dispatcher until the returned event is set.
+    """
+    started, release = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        release.wait(TIMEOUT)
+
+    future = scheduler.submit_batch(PRIORITY_STORAGE, ["0xblocker"], job)
+    assert started.wait(TIMEOUT)
+    return release, future
+
+
+def test_jobs_start_by_priority_class():
+    scheduler = TxScheduler(workers=1)
+    release, blocked = blocker(scheduler)
+    order = []
+    futures = [
+        scheduler.submit(PRIORITY_STORAGE, "0xa", order.append, "storage"),
+        scheduler.submit(PRIORITY_DID, "0xa", order.append, "did"),
+        scheduler.submit(PRIORITY_DEPLOY, "0xa", order.append, "deploy"),
+    ]
+
+    release.set()
+    for future in [blocked] + futures:
+        future.result(TIMEOUT)
+    assert order == ["deploy", "did", "storage"]
+
+
+def test_eoas_of_one_class_take_turns():
+    scheduler = TxScheduler(workers=1)
+    release, blocked = blocker(scheduler)
+    order = []
+    futures = [scheduler.submit(PRIORITY_DID, "0xa", order.append, "a{}".format(i)) for i in range(3)]
+    futures.append(scheduler.submit(PRIORITY_DID, "0xb", order.append, "b0"))
+
+    release.set()
+    for future in [blocked] + futures:
+        future.result(TIMEOUT)
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_next_job_starts_once_the_transaction_is_sent():
+    scheduler = TxScheduler(workers=1)
+    receipt = threading.Event()
+
+    def send_and_wait_for_receipt():
+        tx_events.sent()
+        receipt.wait(TIMEOUT)
+        return "mined"
+
+    first = scheduler.submit(PRIORITY_DID, "0xa", send_and_wait_for_receipt)
+    # Runs while the first job still waits for its receipt
+    assert scheduler.submit(PRIORITY_DID, "0xb", lambda: "second").result(TIMEOUT) == "second"
+    assert not first.done()
+    assert scheduler.metrics()["in_flight"] == 1
+
+    receipt.set()
+    assert first.result(TIMEOUT) == "mined"
+
+
+def test_job_that_never_sends_holds_its_dispatcher():
+    scheduler = TxScheduler(workers=1)
+    release, blocked = blocker(scheduler)
+    second = scheduler.submit(PRIORITY_DEPLOY, "0xa", lambda: "second")
+
+    assert not second.done()
+    release.set()
+    assert second.result(TIMEOUT) == "second"
+
+
+def test_failed_job_sets_its_exception_and_frees_the_dispatcher():
+    scheduler = TxScheduler(workers=1)
+
+    def fail():
+        raise ValueError("estimate reverted")
+
+    with pytest.raises(ValueError):
+        scheduler.submit(PRIORITY_DID, "0xa", fail).result(TIMEOUT)
+    assert scheduler.submit(PRIORITY_DID, "0xa", lambda: "next").result(TIMEOUT) == "next"
+    assert scheduler.metrics()["did"]["completed"] == 2
+
+
+def test_eoa_over_its_rate_cap_is_rejected():
+    scheduler = TxScheduler(workers=1, eoa_rate=0.01, eoa_burst=2)
+    for _ in range(2):
+        scheduler.submit(PRIORITY_DID, "0xA", lambda: None).result(TIMEOUT)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        scheduler.submit(PRIORITY_DID, "0xa", lambda: None)
+    assert rejected.value.status_code == 429
+    # Other EOAs have buckets of their own
+    scheduler.submit(PRIORITY_DID, "0xb", lambda: None).result(TIMEOUT)
@@ -1,4 +1,14 @@
 # utils/__init__.py
-from .user_signup import user_signup
+# Resolved lazily so `from utils.config import ...` and friends do not drag in web3
+import importlib
 
-__all__ = ["user_signup"]
\ No newline at end of file
+__all__ = ["user_signup", "user_signup_many"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(".user_signup", __name__)
+        for export in __all__:
+            globals()[export] = getattr(module, export)
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,219 @@
+"""
+Offline bulk onboarding from a CSV or JSONL file of (email, eoa_address, tag) rows.
+
+Run from the python directory, with the server's EOA_INDEX_PATH in the environment:
+    python -m utils.bulk_import users.csv --checkpoint users.checkpoint
+
+or, without a shared eoa index, on a block of gas station nonces the server never uses:
+    python -m utils.bulk_import users.csv --start-nonce 1000000 --end-nonce 1100000
+
+Rows are streamed, never loaded all at once. Every deployed EOA is fsynced to the
+checkpoint file as soon as it confirms, and so is every block of reserved gas station
+nonces, so re-running the same command after a crash skips the EOAs that were already
+deployed and never reuses a nonce. With the eoa index, EOAs the server already signed up
+are skipped too, nonces come from the counter the server reserves from, and imported
+wallets are added to the index so the server knows them.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+
+from web3 import Web3
+
+from utils.eoa_index import get_eoa_index
+from utils.tx_journal import get_tx_journal
+from utils.user_signup import user_signup_many
+
+
+def read_rows(path):
+    """
+    Yields {"email", "eoa_address", "tag"} rows from a .csv (with a header line) or .jsonl file.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def load_checkpoint(path):
+    """
+    Returns (deployed, next_nonce). deployed maps lower-cased eoa_address to its success record.
+    """
+    deployed = {}
+    next_nonce = None
+    if not os.path.exists(path):
+        return deployed, next_nonce
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write
+                continue
+            if "next_nonce" in record:
+                next_nonce = record["next_nonce"]
+            elif record.get("status") == "success":
+                deployed[record["eoa_address"].lower()] = record
+    return deployed, next_nonce
+
+
+def pending_rows(rows, deployed, default_tag, index=None):
+    """
+    Drops invalid rows, duplicates within the file and EOAs that already have a Machine Smart
+    Account: deployed by an earlier run (checkpoint) or signed up by the server (eoa index).
+    """
+    seen = set()
+    for row in rows:
+        eoa_address = (row.get("eoa_address") or "").strip()
+        if not Web3.is_address(eoa_address):
+            yield {"status": "failure", "eoa_address": eoa_address, "message": "Invalid eoa_address"}
+            continue
+        key = eoa_address.lower()
+        if key in deployed or key in seen:
+            continue
+        if index is not None and (index.get(eoa_address) or {}).get("machine_address"):
+            continue
+        seen.add(key)
+        yield {"email": row.get("email"), "eoa_address": eoa_address, "tag": row.get("tag") or default_tag}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Checkpoint:
+    """
+    Append-only JSONL checkpoint. Nonce reservations and deployments are fsynced as they happen.
+    """
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def check_nonce_range(start_nonce, end_nonce):
+    """
+    Raises ValueError unless [start_nonce, end_nonce) is an explicit range above every meta-tx
+    nonce the server's journal has seen. Only needed without a shared eoa index.
+    """
+    if start_nonce is None or end_nonce is None:
+        raise ValueError("Without EOA_INDEX_PATH, --start-nonce and --end-nonce must give a range of gas station nonces the server never uses")
+    if end_nonce <= start_nonce:
+        raise ValueError("--end-nonce must be greater than --start-nonce")
+    journal = get_tx_journal()
+    if journal is not None:
+        journal.replay()
+        if journal.max_meta_nonce is not None and start_nonce <= journal.max_meta_nonce:
+            raise ValueError("--start-nonce {} overlaps nonces the server already used (up to {})".format(start_nonce, journal.max_meta_nonce))
+
+
+def bulk_import(path, checkpoint_path, start_nonce=None, end_nonce=None, batch_size=32, default_tag="TEST"):
+    """
+    Onboards every pending row of `path`. Returns (succeeded, failed) counts for this run.
+
+    Gas station nonces are reserved from the shared eoa index when EOA_INDEX_PATH is set,
+    otherwise from [start_nonce, end_nonce), which must be disjoint from the server's nonces.
+    """
+    index = get_eoa_index()
+    deployed, next_nonce = load_checkpoint(checkpoint_path)
+    if index is not None:
+        if start_nonce is not None or end_nonce is not None:
+            raise ValueError("--start-nonce/--end-nonce cannot be used with EOA_INDEX_PATH, nonces come from the shared counter")
+        if not index.read_counter("meta_nonce"):
+            raise ValueError("The shared nonce counter at EOA_INDEX_PATH is not seeded yet, start the server once first")
+    else:
+        check_nonce_range(start_nonce, end_nonce)
+        if next_nonce is None:
+            next_nonce = start_nonce
+
+    checkpoint = Checkpoint(checkpoint_path)
+    succeeded = failed = 0
+    try:
+        for batch in batched(pending_rows(read_rows(path), deployed, default_tag, index), batch_size):
+            invalid = [row for row in batch if row.get("status") == "failure"]
+            eoa_events = [row for row in batch if "status" not in row]
+            for record in invalid:
+                checkpoint.write(record)
+                failed += 1
+            if not eoa_events:
+                continue
+
+            if index is not None:
+                # The shared counter never hands these out again, to the server or a later run
+                nonces = index.reserve_counter("meta_nonce", len(eoa_events))
+            else:
+                if next_nonce + len(eoa_events) > end_nonce:
+                    raise ValueError("The nonce range ends at {}, {} more nonces are needed".format(end_nonce, len(eoa_events)))
+                # Persist the reservation before anything is signed so a crash never reuses these nonces
+                nonces = list(range(next_nonce, next_nonce + len(eoa_events)))
+                next_nonce += len(eoa_events)
+                checkpoint.write({"next_nonce": next_nonce})
+                checkpoint.sync()
+
+            events_by_address = {eoa_event["eoa_address"]: eoa_event for eoa_event in eoa_events}
+            for result in user_signup_many(eoa_events, nonces):
+                checkpoint.write(result)
+                if result["status"] == "success":
+                    # Durable before the next deployment confirms, a re-run must not deploy it twice
+                    checkpoint.sync()
+                    if index is not None:
+                        eoa_event = events_by_address[result["eoa_address"]]
+                        index.put(result["eoa_address"], result["machine_address"], profile={"email": eoa_event["email"], "tag": eoa_event["tag"]})
+                    succeeded += 1
+                else:
+                    failed += 1
+            checkpoint.sync()
+            print("Imported {} users, {} failed".format(succeeded, failed))
+    finally:
+        checkpoint.close()
+    return succeeded, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk onboard users from a CSV/JSONL file.")
+    parser.add_argument("path", help="CSV (with header) or .jsonl file of email, eoa_address, tag rows")
+    parser.add_argument("--checkpoint", help="checkpoint file, defaults to <path>.checkpoint")
+    parser.add_argument("--start-nonce", type=int,
+                        help="without EOA_INDEX_PATH: first gas station nonce to use; ignored when resuming from a checkpoint")
+    parser.add_argument("--end-nonce", type=int,
+                        help="without EOA_INDEX_PATH: end (exclusive) of the nonce range reserved for the import")
+    parser.add_argument("--batch-size", type=int, default=32, help="deployments in flight at once")
+    parser.add_argument("--tag", default="TEST", help="tag for rows without one")
+    args = parser.parse_args()
+
+    try:
+        succeeded, failed = bulk_import(
+            args.path,
+            args.checkpoint or args.path + ".checkpoint",
+            args.start_nonce,
+            args.end_nonce,
+            batch_size=args.batch_size,
+            default_tag=args.tag,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print("Done: {} users onboarded, {} failed".format(succeeded, failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Record/replay of the SDK's JSON-RPC and peaq service traffic.
+
+Recording wraps the Web3 provider and mounts a requests adapter on the SDK's http session,
+and appends every request/response pair with its start offset and duration to a gzipped
+JSON lines file. Replaying serves the pairs back without touching the network, optionally
+sleeping for each call's recorded duration so timings match the captured traffic.
+
+    cassette = Cassette.record("captures/agung.cassette")
+    cassette.attach(sdk)
+    ...
+    cassette.close()
+
+    sdk = peaq_service_sdk(...)
+    Cassette.replay("captures/agung.cassette", realtime=True).attach(sdk)
+
+The server (anything built with get_service_sdk()) records or replays when CASSETTE_RECORD
+or CASSETTE_REPLAY is set to a path, see from_env(). Request headers are never recorded,
+so API keys stay out of the file.
+
+Replay matches a request on its method and parameters (JSON-RPC) or its method, path and
+body (service), in recorded order when the same request was made several times. With
+strict=False, which is the default, an unmatched request gets the next unused response of
+the same JSON-RPC method or service path instead, so flows whose inputs differ slightly
+from the recording (a new signature, a different nonce) still replay.
+"""
+import collections
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from web3._utils.encoding import Web3JsonEncoder
+from web3.providers.base import JSONBaseProvider
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Response headers worth keeping, everything else is noise in a cassette
+KEPT_HEADERS = ("Content-Type", "Retry-After")
+
+
+class CassetteMiss(LookupError):
+    """
+    A replayed request has no recorded response.
+    """
+
+
+def _canonical(value):
+    # HexBytes/AttributeDict params encode the same way the HTTP provider sends them
+    return json.loads(json.dumps(value, cls=Web3JsonEncoder, sort_keys=True))
+
+
+def _key(kind, *parts):
+    return json.dumps([kind] + list(parts), sort_keys=True, separators=(",", ":"))
+
+
+class Cassette:
+    """
+    One recording, either being written (mode "record") or served back (mode "replay").
+    """
+    def __init__(self, path, mode, realtime=False, strict=False, speed=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError("Cassette mode must be 'record' or 'replay', not {!r}".format(mode))
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self.strict = strict
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._file = None
+        self._started = time.monotonic()
+        self._recorded = 0
+        self._exact = {}                                     # { request key: deque of interactions }
+        self._fallback = collections.defaultdict(collections.deque)  # { method or path: deque }
+        self.misses = 0
+        if mode == "record":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            self._write({"version": FORMAT_VERSION, "created": time.time()})
+        else:
+            self._load()
+
+    @classmethod
+    def record(cls, path):
+        return cls(path, "record")
+
+    @classmethod
+    def replay(cls, path, realtime=False, strict=False, speed=1.0):
+        return cls(path, "replay", realtime=realtime, strict=strict, speed=speed)
+
+    def attach(self, sdk):
+        """
+        Routes the sdk's JSON-RPC provider and peaq service session through this cassette.
+        """
+        sdk.w3.provider = CassetteProvider(self, None if self.mode == "replay" else sdk.w3.provider)
+        adapter = CassetteAdapter(self, sdk.http.get_adapter(sdk.peaq_service_url) if self.mode == "record" else None)
+        sdk.http.mount(sdk.peaq_service_url, adapter)
+        return sdk
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.mode == "record":
+            logger.info("Recorded {} interactions to {}".format(self._recorded, self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # Recording
+
+    def add(self, kind, group, key, request, response, start, duration):
+        with self._lock:
+            if self._file is None:
+                return
+            self._write({
+                "t": round(start - self._started, 6),
+                "d": round(duration, 6),
+                "k": kind,
+                "g": group,
+                "key": key,
+                "req": request,
+                "res": response,
+            })
+            self._recorded += 1
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    # Replaying
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError("Unsupported cassette version {} in {}".format(header.get("version"), self.path))
+            for line in f:
+                entry = json.loads(line)
+                entry["used"] = False
+                self._exact.setdefault(entry["key"], collections.deque()).append(entry)
+                self._fallback[entry["g"]].append(entry)
+
+    def take(self, group, key):
+        """
+        Returns the recorded interaction for a request, marking it used.
+        """
+        with self._lock:
+            entry = self._pop(self._exact.get(key))
+            if entry is None and not self.strict:
+                entry = self._pop(self._fallback.get(group))
+            if entry is None:
+                self.misses += 1
+                raise CassetteMiss("No recorded response for {}".format(key))
+            entry["used"] = True
+        if self.realtime and entry["d"] > 0:
+            time.sleep(entry["d"] / self.speed)
+        return entry
+
+    @staticmethod
+    def _pop(entries):
+        # Entries are shared by both indexes, skip the ones the other index already served
+        while entries:
+            entry = entries.popleft()
+            if not entry["used"]:
+                return entry
+        return None
+
+
+class CassetteProvider(JSONBaseProvider):
+    """
+    Web3 provider that records the calls of the provider it wraps, or replays them.
+    """
+    def __init__(self, cassette, provider=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.provider = provider
+
+    def __str__(self):
+        return "Cassette {} ({})".format(self.cassette.path, self.cassette.mode)
+
+    def make_request(self, method, params):
+        params = _canonical(params or [])
+        key = _key("rpc", method, params)
+        if self.provider is None:
+            return self.cassette.take(method, key)["res"]
+
+        start = time.monotonic()
+        response = self.provider.make_request(method, params)
+        self.cassette.add("rpc", method, key, {"method": method, "params": params}, _canonical(response), start, time.monotonic() - start)
+        return response
+
+    def make_batch_request(self, batch_requests):
+        # Recorded and replayed call by call, so a replay does not depend on how calls were batched
+        return [self.make_request(method, params) for method, params in batch_requests]
+
+    def is_connected(self, show_traceback=False):
+        return self.provider is None or self.provider.is_connected(show_traceback)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    requests transport adapter that records the responses of the adapter it wraps, or replays them.
+    """
+    def __init__(self, cassette, adapter=None):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        path = urlsplit(request.url).path
+        body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+        key = _key("http", request.method, path, body)
+        if self.adapter is None:
+            return self._response(request, self.cassette.take(path, key)["res"])
+
+        start = time.monotonic()
+        response = self.adapter.send(request, **kwargs)
+        recorded = {
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            "body": response.text,
+        }
+        self.cassette.add("http", path, key, {"method": request.method, "path": path, "body": body}, recorded, start, time.monotonic() - start)
+        return response
+
+    def _response(self, request, recorded):
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response._content = recorded["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "Recorded"
+        return response
+
+    def close(self):
+        if self.adapter is not None:
+            self.adapter.close()
+
+
+def from_env():
+    """
+    Returns a cassette for CASSETTE_RECORD=<path> or CASSETTE_REPLAY=<path>, or None.
+    CASSETTE_REALTIME=1 replays with the recorded durations, CASSETTE_STRICT=1 disables
+    the same-method fallback.
+    """
+    record_path = os.getenv("CASSETTE_RECORD")
+    replay_path = os.getenv("CASSETTE_REPLAY")
+    if record_path:
+        return Cassette.record(record_path)
+    if replay_path:
+        return Cassette.replay(
+            replay_path,
+            realtime=os.getenv("CASSETTE_REALTIME", "0") == "1",
+            strict=os.getenv("CASSETTE_STRICT", "0") == "1",
+        )
+    return None
+
+
+def summary(path):
+    """
+    Returns { "rpc eth_call" / "http /v1/sign": {"count", "mean", "max"} } for a cassette file.
+    """
+    durations = collections.defaultdict(list)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            entry = json.loads(line)
+            durations["{} {}".format(entry["k"], entry["g"])].append(entry["d"])
+    return {
+        name: {"count": len(values), "mean": sum(values) / len(values), "max": max(values)}
+        for name, values in sorted(durations.items())
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m utils.cassette <cassette file>")
+    for name, stats in summary(sys.argv[1]).items():
+        print("{:<40} {:>6} calls {:>9.1f} ms mean {:>9.1f} ms max".format(
+            name, stats["count"], stats["mean"] * 1000, stats["max"] * 1000))
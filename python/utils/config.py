@@ -0,0 +1,61 @@
+import os
+import threading
+
+
+# PRECOMPILE CONSTANTS
+# Kept here rather than in utils/sdk.py so modules that only need the addresses do not import web3
+PRECOMPILE_ADDRESS_DID='0x0000000000000000000000000000000000000800'
+PRECOMPILE_ADDRESS_STORAGE='0x0000000000000000000000000000000000000801'
+
+
+class Config:
+    """
+    Process wide settings, read from the environment (and .env) once.
+    """
+    def __init__(self, environ):
+        # One url, or several comma separated urls for an RPC pool
+        self.rpc_url = environ.get('AGUNG_RPC_URL')
+
+        self.peaq_service_url = environ.get('PEAQ_SERVICE_URL')
+        self.service_api_key = environ.get('SERVICE_API_KEY')
+        self.project_api_key = environ.get('PROJECT_API_KEY')
+
+        self.gas_station_address = environ.get('GAS_STATION_ADDRESS')
+        self.gas_station_owner_public_key = environ.get('GAS_STATION_OWNER_PUBLIC_KEY')
+        self.gas_station_owner_private_key = environ.get('GAS_STATION_OWNER_PRIVATE_KEY')
+
+        # Only used by the local examples/scripts
+        self.eoa_public_key = environ.get('EOA_PUBLIC_KEY')
+        self.eoa_private_key = environ.get('EOA_PRIVATE_KEY')
+
+    def sdk_args(self):
+        """
+        Positional arguments for peaq_service_sdk(...).
+        """
+        return (
+            self.rpc_url,
+            self.peaq_service_url,
+            self.service_api_key,
+            self.project_api_key,
+            self.gas_station_address,
+            self.gas_station_owner_public_key,
+            self.gas_station_owner_private_key,
+        )
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    """
+    Returns the process wide Config, loading .env the first time it is called.
+    """
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _config = Config(os.environ)
+    return _config
@@ -1,36 +1,24 @@
-from utils.sdk import peaq_service_sdk
+from utils.sdk import get_service_sdk
+from utils import storage_codec
+from utils import gas_budget
 from web3 import Web3, Account
 import requests
 from eth_account.messages import encode_defunct
 
 
-import os
+from utils import tracing
+from utils.config import get_config, PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
 
-from dotenv import load_dotenv
-load_dotenv()
-
-# import env keys that will need to be sent to the sdk to perform operations
-AGUNG_RPC_URL=os.getenv('AGUNG_RPC_URL')
-
-PEAQ_SERVICE_URL=os.getenv('PEAQ_SERVICE_URL')
-SERVICE_API_KEY=os.getenv('SERVICE_API_KEY')
-PROJECT_API_KEY=os.getenv('PROJECT_API_KEY')
-
-GAS_STATION_ADDRESS =os.getenv('GAS_STATION_ADDRESS')
-GAS_STATION_OWNER_PUBLIC_KEY=os.getenv('GAS_STATION_OWNER_PUBLIC_KEY')
-GAS_STATION_OWNER_PRIVATE_KEY=os.getenv('GAS_STATION_OWNER_PRIVATE_KEY')
-
-
-PRECOMPILE_ADDRESS_DID='0x0000000000000000000000000000000000000800'
-PRECOMPILE_ADDRESS_STORAGE='0x0000000000000000000000000000000000000801'
+# Settings are read from the environment (and .env) once per process
+config = get_config()
 
 # represents a user email and their externally owned account.
 USER_EMAIL='user_email@gmail.com'
 TAG='TEST'
 ITEM_TYPE='ITEM_TYPE'
 ITEM='MY_ITEM'
-EOA_PUBLIC_KEY=os.getenv('EOA_PUBLIC_KEY')
-EOA_PRIVATE_KEY=os.getenv('EOA_PRIVATE_KEY')
+EOA_PUBLIC_KEY=config.eoa_public_key
+EOA_PRIVATE_KEY=config.eoa_private_key
 
 # TODO should did name be set by user or admin/gasStation??
 DID_NAME="peaq"
@@ -42,28 +30,40 @@ def generate_eoa_data_hash(service_sdk, eoa, target, calldata, nonce):
     return message
     
 
+@tracing.traced()
 def register_did(service_sdk, eoa, did_signature):
     email_signature = service_sdk.generate_email_signature(eoa["email"], eoa["machine_address"], eoa["tag"])
     did_hash = service_sdk.create_did_hash(eoa["eoa_address"], did_signature, email_signature, eoa["machine_address"])
     did_calldata = service_sdk.create_did_calldata(DID_NAME, did_hash, eoa["machine_address"])
     return did_calldata
 
+@tracing.traced()
 def store_data_service(service_sdk, eoa, quest_data):
     response = service_sdk.store_data_key(eoa["email"], quest_data["item_type"], eoa["tag"])
     storage_calldata = service_sdk.add_storage_calldata(quest_data["item_type"], quest_data["item"])
     return storage_calldata
+
+# Registers every item type's data key in one pass and builds the addItem calldata for all items.
+# Items flagged with "encode" go through the storage codec and may expand into several chunk calldatas.
+# Returns [(item_type, calldata), ...] in send order.
+@tracing.traced()
+def store_data_service_many(service_sdk, eoa, items):
+    service_sdk.store_data_keys(eoa["email"], [item["item_type"] for item in items], eoa["tag"])
+    storage_calldata = []
+    for item in items:
+        if item.get("encode"):
+            storage_calldata.extend(service_sdk.add_encoded_storage_calldatas(item["item_type"], item["item"]))
+        else:
+            storage_calldata.append((item["item_type"], service_sdk.add_storage_calldata(item["item_type"], item["item"])))
+    return storage_calldata
     
 
+@tracing.traced(attributes=("target", "nonce"))
 def create_tx(eoa, signature, target, nonce, quest_data):
-    service_sdk = peaq_service_sdk(
-        AGUNG_RPC_URL,
-        PEAQ_SERVICE_URL, 
-        SERVICE_API_KEY, 
-        PROJECT_API_KEY, 
-        GAS_STATION_ADDRESS, 
-        GAS_STATION_OWNER_PUBLIC_KEY, 
-        GAS_STATION_OWNER_PRIVATE_KEY
-    )
+    service_sdk = get_service_sdk()
+    # So verify results cached for this user are dropped once the transaction confirms
+    service_sdk.verify_cache.remember(eoa["machine_address"], eoa["email"], eoa["tag"])
+    gas_budget.assign_tag(eoa["eoa_address"], eoa["tag"])
     
     if target == PRECOMPILE_ADDRESS_DID:
         calldata = register_did(service_sdk, eoa, signature)
@@ -73,9 +73,36 @@ def create_tx(eoa, signature, target, nonce, quest_data):
     else:
         raise TypeError("Target is not known")
     
-    # first need to register did 
-    message = generate_eoa_data_hash(service_sdk, eoa, target, calldata, nonce)
+    # Encode, hash and owner-sign once; send_tx executes the prepared transaction as-is
+    prepared = service_sdk.prepare_funded_transaction(eoa["eoa_address"], eoa["machine_address"], target, calldata, nonce)
     
-    return {"status": "success", "message": message, "calldata": calldata}
+    return {"status": "success", "message": prepared.message, "calldata": calldata, "prepared": prepared}
+
+# Batch storage version of create_tx: one message to sign per stored item/chunk, each with its own gas station nonce.
+# Use count_storage_txs to know how many nonces to reserve.
+@tracing.traced()
+def create_storage_txs(eoa, items, nonces):
+    service_sdk = get_service_sdk()
+    service_sdk.verify_cache.remember(eoa["machine_address"], eoa["email"], eoa["tag"])
+    gas_budget.assign_tag(eoa["eoa_address"], eoa["tag"])
+
+    storage_calldata = store_data_service_many(service_sdk, eoa, items)
+    if len(storage_calldata) != len(nonces):
+        raise ValueError("Expected {} nonces, got {}".format(len(storage_calldata), len(nonces)))
+    item_types = [item_type for item_type, _ in storage_calldata]
+    calldatas = [calldata for _, calldata in storage_calldata]
+    prepared_txs = [
+        service_sdk.prepare_funded_transaction(eoa["eoa_address"], eoa["machine_address"], PRECOMPILE_ADDRESS_STORAGE, calldata, nonce)
+        for calldata, nonce in zip(calldatas, nonces)
+    ]
+    messages = [prepared.message for prepared in prepared_txs]
+    return {"status": "success", "messages": messages, "calldata": calldatas, "item_types": item_types, "prepared": prepared_txs}
+
+# Number of addItem transactions a batch turns into once codec chunking is applied.
+def count_storage_txs(items):
+    return sum(
+        len(storage_codec.encode_item(item["item"], item["item_type"])) if item.get("encode") else 1
+        for item in items
+    )
         
         # uvicorn python_server.event_listener:app --reload
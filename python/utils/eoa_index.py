@@ -0,0 +1,414 @@
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from web3 import Web3
+
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EOAIDX\x00\x02"
+# magic, record size, reserved, record count, generation
+HEADER = struct.Struct("<8sIIQQ")
+# eoa, machine address, flags, padding, offset and length of the wallet's profile in `path`.profiles
+RECORD = struct.Struct("<20s20sB3xQI")
+KEY_SIZE = 20
+ZERO_ADDRESS = b"\x00" * 20
+COUNTER = struct.Struct("<Q")
+# Counter bumped whenever a publish empties the log
+LOG_GENERATION = "log-generation"
+
+# Record flags
+FLAG_DID = 0x01  # the machine's DID was registered through this server
+
+index_records = metrics.gauge("eoa_index_records", "Wallets in the last published eoa index.")
+index_publishes = metrics.counter("eoa_index_publishes_total", "eoa index versions published by this worker.")
+index_lookups = metrics.counter("eoa_index_lookups_total", "eoa index lookups, by where the wallet was found ('index', 'log' or 'miss').", ["result"])
+
+
+def _address_bytes(address):
+    # Lookups are hot, so no checksum validation, only the shape of an address
+    hex_address = address[2:] if address[:2] in ("0x", "0X") else address
+    if len(hex_address) != 40:
+        raise ValueError("Not an address: {!r}".format(address))
+    return bytes.fromhex(hex_address)
+
+
+def _merge(old, new):
+    # A later record never forgets a machine address, a flag or a profile an earlier one set
+    old_machine, old_flags, old_offset, old_length = old
+    new_machine, new_flags, new_offset, new_length = new
+    return (
+        new_machine if new_machine != ZERO_ADDRESS else old_machine,
+        old_flags | new_flags,
+        new_offset if new_length else old_offset,
+        new_length or old_length,
+    )
+
+
+class EoaIndex:
+    """
+    eoa -> machine address, DID state, email and tag, shared by every worker of the server.
+
+    The index is a file of fixed-width records sorted by the 20-byte eoa, mapped read-only
+    by every process so all workers share one copy of the pages and a lookup is a binary
+    search over memory. Workers never write it: put() appends the record to `path`.log,
+    and a single publisher (whichever process holds the flock on `path`.lock) periodically
+    merges that log into a new sorted file and swaps it in with os.replace. Readers notice
+    the new inode on their next lookup and remap. Until a record is published, lookups
+    find it in the log, so a wallet signed up by one worker is visible to all of them at once.
+
+    Emails and tags do not fit fixed-width records: they are appended once per wallet to
+    `path`.profiles, an append-only side table the records point into. Counters every
+    worker reserves from (the gas station meta-tx nonce, the owner account nonce) live in
+    `path`.<name>.counter.
+    """
+    def __init__(self, path, publish_interval=1.0):
+        self.path = path
+        self.log_path = path + ".log"
+        self.lock_path = path + ".lock"
+        self.publish_interval = publish_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._append_lock = threading.Lock()
+        self._log_fd = os.open(self.log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._profiles_fd = os.open(path + ".profiles", os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._counter_fds = {}
+        # Read under self._lock by every lookup, so opened up front rather than through _counter_fd
+        self._counter_fds[(LOG_GENERATION, "counter")] = self._log_generation_fd = os.open(
+            "{}.{}.counter".format(path, LOG_GENERATION), os.O_RDWR | os.O_CREAT, 0o644)
+        self._map = None
+        self._map_id = None
+        self._count = 0
+        self._tail = {}        # { eoa bytes: (machine bytes, flags, profile offset, profile length) } appended since the mapped version
+        self._tail_offset = 0
+        self._log_generation = None
+        self._writer_fd = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # Reading
+
+    def get(self, eoa_address):
+        """
+        Returns {"machine_address", "did_registered", "email", "tag"} for a wallet, or None when it is unknown.
+        """
+        key = _address_bytes(eoa_address)
+        with self._lock:
+            self._refresh()
+            mm, count, entry = self._map, self._count, self._tail.get(key)
+        source = "log"
+        if entry is None:
+            entry = _search(mm, count, key)
+            source = "index"
+        if entry is None:
+            index_lookups.inc("miss")
+            return None
+        index_lookups.inc(source)
+        machine, flags, profile_offset, profile_length = entry
+        profile = json.loads(os.pread(self._profiles_fd, profile_length, profile_offset)) if profile_length else {}
+        return {
+            "machine_address": Web3.to_checksum_address(machine) if machine != ZERO_ADDRESS else None,
+            "did_registered": bool(flags & FLAG_DID),
+            "email": profile.get("email"),
+            "tag": profile.get("tag"),
+        }
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._count + sum(1 for key in self._tail if _search(self._map, self._count, key) is None)
+
+    def _refresh(self):
+        # The log is read before the index is checked: a publish replaces the index before it
+        # empties the log, so a record missing from the log is always in a newer index
+        self._read_log()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        map_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if map_id == self._map_id:
+            return
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, _, count, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or record_size != RECORD.size or len(mm) < HEADER.size + count * RECORD.size:
+            mm.close()
+            logger.warning("Ignoring eoa index {}: bad header".format(self.path))
+            return
+        # The previous map is left to the garbage collector, a concurrent lookup may still hold it
+        self._map, self._map_id, self._count = mm, map_id, count
+        self._tail = {}
+        self._tail_offset = 0
+        self._read_log()
+
+    def _read_log(self):
+        # A publish empties the log in place, and it can grow back past what was read before.
+        # The size cannot tell, the log generation (bumped before and after emptying) can
+        generation = os.pread(self._log_generation_fd, COUNTER.size, 0)
+        size = os.fstat(self._log_fd).st_size
+        if generation != self._log_generation or size < self._tail_offset:
+            # Emptied by a publish that the index check right after will pick up
+            self._tail = {}
+            self._tail_offset = 0
+            self._log_generation = generation
+        size -= (size - self._tail_offset) % RECORD.size
+        if size == self._tail_offset:
+            return
+        data = os.pread(self._log_fd, size - self._tail_offset, self._tail_offset)
+        if os.pread(self._log_generation_fd, COUNTER.size, 0) != generation:
+            # Emptied while it was read, the next lookup starts over
+            return
+        for record in RECORD.iter_unpack(data):
+            eoa, entry = record[0], record[1:]
+            previous = self._tail.get(eoa) or _search(self._map, self._count, eoa)
+            self._tail[eoa] = _merge(previous, entry) if previous is not None else entry
+        self._tail_offset = size
+
+    # Writing
+
+    def put(self, eoa_address, machine_address=None, did_registered=False, profile=None):
+        """
+        Records a wallet's machine address, DID registration and/or profile ({"email", "tag"}).
+        Visible to every worker right away.
+        """
+        profile_offset = profile_length = 0
+        if profile is not None:
+            line = json.dumps(profile, separators=(",", ":")).encode("utf-8") + b"\n"
+            fcntl.flock(self._profiles_fd, fcntl.LOCK_EX)
+            try:
+                profile_offset = os.fstat(self._profiles_fd).st_size
+                os.write(self._profiles_fd, line)
+            finally:
+                fcntl.flock(self._profiles_fd, fcntl.LOCK_UN)
+            profile_length = len(line)
+        record = RECORD.pack(
+            _address_bytes(eoa_address),
+            _address_bytes(machine_address) if machine_address else ZERO_ADDRESS,
+            FLAG_DID if did_registered else 0,
+            profile_offset,
+            profile_length,
+        )
+        # flock is per open file, so threads of one process must not interleave lock/unlock
+        with self._append_lock:
+            fcntl.flock(self._log_fd, fcntl.LOCK_SH)
+            try:
+                os.write(self._log_fd, record)
+            finally:
+                fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+
+    def reserve_counter(self, name, count, floor=0):
+        """
+        Reserves `count` consecutive values, never below `floor`, from a counter shared by
+        every worker, so two workers never sign over the same nonce.
+        """
+        fd = self._counter_fd(name)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            data = os.pread(fd, COUNTER.size, 0)
+            first = max(COUNTER.unpack(data)[0] if len(data) == COUNTER.size else 0, floor)
+            os.pwrite(fd, COUNTER.pack(first + count), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return list(range(first, first + count))
+
+    def read_counter(self, name):
+        """
+        The next value a counter hands out, 0 when it was never used.
+        """
+        data = os.pread(self._counter_fd(name), COUNTER.size, 0)
+        return COUNTER.unpack(data)[0] if len(data) == COUNTER.size else 0
+
+    def reset_counter(self, name):
+        """
+        Forgets a counter, the next reservation starts at its floor again.
+        """
+        fd = self._counter_fd(name)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            os.pwrite(fd, COUNTER.pack(0), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def locked(self, name):
+        """
+        Holds an exclusive lock shared by every worker, e.g. to send transactions in nonce order.
+        Not reentrant, and independent of the counter of the same name.
+        """
+        fd = self._counter_fd(name, "lock")
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _counter_fd(self, name, suffix="counter"):
+        with self._lock:
+            fd = self._counter_fds.get((name, suffix))
+            if fd is None:
+                fd = os.open("{}.{}.{}".format(self.path, name, suffix), os.O_RDWR | os.O_CREAT, 0o644)
+                self._counter_fds[(name, suffix)] = fd
+            return fd
+
+    def start(self):
+        """
+        Starts the background thread that publishes new versions while this process is the writer.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="eoa-index-publisher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._writer_fd is not None:
+            os.close(self._writer_fd)
+            self._writer_fd = None
+
+    def publish(self):
+        """
+        Merges the log into a new version of the index. Returns False when another process is the writer.
+        """
+        if not self._is_writer():
+            return False
+        log_fd = os.open(self.log_path, os.O_RDWR)
+        try:
+            # Appends wait for the few milliseconds the merge takes
+            fcntl.flock(log_fd, fcntl.LOCK_EX)
+            size = os.fstat(log_fd).st_size
+            if size == 0 and os.path.exists(self.path):
+                return True
+            updates = {}
+            data = os.pread(log_fd, size - size % RECORD.size, 0)
+            for record in RECORD.iter_unpack(data):
+                eoa, entry = record[0], record[1:]
+                updates[eoa] = _merge(updates[eoa], entry) if eoa in updates else entry
+            count = self._write_version(updates)
+            # Only now that the new version is in place can the log be emptied
+            self.reserve_counter(LOG_GENERATION, 1)
+            os.ftruncate(log_fd, 0)
+            self.reserve_counter(LOG_GENERATION, 1)
+        finally:
+            os.close(log_fd)
+        index_publishes.inc()
+        index_records.set(count)
+        return True
+
+    def _write_version(self, updates):
+        mm, old_count, generation = None, 0, 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, record_size, _, old_count, generation = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                logger.warning("Rebuilding eoa index {} from its log: bad header".format(self.path))
+                mm.close()
+                mm, old_count = None, 0
+
+        tmp_path = "{}.tmp.{}".format(self.path, os.getpid())
+        count = old_count
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, RECORD.size, 0, 0, 0))
+            # Unchanged runs of the old version are copied as is, only updated records are re-packed
+            copied = 0
+            for eoa in sorted(updates):
+                position = _bisect(mm, old_count, eoa)
+                if position > copied:
+                    f.write(mm[HEADER.size + copied * RECORD.size:HEADER.size + position * RECORD.size])
+                entry = updates[eoa]
+                if position < old_count and _key_at(mm, position) == eoa:
+                    entry = _merge(RECORD.unpack_from(mm, HEADER.size + position * RECORD.size)[1:], entry)
+                    position += 1
+                else:
+                    count += 1
+                f.write(RECORD.pack(eoa, *entry))
+                copied = position
+            if old_count > copied:
+                f.write(mm[HEADER.size + copied * RECORD.size:HEADER.size + old_count * RECORD.size])
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, RECORD.size, 0, count, generation + 1))
+            f.flush()
+            os.fsync(f.fileno())
+        if mm is not None:
+            mm.close()
+        os.replace(tmp_path, self.path)
+        return count
+
+    def _is_writer(self):
+        if self._writer_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Held until the process exits, a dead writer's lock is taken over by the next worker that tries
+        self._writer_fd = fd
+        logger.info("Worker {} is now the eoa index writer".format(os.getpid()))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.publish_interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning("Publishing the eoa index failed: {}".format(e))
+
+
+def _key_at(mm, position):
+    offset = HEADER.size + position * RECORD.size
+    return mm[offset:offset + KEY_SIZE]
+
+
+def _bisect(mm, count, key):
+    # Index of the first record whose eoa is >= key
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if _key_at(mm, middle) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _search(mm, count, key):
+    if mm is None or not count:
+        return None
+    position = _bisect(mm, count, key)
+    if position < count and _key_at(mm, position) == key:
+        return RECORD.unpack_from(mm, HEADER.size + position * RECORD.size)[1:]
+    return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_eoa_index():
+    """
+    Returns the process wide index at EOA_INDEX_PATH, or None when it is not configured.
+    """
+    global _index
+    path = os.getenv("EOA_INDEX_PATH")
+    if not path:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = EoaIndex(path, publish_interval=float(os.getenv("EOA_INDEX_PUBLISH_SECONDS", "1")))
+        return _index
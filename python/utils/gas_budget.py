@@ -0,0 +1,305 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+from utils import metrics
+from utils.eoa_index import get_eoa_index
+
+
+logger = logging.getLogger(__name__)
+
+balance_gauge = metrics.gauge("gas_budget_balance_wei", "Last refreshed balance of the gas station contract and owner account.", ["account"])
+available_gauge = metrics.gauge("gas_budget_available_wei", "Balance left after in-flight transactions and the reserve.", ["account"])
+in_flight_gauge = metrics.gauge("gas_budget_in_flight_wei", "Expected cost of transactions sent but not yet settled.", ["account"])
+tag_spent_gauge = metrics.gauge("gas_budget_tag_spent_wei", "Spend of the current quota period, by tag.", ["tag"])
+rejections = metrics.counter("gas_budget_rejections_total", "Transactions rejected before sending, by reason.", ["reason"])
+
+# Tag every eoa's transactions are charged to, assigned when its signup/transactions are prepared.
+# Only a cache: the tag is persisted with the wallet in the eoa index (and the tx journal).
+_tags = OrderedDict()  # { eoa (lower case): tag }, least recently used first
+_tags_lock = threading.Lock()
+MAX_TAGS = 100000
+
+
+class BudgetExceeded(ValueError):
+    """
+    The gas station or a tag's quota cannot pay for another transaction.
+    """
+
+
+def assign_tag(eoa, tag):
+    if eoa:
+        with _tags_lock:
+            _tags[eoa.lower()] = tag
+            _tags.move_to_end(eoa.lower())
+            if len(_tags) > MAX_TAGS:
+                _tags.popitem(last=False)
+
+
+def tag_for(eoa):
+    """
+    Tag of an eoa, from this process or the shared eoa index. None when it is unknown,
+    which GasBudget charges to the strictest quota.
+    """
+    if not eoa:
+        return None
+    with _tags_lock:
+        tag = _tags.get(eoa.lower())
+        if tag is not None:
+            _tags.move_to_end(eoa.lower())
+            return tag
+    index = get_eoa_index()
+    if index is None:
+        return None
+    try:
+        wallet = index.get(eoa)
+    except ValueError:
+        return None
+    tag = (wallet or {}).get("tag")
+    if tag is not None:
+        assign_tag(eoa, tag)
+    return tag
+
+
+def parse_quotas(value):
+    """
+    "TEST=50,PROD=5000" (peaq per quota period) -> { "TEST": wei, "PROD": wei }.
+    """
+    quotas = {}
+    for part in (value or "").split(","):
+        if "=" in part:
+            tag, amount = part.split("=", 1)
+            quotas[tag.strip()] = Web3.to_wei(float(amount), "ether")
+    return quotas
+
+
+class Reservation:
+    __slots__ = ("tag", "owner_cost", "contract_cost", "refreshed_at")
+
+    def __init__(self, tag, owner_cost, contract_cost, refreshed_at=None):
+        self.tag = tag
+        self.owner_cost = owner_cost
+        self.contract_cost = contract_cost
+        self.refreshed_at = refreshed_at  # balances the reservation was checked against
+
+
+class GasBudget:
+    """
+    Local accounting of what the gas station contract and its owner account can still pay.
+
+    Both balances are read from the chain every `refresh_seconds` on a daemon thread.
+    Between refreshes every transaction reserves its expected cost before it is signed:
+    estimated gas * gas price from the owner, `contract_cost` from the contract. The
+    reservation counts as in flight until its receipt settles it, so concurrent sends
+    cannot overdraw a balance. A transaction that does not fit the balances (minus
+    `reserve`) or its tag's quota for the current `quota_period` raises BudgetExceeded
+    before it costs anything. Until a refresh succeeds, only quotas are enforced. A
+    transaction whose tag is unknown is held to the strictest quota.
+
+    Balances are read at a known block. A settled transaction is only subtracted from
+    them when it was mined after that block, otherwise the refresh already paid for it.
+    """
+    def __init__(self, w3, contract_address, owner_address, contract_cost, reserve=0, quotas=None,
+                 quota_period=86400.0, refresh_seconds=30.0):
+        self.w3 = w3
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.owner_address = Web3.to_checksum_address(owner_address)
+        self.contract_cost = contract_cost
+        self.reserve_balance = reserve
+        self.quotas = dict(quotas or {})
+        self.quota_period = quota_period
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self.balances = {"contract": None, "owner": None}
+        self.refreshed_at = None
+        self.refreshed_block = None        # block the balances were read at
+        self.in_flight = {"contract": 0, "owner": 0}
+        self._pending = {}                 # { tx_hash: Reservation }
+        self._tag_spent = {}               # { tag: wei spent or in flight this period }
+        self._period_started = time.monotonic()
+        self._owner_cost_avg = 0           # typical owner cost, for checks made before gas is estimated
+        self._thread = None
+
+    # Refreshing
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._run, name="gas-budget-refresh", daemon=True)
+        self.refresh()
+        self._thread.start()
+        return self
+
+    def refresh(self):
+        try:
+            block = self.w3.eth.block_number
+            contract_balance = self.w3.eth.get_balance(self.contract_address, block)
+            owner_balance = self.w3.eth.get_balance(self.owner_address, block)
+        except Exception as e:
+            logger.warning("Could not refresh gas station balances: {}".format(e))
+            return False
+        with self._lock:
+            self.balances = {"contract": contract_balance, "owner": owner_balance}
+            self.refreshed_at = time.time()
+            self.refreshed_block = block
+            self._export()
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            self.refresh()
+
+    # Accounting
+
+    def check(self, tag):
+        """
+        Raises BudgetExceeded when one more typical transaction for tag would not fit.
+        For rejecting requests before any work is queued.
+        """
+        self.start()
+        with self._lock:
+            self._check(Reservation(self._quota_tag(tag), self._owner_cost_avg, self.contract_cost))
+
+    def reserve(self, tag, owner_cost):
+        """
+        Reserves the expected cost of a transaction about to be signed, or raises BudgetExceeded.
+        """
+        self.start()
+        with self._lock:
+            reservation = Reservation(self._quota_tag(tag), owner_cost, self.contract_cost, self.refreshed_at)
+            self._check(reservation)
+            self.in_flight["owner"] += reservation.owner_cost
+            self.in_flight["contract"] += reservation.contract_cost
+            if tag is not None:
+                self._tag_spent[tag] = self._tag_spent.get(tag, 0) + reservation.owner_cost + reservation.contract_cost
+            self._export()
+        return reservation
+
+    def submitted(self, tx_hash, reservation):
+        with self._lock:
+            self._pending[tx_hash] = reservation
+
+    def release(self, reservation):
+        """
+        Gives back a reservation whose transaction was never sent.
+        """
+        with self._lock:
+            self._unreserve(reservation)
+            if reservation.tag is not None:
+                self._tag_spent[reservation.tag] = max(0, self._tag_spent.get(reservation.tag, 0) - reservation.owner_cost - reservation.contract_cost)
+            self._export()
+
+    def settled(self, tx_hash, receipt=None):
+        """
+        Moves a sent transaction's cost from in flight to spent. Without a receipt (dropped
+        or timed out) the expected cost is assumed spent until the next refresh says otherwise.
+        Balances refreshed at or after the receipt's block already include the cost.
+        """
+        with self._lock:
+            reservation = self._pending.pop(tx_hash, None)
+            if reservation is None:
+                return
+            self._unreserve(reservation)
+            owner_cost = reservation.owner_cost
+            if receipt is not None and receipt.get("gasUsed") is not None and receipt.get("effectiveGasPrice") is not None:
+                owner_cost = receipt["gasUsed"] * receipt["effectiveGasPrice"]
+                if reservation.tag is not None:
+                    # The tag was charged the estimate, correct it to what was actually paid
+                    self._tag_spent[reservation.tag] = max(0, self._tag_spent.get(reservation.tag, 0) - reservation.owner_cost + owner_cost)
+            self._owner_cost_avg = owner_cost if not self._owner_cost_avg else (self._owner_cost_avg * 9 + owner_cost) // 10
+            if receipt is not None and receipt.get("blockNumber") is not None:
+                already_paid = self.refreshed_block is not None and receipt["blockNumber"] <= self.refreshed_block
+            else:
+                # Refreshed since it was sent: whatever it cost (if anything) is in the balances
+                already_paid = self.refreshed_at != reservation.refreshed_at
+            if not already_paid:
+                if self.balances["owner"] is not None:
+                    self.balances["owner"] -= owner_cost
+                if self.balances["contract"] is not None:
+                    self.balances["contract"] -= reservation.contract_cost
+            self._export()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "balances": dict(self.balances),
+                "in_flight": dict(self.in_flight),
+                "available": {account: self._available(account) for account in self.balances},
+                "refreshed_at": self.refreshed_at,
+                "tag_spent": dict(self._tag_spent),
+                "quotas": dict(self.quotas),
+                "pending_transactions": len(self._pending),
+            }
+
+    def _check(self, reservation):
+        if time.monotonic() - self._period_started >= self.quota_period:
+            self._period_started = time.monotonic()
+            self._tag_spent.clear()
+        for account, cost in (("contract", reservation.contract_cost), ("owner", reservation.owner_cost)):
+            available = self._available(account)
+            if available is not None and available < cost:
+                rejections.inc("{}_balance".format(account))
+                raise BudgetExceeded("Gas station {} balance is exhausted ({} wei available, {} wei needed)".format(account, max(available, 0), cost))
+        quota = self.quotas.get(reservation.tag)
+        if quota is not None and self._tag_spent.get(reservation.tag, 0) + reservation.owner_cost + reservation.contract_cost > quota:
+            rejections.inc("tag_quota")
+            raise BudgetExceeded("Gas budget of tag {} is used up for this period".format(reservation.tag))
+
+    def _quota_tag(self, tag):
+        # An unknown tag must not mean an unlimited budget
+        if tag is None and self.quotas:
+            return min(self.quotas, key=self.quotas.get)
+        return tag
+
+    def _available(self, account):
+        balance = self.balances[account]
+        if balance is None:
+            return None
+        return balance - self.in_flight[account] - self.reserve_balance
+
+    def _unreserve(self, reservation):
+        self.in_flight["owner"] -= reservation.owner_cost
+        self.in_flight["contract"] -= reservation.contract_cost
+
+    def _export(self):
+        for account in ("contract", "owner"):
+            if self.balances[account] is not None:
+                balance_gauge.set(self.balances[account], account)
+                available_gauge.set(self._available(account), account)
+            in_flight_gauge.set(self.in_flight[account], account)
+        for tag, spent in self._tag_spent.items():
+            tag_spent_gauge.set(spent, tag)
+
+
+# One budget per (gas station, owner) shared by every sdk instance in the process
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+def get_gas_budget(w3, contract_address, owner_address):
+    """
+    Returns the process wide budget for a gas station, configured from GAS_BUDGET_* settings.
+    Nothing is read from the chain until it is first used.
+    """
+    key = (contract_address.lower(), owner_address.lower())
+    with _budgets_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = GasBudget(
+                w3,
+                contract_address,
+                owner_address,
+                contract_cost=Web3.to_wei(float(os.getenv("GAS_BUDGET_COST_PER_TX", "0.5")), "ether"),
+                reserve=Web3.to_wei(float(os.getenv("GAS_BUDGET_RESERVE", "0")), "ether"),
+                quotas=parse_quotas(os.getenv("GAS_BUDGET_TAG_QUOTAS")),
+                quota_period=float(os.getenv("GAS_BUDGET_QUOTA_PERIOD", "86400")),
+                refresh_seconds=float(os.getenv("GAS_BUDGET_REFRESH_SECONDS", "30")),
+            )
+            _budgets[key] = budget
+    return budget
@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+
+
+# Seconds. Covers a local signature (sub-millisecond) up to a receipt wait timing out
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = {}  # { name: metric }, in registration order
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + "}"
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.kind)]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return ["{}{} {}".format(self.name, self._label_text(labels), value) for labels, value in values]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return ["{}{} {}".format(self.name, self._label_text(labels), value) for labels, value in values]
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram. An observation is one bisect and a few additions under a lock;
+    buckets are only made cumulative when rendered.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # { labels: [bucket counts..., +Inf count, sum] }
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self):
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append("{}_bucket{} {}".format(self.name, self._label_text(labels, [("le", le)]), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, self._label_text(labels), values[-1]))
+            lines.append("{}_count{} {}".format(self.name, self._label_text(labels), cumulative))
+        return lines
+
+
+def _register(cls, name, documentation, labelnames, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError("Metric {} is already registered with a different type or labels".format(name))
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """
+    Returns the process wide counter `name`, creating it on first use.
+    """
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def render():
+    """
+    Every registered metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -- SDK stages: where the time of a signup/execute goes --
+stage_seconds = histogram("peaq_sdk_stage_seconds", "Latency of SDK stages (RPC calls, signing, peaq service calls).", ["stage"])
+stage_errors = counter("peaq_sdk_stage_errors_total", "SDK stages that raised.", ["stage"])
+stage_in_flight = gauge("peaq_sdk_stage_in_flight", "SDK stages currently running.", ["stage"])
+
+
+class _Timer:
+    __slots__ = ("histogram", "errors", "in_flight", "labels", "start")
+
+    def __init__(self, histogram, errors, in_flight, labels):
+        self.histogram = histogram
+        self.errors = errors
+        self.in_flight = in_flight
+        self.labels = labels
+
+    def __enter__(self):
+        self.in_flight.inc(*self.labels)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        self.in_flight.dec(*self.labels)
+        if exc_type is not None:
+            self.errors.inc(*self.labels)
+        return False
+
+
+def stage(name):
+    """
+    Times an SDK stage: `with metrics.stage("send_raw_transaction"): ...`.
+    Records its latency, counts it as in flight while it runs and counts it as an error if it raises.
+    """
+    return _Timer(stage_seconds, stage_errors, stage_in_flight, (name,))
+
+
+def timer(histogram, errors, in_flight, *labels):
+    """
+    stage() for any histogram/counter/gauge triple sharing the same labels.
+    """
+    return _Timer(histogram, errors, in_flight, labels)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
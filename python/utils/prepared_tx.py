@@ -0,0 +1,48 @@
+class PreparedTransaction:
+    """
+    Everything about a funded transaction that is known once its message is generated.
+
+    Built once by peaq_service_sdk.prepare_funded_transaction during message generation,
+    kept in the wallet's session and consumed as-is by the execute path, so nothing is
+    hex-decoded, packed, hashed or owner-signed a second time.
+    """
+    __slots__ = (
+        "eoa", "machine_address", "target", "nonce",
+        "calldata", "eoa_packed", "message_hash", "owner_packed", "owner_signature",
+    )
+
+    def __init__(self, eoa, machine_address, target, nonce, calldata, eoa_packed, message_hash, owner_packed, owner_signature):
+        self.eoa = eoa
+        self.machine_address = machine_address
+        self.target = target
+        self.nonce = nonce                      # gas station meta-tx nonce
+        self.calldata = calldata                # bytes
+        self.eoa_packed = eoa_packed            # encode_packed(machine_address, target, calldata, nonce)
+        self.message_hash = message_hash        # keccak(eoa_packed), what the EOA signs
+        self.owner_packed = owner_packed        # encode_packed(gas_station, eoa, target, calldata, nonce)
+        self.owner_signature = owner_signature  # bytes
+
+    @property
+    def message(self):
+        """
+        The hex message handed to the frontend for the EOA to sign.
+        """
+        return "0x" + self.message_hash.hex()
+
+    @property
+    def calldata_hex(self):
+        return self.calldata.hex()
+
+    def to_json(self):
+        return {
+            slot: value.hex() if isinstance(value, bytes) else value
+            for slot, value in ((slot, getattr(self, slot)) for slot in self.__slots__)
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        byte_fields = ("calldata", "eoa_packed", "message_hash", "owner_packed", "owner_signature")
+        return cls(**{
+            slot: bytes.fromhex(data[slot]) if slot in byte_fields else data[slot]
+            for slot in cls.__slots__
+        })
@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+
+logger = logging.getLogger(__name__)
+
+# Methods that have to agree about the owner's pending state. The nonce lookup,
+# the raw send and the receipt polling are pinned to one node so a lagging
+# replica can never hand out a stale nonce or miss a transaction we just sent.
+STICKY_METHODS = frozenset([
+    "eth_sendRawTransaction",
+    "eth_sendTransaction",
+    "eth_getTransactionCount",
+    "eth_getTransactionReceipt",
+    "eth_getTransactionByHash",
+])
+
+# Pools are shared by every sdk instance pointing at the same endpoints so the
+# latency/error history survives the per-request sdk construction.
+_pool_cache = {}
+_pool_cache_lock = threading.Lock()
+
+
+class RpcEndpoint:
+    """
+    Rolling latency and error statistics for a single JSON-RPC endpoint.
+    """
+    def __init__(self, url, window, request_timeout):
+        self.url = url
+        self.provider = Web3.HTTPProvider(
+            url,
+            request_kwargs={"timeout": request_timeout},
+            exception_retry_configuration=None,
+        )
+        self.samples = deque(maxlen=window)  # (latency_seconds, ok)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def record(self, latency, ok):
+        self.samples.append((latency, ok))
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+
+    def latency(self):
+        if not self.samples:
+            # Unmeasured nodes are tried first so every node gets a latency figure
+            return 0.0
+        ok_samples = [latency for latency, ok in self.samples if ok]
+        if not ok_samples:
+            return float("inf")
+        return sum(ok_samples) / len(ok_samples)
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def is_healthy(self, now):
+        return now >= self.ejected_until
+
+    def reset(self):
+        self.samples.clear()
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+
+class RpcPoolProvider(JSONBaseProvider):
+    """
+    Web3 provider that spreads calls over several RPC endpoints.
+
+    Reads go to the fastest healthy endpoint, writes stay on one sticky endpoint
+    and a misbehaving endpoint is ejected for `cooldown` seconds before it is
+    given another chance.
+    """
+    def __init__(self, urls, window=20, max_consecutive_failures=3, max_error_rate=0.5,
+                 min_samples=5, cooldown=30.0, request_timeout=10, **kwargs):
+        super().__init__(**kwargs)
+        if not urls:
+            raise ValueError("RpcPoolProvider needs at least one endpoint")
+        self.endpoints = [RpcEndpoint(url, window, request_timeout) for url in urls]
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._sticky = None
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "RPC pool {}".format([endpoint.url for endpoint in self.endpoints])
+
+    def make_request(self, method, params):
+        last_error = None
+        for endpoint in self._candidates(method):
+            start = time.perf_counter()
+            try:
+                response = endpoint.provider.make_request(method, params)
+            except Exception as e:
+                self._record(endpoint, time.perf_counter() - start, False)
+                logger.warning("RPC endpoint {} failed on {}: {}".format(endpoint.url, method, e))
+                last_error = e
+                continue
+            # JSON-RPC level errors (reverts, bad params) are not the node's fault
+            self._record(endpoint, time.perf_counter() - start, True)
+            if method in STICKY_METHODS:
+                self._sticky = endpoint
+            return response
+        raise last_error
+
+    def make_batch_request(self, batch_requests):
+        # A batch is only reads in this codebase, so it goes to the fastest healthy endpoint
+        last_error = None
+        for endpoint in self._candidates(None):
+            start = time.perf_counter()
+            try:
+                response = endpoint.provider.make_batch_request(batch_requests)
+            except Exception as e:
+                self._record(endpoint, time.perf_counter() - start, False)
+                logger.warning("RPC endpoint {} failed on a batch of {}: {}".format(endpoint.url, len(batch_requests), e))
+                last_error = e
+                continue
+            self._record(endpoint, time.perf_counter() - start, True)
+            return response
+        raise last_error
+
+    def stats(self):
+        """
+        Snapshot of every endpoint's health, mainly for logging and debugging.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.is_healthy(now),
+                    "latency": endpoint.latency(),
+                    "error_rate": endpoint.error_rate(),
+                    "sticky": endpoint is self._sticky,
+                }
+                for endpoint in self.endpoints
+            ]
+
+    def _candidates(self, method):
+        now = time.monotonic()
+        with self._lock:
+            for endpoint in self.endpoints:
+                if endpoint.ejected_until and endpoint.is_healthy(now):
+                    # Cooldown is over, re-add with a clean history
+                    logger.info("RPC endpoint {} re-added after cooldown".format(endpoint.url))
+                    endpoint.reset()
+
+            healthy = [e for e in self.endpoints if e.is_healthy(now)]
+            if not healthy:
+                # Everything is ejected; try the endpoint that recovers first rather than fail outright
+                healthy = sorted(self.endpoints, key=lambda e: e.ejected_until)
+            else:
+                healthy.sort(key=lambda e: e.latency())
+
+            sticky = self._sticky
+            if method in STICKY_METHODS and sticky in healthy:
+                healthy.remove(sticky)
+                healthy.insert(0, sticky)
+            return healthy
+
+    def _record(self, endpoint, latency, ok):
+        with self._lock:
+            endpoint.record(latency, ok)
+            if ok:
+                return
+            too_many_failures = endpoint.consecutive_failures >= self.max_consecutive_failures
+            too_many_errors = (
+                len(endpoint.samples) >= self.min_samples
+                and endpoint.error_rate() >= self.max_error_rate
+            )
+            if too_many_failures or too_many_errors:
+                endpoint.ejected_until = time.monotonic() + self.cooldown
+                if endpoint is self._sticky:
+                    self._sticky = None
+                logger.warning("RPC endpoint {} ejected for {}s".format(endpoint.url, self.cooldown))
+
+
+def parse_rpc_urls(rpc_url):
+    """
+    Accepts a single url, a comma separated string of urls or a list of urls.
+    """
+    if isinstance(rpc_url, str):
+        return [url.strip() for url in rpc_url.split(",") if url.strip()]
+    return list(rpc_url)
+
+
+def make_rpc_provider(rpc_url, **pool_kwargs):
+    """
+    Returns a plain HTTPProvider for one endpoint and a shared RpcPoolProvider for several.
+    """
+    urls = parse_rpc_urls(rpc_url)
+    if len(urls) == 1:
+        return Web3.HTTPProvider(urls[0])
+
+    key = tuple(urls)
+    with _pool_cache_lock:
+        provider = _pool_cache.get(key)
+        if provider is None:
+            provider = RpcPoolProvider(urls, **pool_kwargs)
+            _pool_cache[key] = provider
+    return provider
@@ -1,20 +1,37 @@
+import atexit
+import contextlib
+import contextvars
 import json
 import os
 import logging
+import threading
 import requests
-
-from did_serialization import peaq_py_proto
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.rpc_pool import make_rpc_provider
+from utils import storage_codec
+from utils.tx_journal import get_tx_journal
+from utils.prepared_tx import PreparedTransaction
+from utils import tx_events
+from utils import metrics
+from utils import tracing
+from utils.verify_cache import get_verify_cache
+from utils.service_limiter import get_service_limiter
+from utils.storage_index import get_storage_index, READ_BATCH_SIZE
+from utils.eoa_index import get_eoa_index
+from utils import gas_budget
+from utils.config import get_config, PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
 
 from web3 import Web3
+from web3.exceptions import ContractLogicError
+from web3.middleware import Web3Middleware
 from eth_abi.packed import encode_packed
 from eth_utils import keccak, to_hex
 from eth_account.messages import encode_defunct
-from eth_abi import encode
+from eth_abi import encode, decode
 
 
-# PRECOMPILE CONSTANTS
-PRECOMPILE_ADDRESS_DID='0x0000000000000000000000000000000000000800'
-PRECOMPILE_ADDRESS_STORAGE='0x0000000000000000000000000000000000000801'
 ABI_GAS_STATION='gas_station_abi'
 
 # Configure the logger to write to a file
@@ -36,21 +53,75 @@ logging.getLogger('web3.providers.HTTPProvider').setLevel(logging.WARNING)
 
 _abi_cache = {}
 
+# Next owner account nonce handed out by this process, so pipelined sends do not collide
+_account_nonces = {}
+_account_nonce_lock = threading.Lock()
+# Held from reserving an owner nonce until its transaction is sent, see _nonce_order
+_account_send_lock = threading.Lock()
+
+# How many transactions are in the mempool at once when pipelining
+PIPELINE_WINDOW = 32
+
+def _cassette():
+    # Only imported when a cassette is configured
+    from utils import cassette
+    return cassette
+
+def _peaq_py_proto():
+    # protobuf is only needed to build DID documents, keep it out of startup
+    from did_serialization import peaq_py_proto
+    return peaq_py_proto
+
+class _RpcTracingMiddleware(Web3Middleware):
+    """
+    Opens a client span around every JSON-RPC call made through the SDK's Web3 instance.
+    """
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with tracing.span("rpc {}".format(method), tracing.SPAN_KIND_CLIENT, rpc_method=method):
+                return make_request(method, params)
+        return middleware
+
+class PreflightError(ValueError):
+    """
+    A funded transaction was rejected locally, before any gas was spent.
+    """
+
+
+# Every public method (and the send path) runs in a span tagged with the eoa/target it works on
+@tracing.trace_methods(
+    attributes=("eoa", ("eoa_address", "eoa"), "machine_address", "target", "nonce", "tx_hash", "item_type"),
+    include=("_get_chain_data", "_sign_and_send", "_wait_for_receipt", "_simulate"),
+)
 class peaq_service_sdk:
     def __init__(self, rpc_url, peaq_service_url, service_api_key, project_api_key, gas_station_address, gas_station_public, gas_station_private):
         """
         Initializes the SDK class, encapsulating GetRealService and GasStation functionalities.
+        rpc_url can be a single url or a comma separated list/list of urls to use an RPC pool.
         """
         # Set class vars
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+        self.w3 = Web3(make_rpc_provider(rpc_url))
+        self.w3.middleware_onion.add(_RpcTracingMiddleware, "tracing")
         self.peaq_service_url = peaq_service_url
         self.service_api_key = service_api_key
         self.project_api_key = project_api_key
         self.gas_station_address = gas_station_address
         self.gas_station_public = gas_station_public
+        # Shared by every sdk instance so receipt watchers can invalidate what verify cached
+        self.verify_cache = get_verify_cache()
+        # Storage items we wrote or read back, for local exists/count checks
+        self.storage_index = get_storage_index()
+        # Adaptive limit on concurrent peaq service calls, shared per service url
+        self.service_limiter = get_service_limiter(peaq_service_url)
+        # One keep-alive session for every peaq service call (utils/cassette.py mounts on it),
+        # with a connection per call the limiter may let through
+        self.http = requests.Session()
+        self.http.mount(peaq_service_url or "https://", HTTPAdapter(pool_maxsize=self.service_limiter.maximum))
         
         # Create a wallet to perform transactions
         self.owner_account = self.w3.eth.account.from_key(gas_station_private)
+        # What the gas station and its owner can still pay for, see utils/gas_budget.py
+        self.gas_budget = gas_budget.get_gas_budget(self.w3, gas_station_address, self.owner_account.address)
         
         # Create an instance of the gas station contract to perform operation
         gas_station_abi = self._load_abi(ABI_GAS_STATION)
@@ -89,8 +160,35 @@ class peaq_service_sdk:
         )
 
         receipt = self.send_transaction(deploy_tx)
+        return self._machine_address_from_receipt(receipt)
+
+    def generate_owner_deploy_signatures(self, eoas, nonces):
+        """
+        Generates the owner deploy signatures for a batch of EOAs, one gas station nonce each.
+        """
+        return [self.generate_owner_deploy_signature(eoa, nonce) for eoa, nonce in zip(eoas, nonces)]
+
+    def deploy_machine_smart_accounts(self, eoas, nonces, signatures):
+        """
+        Deploys a batch of Machine Smart Accounts with pipelined transactions.
+        Yields (eoa, machine_address, error) as each deployment confirms.
+        """
+        deploy_txs = [
+            self.gas_station.functions.deployMachineSmartAccount(eoa, nonce, bytes.fromhex(signature))
+            for eoa, nonce, signature in zip(eoas, nonces, signatures)
+        ]
+        for index, receipt, error in self.send_transactions(deploy_txs):
+            if error is None:
+                try:
+                    yield eoas[index], self._machine_address_from_receipt(receipt), None
+                except ValueError as e:
+                    yield eoas[index], None, e
+            else:
+                yield eoas[index], None, error
+
+    def _machine_address_from_receipt(self, receipt):
         event_signature = keccak(text="MachineSmartAccountDeployed(address)").hex()
-        
+
         for log in receipt["logs"]:
             if log["topics"][0].hex() == event_signature and len(log["topics"]) > 1:
                 machine_address = Web3.to_checksum_address(log["topics"][1].hex()[24:])
@@ -117,8 +215,9 @@ class peaq_service_sdk:
                 "P-APIKEY": self.project_api_key
             }
 
-            response = requests.post(f"{self.peaq_service_url}/v1/sign", json=data, headers=headers)
-            response.raise_for_status()
+            with metrics.stage("service_sign"), tracing.span("POST /v1/sign", tracing.SPAN_KIND_CLIENT, machine_address=machine_address):
+                response = self._post_service(f"{self.peaq_service_url}/v1/sign", json=data, headers=headers)
+                response.raise_for_status()
             email_signature = response.json()["data"]["signature"]
             logger.debug("Data sent to service endpoint: ".format(repr(data)))
             logger.debug("Returned email signature for get-real service: ".format(repr(email_signature)))
@@ -146,8 +245,9 @@ class peaq_service_sdk:
                 "P-APIKEY": self.project_api_key
             }
 
-            response = requests.post(f"{self.peaq_service_url}/v1/data/store", json=data, headers=headers)
-            response.raise_for_status()
+            with metrics.stage("service_data_store"), tracing.span("POST /v1/data/store", tracing.SPAN_KIND_CLIENT, item_type=item_type):
+                response = self._post_service(f"{self.peaq_service_url}/v1/data/store", json=data, headers=headers)
+                response.raise_for_status()
             logger.debug("Data sent to service endpoint: ".format(repr(data)))
             logger.debug("Returned response object after storing data key: ".format(repr(response.json())))
 
@@ -156,9 +256,47 @@ class peaq_service_sdk:
         except requests.exceptions.RequestException as e:
             print("Error storing data key:", e)
             raise
-        
-        
+
+    def store_data_keys(self, email, item_types, tag):
+        """
+        Stores the data keys for several item types of one user.
+        The service takes one item type per request, so each distinct item type is
+        registered once and the requests share a keep-alive session and run concurrently.
+        Returns { item_type: response }.
+        """
+        unique_item_types = list(dict.fromkeys(item_types))
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "APIKEY": self.service_api_key,
+            "P-APIKEY": self.project_api_key
+        }
+
+        def store(item_type):
+            data = {
+                "email": email,
+                "item_type": item_type,
+                "tag": tag
+            }
+            with metrics.stage("service_data_store"), tracing.span("POST /v1/data/store", tracing.SPAN_KIND_CLIENT, item_type=item_type):
+                response = self._post_service(f"{self.peaq_service_url}/v1/data/store", json=data, headers=headers)
+                response.raise_for_status()
+            logger.debug("Data sent to service endpoint: {}".format(repr(data)))
+            return response.json()
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(8, len(unique_item_types) or 1)) as pool:
+                # Each request runs in a copy of the caller's context so its span joins the caller's trace
+                context = contextvars.copy_context()
+                responses = pool.map(lambda item_type: context.copy().run(store, item_type), unique_item_types)
+                return dict(zip(unique_item_types, responses))
+
+        except requests.exceptions.RequestException as e:
+            print("Error storing data keys:", e)
+            raise
+
     def create_id_to_sign(self, smart_accoout_address):
+        peaq_py_proto = _peaq_py_proto()
         doc = peaq_py_proto.Document()
         doc.id = f"did:peaq:{smart_accoout_address}"
         return doc.id
@@ -168,6 +306,7 @@ class peaq_service_sdk:
         Creates a DID hash from an email signature using protobuf serialization.
         """
         # print("test")
+        peaq_py_proto = _peaq_py_proto()
         doc = peaq_py_proto.Document()
         doc.id = f"did:peaq:{machine_address}"
         doc.controller = f"did:peaq:{machine_address}"
@@ -229,7 +368,8 @@ class peaq_service_sdk:
         logger.debug("Name of item type being stored: ".format(repr(item_type)))
         logger.debug("Name of item being stored: ".format(repr(item)))
         item_type = item_type.encode("utf-8").hex()
-        item = item.encode("utf-8").hex()
+        # item can already be bytes when it went through the storage codec
+        item = item.hex() if isinstance(item, bytes) else item.encode("utf-8").hex()
         # Create the encoded parameters to create calldata
         encoded_params = encode(
             ['bytes', 'bytes'],
@@ -240,98 +380,487 @@ class peaq_service_sdk:
         logger.debug("peaq storage calldata: ".format(repr(calldata)))
         return calldata
     
+    def add_encoded_storage_calldatas(self, item_type, item, **codec_options):
+        """
+        Opt-in codec version of add_storage_calldata. Large items are compressed and split
+        across several item keys, see utils/storage_codec.py. Returns [(item_type, calldata), ...].
+        """
+        return [
+            (chunk_item_type, self.add_storage_calldata(chunk_item_type, payload))
+            for chunk_item_type, payload in storage_codec.encode_item(item, item_type, **codec_options)
+        ]
+
+    def read_storage_item(self, address, item_type):
+        """
+        Reads the raw bytes of a peaq storage item through the storage precompile.
+        """
+        get_item_selector = self.w3.keccak(text="getItem(address,bytes)")[:4]
+        calldata = get_item_selector + encode(['address', 'bytes'], [Web3.to_checksum_address(address), item_type.encode("utf-8")])
+        result = self.w3.eth.call({'to': PRECOMPILE_ADDRESS_STORAGE, 'data': calldata})
+        return decode(['bytes'], result)[0]
+
+    def read_encoded_storage_item(self, address, item_type):
+        """
+        Reads an item written with add_encoded_storage_calldatas, reassembling and decompressing it.
+        """
+        return storage_codec.decode_item(item_type, lambda key: self.read_storage_item(address, key))
+
+    def storage_item_exists(self, machine_address, item_type):
+        """
+        Whether the local storage index knows item_type for machine_address (no RPC call).
+        """
+        return self.storage_index.exists(machine_address, item_type)
+
+    def storage_item_count(self, machine_address):
+        """
+        Number of items the local storage index knows for machine_address (no RPC call).
+        """
+        return self.storage_index.count(machine_address)
+
+    def backfill_storage_index(self, machine_address, item_types, source="backfill"):
+        """
+        Reads item_types of machine_address from the storage precompile in JSON-RPC batches
+        and adds the existing ones to the local index (dropping the missing ones).
+        Returns (added, removed).
+        """
+        found = {}
+        item_types = list(item_types)
+        for start in range(0, len(item_types), READ_BATCH_SIZE):
+            found.update(self._storage_items_exist(machine_address, item_types[start:start + READ_BATCH_SIZE]))
+        return self.storage_index.apply(machine_address, found, source)
+
+    def _storage_items_exist(self, machine_address, item_types):
+        # One batch of getItem calls straight to the provider; a reverted call means the item is missing
+        get_item_selector = self.w3.keccak(text="getItem(address,bytes)")[:4]
+        owner = Web3.to_checksum_address(machine_address)
+        calls = [
+            ("eth_call", [{"to": PRECOMPILE_ADDRESS_STORAGE, "data": to_hex(get_item_selector + encode(['address', 'bytes'], [owner, item_type.encode("utf-8")]))}, "latest"])
+            for item_type in item_types
+        ]
+        with metrics.stage("storage_index_read"), tracing.span("rpc batch getItem", tracing.SPAN_KIND_CLIENT, machine_address=machine_address, items=len(calls)):
+            try:
+                responses = self.w3.provider.make_batch_request(calls)
+            except NotImplementedError:
+                responses = [self.w3.provider.make_request(method, params) for method, params in calls]
+        if not isinstance(responses, list):
+            raise ValueError("Batch getItem failed: {}".format(responses.get("error")))
+        found = {}
+        for item_type, response in zip(item_types, responses):
+            if "error" in response and "revert" not in str(response["error"].get("message", "")):
+                # A node failure says nothing about the item, leave it as it is
+                continue
+            found[item_type] = "error" not in response
+        return found
+
+    def add_storage_calldatas(self, items):
+        """
+        Creates the addItem calldata for a list of (item_type, item) pairs.
+        """
+        return [self.add_storage_calldata(item_type, item) for item_type, item in items]
+
     def generate_eoa_signature(self, machine_address, target, data, nonce):
         """
         Generates an EOA signature for a transaction. Needs the externally a
         """
-        
-        packed = encode_packed(
+        message_hash = keccak(self._eoa_packed(machine_address, target, bytes.fromhex(data), nonce))
+        message_hash_hex = "0x" + message_hash.hex()
+        return message_hash_hex
+    
+    def generate_owner_signature(self, eoa, target, data, nonce):
+        """
+        Generates an owner signature for a transaction.
+        """
+        packed = self._owner_packed(eoa, target, bytes.fromhex(data), nonce)
+        owner_signature = self._sign_owner_hash(keccak(packed)).hex()
+        logger.debug("Gas Station Owner Signature used for sending a funded tx: {}".format(repr(owner_signature)))
+        return owner_signature
+
+    def prepare_funded_transaction(self, eoa, machine_address, target, data, nonce):
+        """
+        Does all the encoding, hashing and owner signing for a funded transaction once, at
+        message generation. The returned PreparedTransaction's message goes to the EOA to sign
+        and the object itself is handed to execute_prepared_transaction later.
+        """
+        calldata = data if isinstance(data, bytes) else bytes.fromhex(data)
+        eoa_packed = self._eoa_packed(machine_address, target, calldata, nonce)
+        owner_packed = self._owner_packed(eoa, target, calldata, nonce)
+        owner_signature = self._sign_owner_hash(keccak(owner_packed))
+        return PreparedTransaction(
+            eoa=eoa,
+            machine_address=machine_address,
+            target=target,
+            nonce=nonce,
+            calldata=calldata,
+            eoa_packed=eoa_packed,
+            message_hash=keccak(eoa_packed),
+            owner_packed=owner_packed,
+            owner_signature=owner_signature,
+        )
+
+    def execute_funded_transaction(self, eoa, machine_address, target, data, nonce, signature, eoa_signature):
+        """
+        Executes a transaction using the executeTransaction() function in the Gas Station contract.
+        Runs the preflight checks first, so a bad request raises PreflightError without spending gas.
+        """
+        tx, estimated_gas = self.preflight_funded_transaction(eoa, machine_address, target, data, nonce, signature, eoa_signature)
+        return self.send_transaction(tx, estimated_gas=estimated_gas)
+
+    def execute_prepared_transaction(self, prepared, eoa_signature):
+        """
+        execute_funded_transaction for a PreparedTransaction, reusing its calldata, hash and owner signature.
+        """
+        tracing.set_attribute("eoa", prepared.eoa)
+        tracing.set_attribute("target", prepared.target)
+        self.check_prepared_signature(prepared, eoa_signature)
+        tx = self._execute_transaction_call(
+            prepared.eoa, prepared.machine_address, prepared.target, prepared.calldata,
+            prepared.nonce, prepared.owner_signature, self._signature_bytes(eoa_signature)
+        )
+        return self.send_transaction(tx, estimated_gas=self._simulate(tx))
+
+    def execute_prepared_transactions(self, prepared_txs, eoa_signatures):
+        """
+        Executes several PreparedTransactions through the pipelined send path.
+        Every EOA signature is checked locally first; any mismatch raises PreflightError before
+        anything is sent. Yields (index, receipt, error) as each one confirms.
+        """
+        txs = []
+        for prepared, eoa_signature in zip(prepared_txs, eoa_signatures):
+            self.check_prepared_signature(prepared, eoa_signature)
+            txs.append(self._execute_transaction_call(
+                prepared.eoa, prepared.machine_address, prepared.target, prepared.calldata,
+                prepared.nonce, prepared.owner_signature, self._signature_bytes(eoa_signature)
+            ))
+        # send_transactions simulates each call with estimate_gas and reuses it as the gas limit
+        return self.send_transactions(txs)
+
+    def recover_eoa_signer(self, machine_address, target, data, nonce, eoa_signature):
+        """
+        Recovers the address that signed the message returned by generate_eoa_signature.
+        """
+        message_hash = keccak(self._eoa_packed(machine_address, target, bytes.fromhex(data), nonce))
+        return self._recover_signer(message_hash, eoa_signature)
+
+    def check_eoa_signature(self, eoa, machine_address, target, data, nonce, eoa_signature):
+        """
+        Raises PreflightError unless eoa_signature was made by eoa over this exact call and nonce.
+        """
+        message_hash = keccak(self._eoa_packed(machine_address, target, bytes.fromhex(data), nonce))
+        self._check_signer(eoa, message_hash, eoa_signature)
+
+    def check_prepared_signature(self, prepared, eoa_signature):
+        """
+        check_eoa_signature against the hash already held by a PreparedTransaction.
+        """
+        self._check_signer(prepared.eoa, prepared.message_hash, eoa_signature)
+
+    def preflight_funded_transaction(self, eoa, machine_address, target, data, nonce, signature, eoa_signature):
+        """
+        Local checks before a funded transaction spends gas: the EOA signature is recovered and
+        compared with eoa, then the call is simulated. The simulation's gas estimate is returned
+        with the contract call so it can be reused as the gas limit: (tx, estimated_gas).
+        """
+        self.check_eoa_signature(eoa, machine_address, target, data, nonce, eoa_signature)
+        tx = self._execute_transaction_call(
+            eoa, machine_address, target, bytes.fromhex(data),
+            nonce, bytes.fromhex(signature), self._signature_bytes(eoa_signature)
+        )
+        return tx, self._simulate(tx)
+
+    def execute_funded_transactions(self, eoa, machine_address, target, datas, nonces, signatures, eoa_signatures):
+        """
+        Executes several funded transactions for one machine account through the pipelined send path.
+        Every EOA signature is checked locally first; any mismatch raises PreflightError before
+        anything is sent. Yields (index, receipt, error) as each one confirms.
+        """
+        txs = []
+        for data, nonce, signature, eoa_signature in zip(datas, nonces, signatures, eoa_signatures):
+            self.check_eoa_signature(eoa, machine_address, target, data, nonce, eoa_signature)
+            txs.append(self._execute_transaction_call(
+                eoa, machine_address, target, bytes.fromhex(data),
+                nonce, bytes.fromhex(signature), self._signature_bytes(eoa_signature)
+            ))
+        # send_transactions simulates each call with estimate_gas and reuses it as the gas limit
+        return self.send_transactions(txs)
+
+    def _eoa_packed(self, machine_address, target, calldata, nonce):
+        return encode_packed(
             ['address', 'address', 'bytes', 'uint256'],
             [
                 machine_address,
                 target,
-                bytes.fromhex(data),
+                calldata,
                 nonce
             ]
         )
 
-        message_hash = keccak(packed)
-        message_hash_hex = "0x" + message_hash.hex()
-        return message_hash_hex
-
-        logger.debug("Externally Owner Account signature: {}".format(repr(eoa_signature)))
-        # return eoa_signature
-    
-    def generate_owner_signature(self, eoa, target, data, nonce):
-        """
-        Generates an owner signature for a transaction.
-        """
-        packed = encode_packed(
+    def _owner_packed(self, eoa, target, calldata, nonce):
+        return encode_packed(
             ['address', 'address', 'address', 'bytes', 'uint256'],
             [
                 self.gas_station_address,
                 eoa,
                 target,
-                bytes.fromhex(data),
+                calldata,
                 nonce
             ]
         )
 
-        message_hash = keccak(packed)
+    def _sign_owner_hash(self, message_hash):
         message = encode_defunct(primitive=message_hash)
-        owner_signature = self.owner_account.sign_message(message).signature.hex()
-        logger.debug("Gas Station Owner Signature used for sending a funded tx: {}".format(repr(owner_signature)))
-        return owner_signature
+        return bytes(self.owner_account.sign_message(message).signature)
 
-    def execute_funded_transaction(self, eoa, machine_address, target, data, nonce, signature, eoa_signature):
-        """
-        Executes a transaction using the executeTransaction() function in the Gas Station contract.
-        """
-        if eoa_signature.startswith("0x"):
-            new = eoa_signature[2:]  # Remove the "0x" prefix
-        tx = self.gas_station.functions.executeTransaction(
+    def _recover_signer(self, message_hash, eoa_signature):
+        message = encode_defunct(primitive=message_hash)
+        return self.w3.eth.account.recover_message(message, signature=eoa_signature)
+
+    def _check_signer(self, eoa, message_hash, eoa_signature):
+        try:
+            signer = self._recover_signer(message_hash, eoa_signature)
+        except Exception as e:
+            raise PreflightError("EOA signature is malformed: {}".format(e))
+        if signer.lower() != eoa.lower():
+            # Also what a stale meta-tx nonce looks like: the message hash no longer matches
+            raise PreflightError("EOA signature does not match {} (wrong signature or stale nonce)".format(eoa))
+
+    def _simulate(self, tx):
+        try:
+            with metrics.stage("estimate_gas"):
+                estimated_gas = tx.estimate_gas({'from': Web3.to_checksum_address(self.owner_account.address)})
+        except ContractLogicError as e:
+            raise PreflightError("Transaction would revert: {}".format(e))
+        logger.debug("Preflight passed, estimated gas: {}".format(estimated_gas))
+        return estimated_gas
+
+    def _signature_bytes(self, signature):
+        if signature.startswith("0x"):
+            signature = signature[2:]  # Remove the "0x" prefix
+        return bytes.fromhex(signature)
+
+    def _execute_transaction_call(self, eoa, machine_address, target, calldata, nonce, signature, eoa_signature):
+        return self.gas_station.functions.executeTransaction(
             Web3.to_checksum_address(eoa),
             Web3.to_checksum_address(machine_address),
             target,
-            bytes.fromhex(data),
+            calldata,
             nonce,
-            bytes.fromhex(signature),
-            bytes.fromhex(new)
+            signature,
+            eoa_signature
         )
 
-        return self.send_transaction(tx)
-
     # Calls the smart contract to perform the transaction
-    def send_transaction(self, tx):
+    def send_transaction(self, tx, estimated_gas=None):
         """
         Builds, signs, and sends a transaction to the peaq/agung network.
+        estimated_gas can be passed in when a preflight simulation already estimated it.
         """
-        # print("before", self.owner_account.address)
         checksum_address = Web3.to_checksum_address(self.owner_account.address)
-        # print("after", self.owner_account.address)
-        estimated_gas = tx.estimate_gas({'from': checksum_address})
+        if estimated_gas is None:
+            with metrics.stage("estimate_gas"):
+                estimated_gas = tx.estimate_gas({'from': checksum_address})
         logger.debug("Estimated Gas: {}".format(estimated_gas))
         chain_data = self._get_chain_data(self.owner_account, checksum_address)
+        reservation = self._reserve_budget(tx, estimated_gas, chain_data["gas_price"])
+        with self._nonce_order(checksum_address):
+            try:
+                chain_data["nonce"] = self._reserve_account_nonce(checksum_address)
+            except Exception:
+                self.gas_budget.release(reservation)
+                raise
+            logger.debug("Account Nonce: {}".format(chain_data["nonce"]))
+
+            tx_hash = self._sign_and_send(tx, estimated_gas, chain_data, reservation)
+        receipt = self._wait_for_receipt(tx_hash, tx_meta=self._tx_meta(tx))
+        logger.debug("Transaction receipt: {}".format(receipt))
+        return receipt
+
+    def send_transactions(self, txs):
+        """
+        Pipelined version of send_transaction for a batch of contract calls.
+
+        Up to PIPELINE_WINDOW transactions are signed with consecutive owner nonces and
+        sent before any receipt is awaited. Yields (index, receipt, error) in
+        confirmation order; a call that fails gas estimation, its gas budget or sending is yielded
+        with its error and does not use up a nonce.
+        """
+        checksum_address = Web3.to_checksum_address(self.owner_account.address)
+        with metrics.stage("get_chain_data"):
+            chain_id = self.w3.eth.chain_id
+            gas_price = self.w3.eth.gas_price
+
+        with ThreadPoolExecutor(max_workers=PIPELINE_WINDOW) as receipt_pool:
+            for start in range(0, len(txs), PIPELINE_WINDOW):
+                pending = {}
+                for index in range(start, min(start + PIPELINE_WINDOW, len(txs))):
+                    tx = txs[index]
+                    try:
+                        with metrics.stage("estimate_gas"):
+                            estimated_gas = tx.estimate_gas({'from': checksum_address})
+                        reservation = self._reserve_budget(tx, estimated_gas, gas_price)
+                    except Exception as e:
+                        yield index, None, e
+                        continue
+                    try:
+                        with self._nonce_order(checksum_address):
+                            try:
+                                chain_data = {
+                                    "chain_id": chain_id,
+                                    "gas_price": gas_price,
+                                    "nonce": self._reserve_account_nonce(checksum_address),
+                                }
+                            except Exception:
+                                self.gas_budget.release(reservation)
+                                raise
+                            tx_hash = self._sign_and_send(tx, estimated_gas, chain_data, reservation)
+                    except Exception as e:
+                        yield index, None, e
+                        continue
+                    context = contextvars.copy_context()
+                    pending[receipt_pool.submit(context.run, self._wait_for_receipt, tx_hash, tx_meta=self._tx_meta(tx))] = index
+
+                for future in as_completed(pending):
+                    try:
+                        yield pending[future], future.result(), None
+                    except Exception as e:
+                        yield pending[future], None, e
+
+    def recover_transactions(self, on_settled=None, timeout=120):
+        """
+        Re-attaches receipt watchers to the transactions the journal still has in flight
+        after a restart, instead of resending them. on_settled(record, receipt) is called
+        from the watcher thread once each one settles (receipt is None when it was dropped).
+        Returns the in-flight journal records.
+        """
+        journal = get_tx_journal()
+        if journal is None:
+            return []
+        pending, _ = journal.replay()
 
-        tx = tx.build_transaction({
-            'nonce': chain_data["nonce"],
-            'gas': estimated_gas,
-            'gasPrice': chain_data["gas_price"],
-            'chainId': chain_data["chain_id"]
-        })
-        logger.debug("Transaction to Send: {}".format(tx))
-
-        signed_tx = self.owner_account.sign_transaction(tx)
-        tx_receipt = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        tx_hash = self.w3.to_hex(tx_receipt)
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        logger.debug("Transaction receipt: {}".format(tx))
+        checksum_address = Web3.to_checksum_address(self.owner_account.address)
+        if pending:
+            # Never hand out a nonce that an in-flight transaction may still use
+            with _account_nonce_lock:
+                highest = max(record["account_nonce"] for record in pending)
+                _account_nonces[checksum_address] = max(_account_nonces.get(checksum_address, 0), highest + 1)
+            index = get_eoa_index()
+            if index is not None:
+                index.reserve_counter("account-" + checksum_address, 0, floor=highest + 1)
+
+        def watch(record):
+            try:
+                receipt = self._wait_for_receipt(record["tx_hash"], timeout=timeout, tx_meta=record)
+            except Exception as e:
+                logger.warning("Journaled transaction {} was dropped: {}".format(record["tx_hash"], e))
+                journal.settled(record["tx_hash"], "dropped")
+                tx_events.publish(record.get("eoa"), "failed", tx_hash=record["tx_hash"], kind=record.get("kind"), error="dropped")
+                receipt = None
+            if on_settled is not None:
+                on_settled(record, receipt)
+
+        for record in pending:
+            logger.debug("Re-attaching receipt watcher to {}".format(record["tx_hash"]))
+            threading.Thread(target=watch, args=(record,), daemon=True).start()
+        return pending
+
+    def _wait_for_receipt(self, tx_hash, timeout=120, tx_meta=None):
+        tx_meta = tx_meta or {}
+        try:
+            with metrics.stage("wait_for_receipt"):
+                receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+        except Exception as e:
+            self.gas_budget.settled(tx_hash)
+            tx_events.publish_failure(tx_meta.get("eoa"), e, tx_hash=tx_hash, kind=tx_meta.get("kind"))
+            raise
+        self.gas_budget.settled(tx_hash, receipt)
+        status = "mined" if receipt.get("status") == 1 else "failed"
+        if status == "mined" and tx_meta.get("kind") == "execute" and tx_meta.get("target") in (PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE):
+            # A new DID attribute or storage item changes what verify answers for this machine
+            self.verify_cache.invalidate_machine(tx_meta.get("machine_address"))
+            if tx_meta.get("item_type") is not None:
+                self.storage_index.add(tx_meta["machine_address"], tx_meta["item_type"])
+        journal = get_tx_journal()
+        if journal is not None:
+            journal.settled(tx_hash, status)
+        tx_events.publish(tx_meta.get("eoa"), status, tx_hash=tx_hash, kind=tx_meta.get("kind"), block_number=receipt.get("blockNumber"))
         return receipt
+
+    def _storage_item_type(self, calldata):
+        # Item type of an addItem(bytes,bytes) calldata, None for any other call and for the
+        # continuation chunks of an encoded item (item_type:N), which are not items of their own
+        if isinstance(calldata, str):
+            calldata = bytes.fromhex(calldata[2:] if calldata.startswith("0x") else calldata)
+        if calldata[:4] != self.w3.keccak(text="addItem(bytes,bytes)")[:4]:
+            return None
+        item_type, payload = decode(['bytes', 'bytes'], calldata[4:])
+        if storage_codec.chunk_index(payload) > 0:
+            return None
+        return item_type.decode("utf-8", "replace")
+
+    def _tx_meta(self, contract_function):
+        # What recovery and status events need to know about a transaction besides its hash and nonce
+        args = contract_function.args
+        if contract_function.fn_name == "deployMachineSmartAccount":
+            return {"kind": "deploy", "eoa": args[0], "meta_nonce": args[1]}
+        if contract_function.fn_name == "executeTransaction":
+            tx_meta = {"kind": "execute", "eoa": args[0], "machine_address": args[1], "target": args[2], "meta_nonce": args[4]}
+            if args[2] == PRECOMPILE_ADDRESS_STORAGE:
+                tx_meta["item_type"] = self._storage_item_type(args[3])
+            return tx_meta
+        return {"kind": contract_function.fn_name}
+
+    def _reserve_budget(self, tx, estimated_gas, gas_price):
+        # Called before an owner nonce is reserved, so a rejected transaction leaves no nonce gap
+        try:
+            return self.gas_budget.reserve(gas_budget.tag_for(self._tx_meta(tx).get("eoa")), estimated_gas * gas_price)
+        except gas_budget.BudgetExceeded as e:
+            raise PreflightError(str(e)) from e
+
+    def _sign_and_send(self, tx, estimated_gas, chain_data, reservation):
+        tx_meta = self._tx_meta(tx)
+        try:
+            tx = tx.build_transaction({
+                'nonce': chain_data["nonce"],
+                'gas': estimated_gas,
+                'gasPrice': chain_data["gas_price"],
+                'chainId': chain_data["chain_id"]
+            })
+            logger.debug("Transaction to Send: {}".format(tx))
+
+            with metrics.stage("sign_transaction"):
+                signed_tx = self.owner_account.sign_transaction(tx)
+        except Exception:
+            self.gas_budget.release(reservation)
+            raise
+        tx_hash = self.w3.to_hex(signed_tx.hash)
+        tracing.set_attribute("tx_hash", tx_hash)
+        tracing.set_attribute("eoa", tx_meta.get("eoa"))
+        tracing.set_attribute("target", tx_meta.get("target"))
+        journal = get_tx_journal()
+        if journal is not None:
+            # Write ahead: the journal knows about the transaction before the network does
+            journal.submitted(tx_hash, chain_data["nonce"], **tx_meta)
+        try:
+            with metrics.stage("send_raw_transaction"):
+                self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        except Exception as e:
+            self.gas_budget.release(reservation)
+            if journal is not None:
+                journal.settled(tx_hash, "failed", error=str(e))
+            tx_events.publish_failure(tx_meta.get("eoa"), e, tx_hash=tx_hash, kind=tx_meta["kind"])
+            # The nonce was not used; resync from the chain on the next reservation
+            self._release_account_nonces(self.owner_account.address)
+            raise
+        self.gas_budget.submitted(tx_hash, reservation)
+        tx_events.publish(tx_meta.get("eoa"), "submitted", tx_hash=tx_hash, kind=tx_meta["kind"], target=tx_meta.get("target"))
+        # The owner nonce is used up in order now, the scheduler can start the next job
+        tx_events.sent()
+        return tx_hash
     
     
     def verify(self, endpoint, data):
         """
         Generic function to send verification requests.
+        Results are cached per request, see utils/verify_cache.py.
         """
         headers = {
             "Content-Type": "application/json",
@@ -340,9 +869,13 @@ class peaq_service_sdk:
             "P-APIKEY": self.project_api_key
         }
 
-        response = requests.post(f"{self.peaq_service_url}/{endpoint}", json=data, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        def fetch():
+            with metrics.stage("service_verify"), tracing.span("POST /{}".format(endpoint), tracing.SPAN_KIND_CLIENT):
+                response = self._post_service(f"{self.peaq_service_url}/{endpoint}", json=data, headers=headers)
+                response.raise_for_status()
+            return response.json()
+
+        return self.verify_cache.get(endpoint, data, fetch)
 
     def verify_did(self, email, tag):
         """
@@ -383,30 +916,74 @@ class peaq_service_sdk:
         return eoa_signature
 
     def _deserialize_did(self, data):
-        deserialized_doc = peaq_py_proto.Document()
+        deserialized_doc = _peaq_py_proto().Document()
         deserialized_doc.ParseFromString(data)  # ParseFromString modifies deserialized_doc in place
         return deserialized_doc
     
     def _get_chain_data(self, from_account, checksum_address):
-        chain_id = self.w3.eth.chain_id  # rpc_url chain id that is connected to web3
-        gas_price = self.w3.eth.gas_price  # get current gas price from the connected network
-        nonce = self.w3.eth.get_transaction_count(checksum_address)  # obtain nonce from your account address
+        with metrics.stage("get_chain_data"):
+            chain_id = self.w3.eth.chain_id  # rpc_url chain id that is connected to web3
+            gas_price = self.w3.eth.gas_price  # get current gas price from the connected network
         logger.debug("Chain ID: {}".format(chain_id))
         logger.debug("Gas Price: {}".format(gas_price))
-        logger.debug("Account Nonce: {}".format(nonce))
-        return {"chain_id": chain_id, "gas_price": gas_price, "nonce": nonce}
+        # The account nonce is reserved by the caller, once the gas budget has been reserved
+        return {"chain_id": chain_id, "gas_price": gas_price}
+
+    @contextlib.contextmanager
+    def _nonce_order(self, checksum_address):
+        # Jobs estimate and sign in parallel, but a nonce must not reach the node before the
+        # ones below it: reserving through sending is one step per owner account, across workers
+        with _account_send_lock:
+            index = get_eoa_index()
+            if index is None:
+                yield
+                return
+            with index.locked("account-" + checksum_address):
+                yield
+
+    def _reserve_account_nonce(self, checksum_address):
+        # Take the larger of the chain's pending count and what this process already handed
+        # out, so concurrent and pipelined sends never reuse a nonce.
+        index = get_eoa_index()
+        with _account_nonce_lock:
+            chain_nonce = self.w3.eth.get_transaction_count(checksum_address, 'pending')
+            if index is not None:
+                # Every worker sends from the same owner account, so the counter is shared between them
+                return index.reserve_counter("account-" + checksum_address, 1, floor=chain_nonce)[0]
+            nonce = max(chain_nonce, _account_nonces.get(checksum_address, 0))
+            _account_nonces[checksum_address] = nonce + 1
+        return nonce
+
+    def _release_account_nonces(self, checksum_address):
+        checksum_address = Web3.to_checksum_address(checksum_address)
+        index = get_eoa_index()
+        with _account_nonce_lock:
+            if index is not None:
+                index.reset_counter("account-" + checksum_address)
+            _account_nonces.pop(checksum_address, None)
 
     def _load_abi(self, filename):
         result = _abi_cache.get(filename)
         if result is None:    
             project_root = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
-            # Construct the path to the sibling directory
-            sibling_path = os.path.join(project_root, "precompile_abi", f"{filename}.json")
-            with open(sibling_path) as f:
-                result = json.load(f)['output']['abi']
+            # Prefer the pre-extracted ABI (python -m utils.startup extract-abi), a plain list of
+            # the entries the SDK uses, over parsing the whole compiler output
+            min_path = os.path.join(project_root, "precompile_abi", f"{filename}.min.json")
+            if os.path.exists(min_path):
+                with open(min_path) as f:
+                    result = json.load(f)
+            else:
+                # Construct the path to the sibling directory
+                sibling_path = os.path.join(project_root, "precompile_abi", f"{filename}.json")
+                with open(sibling_path) as f:
+                    result = json.load(f)['output']['abi']
             _abi_cache[filename] = result
         return result
 
+    def _post_service(self, url, **kwargs):
+        # Every peaq service call queues for a slot of the adaptive limiter and is retried on 429/503
+        return self.service_limiter.call(self.http.post, url, **kwargs)
+
     def _call_service(self, relative_url, data):
         headers = {
             "Content-Type": "application/json",
@@ -415,6 +992,30 @@ class peaq_service_sdk:
             "P-APIKEY": self.project_api_eky
         }
         # Send the POST request
-        response = requests.post(f"{self.peaq_service_url}/v1/{relative_url}", json=data, headers=headers)
+        response = self._post_service(f"{self.peaq_service_url}/v1/{relative_url}", json=data, headers=headers)
         response.raise_for_status()
         return response.json()
+
+
+_service_sdk = None
+_service_sdk_lock = threading.Lock()
+
+def get_service_sdk():
+    """
+    Returns a process wide peaq_service_sdk built from get_config(), so the Web3 provider,
+    owner account and gas station contract object are created once instead of per request.
+    """
+    global _service_sdk
+    if _service_sdk is None:
+        with _service_sdk_lock:
+            if _service_sdk is None:
+                sdk = peaq_service_sdk(*get_config().sdk_args())
+                cassette = None
+                if os.getenv("CASSETTE_RECORD") or os.getenv("CASSETTE_REPLAY"):
+                    cassette = _cassette().from_env()
+                if cassette is not None:
+                    # Capture or replay all RPC/service traffic (CASSETTE_RECORD / CASSETTE_REPLAY)
+                    atexit.register(cassette.close)
+                    cassette.attach(sdk)
+                _service_sdk = sdk
+    return _service_sdk
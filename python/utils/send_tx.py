@@ -1,72 +1,104 @@
-from utils.sdk import peaq_service_sdk
+from utils.sdk import get_service_sdk, PreflightError
 from web3 import Web3, Account
+from web3.exceptions import Web3Exception
 import requests
 from eth_account.messages import encode_defunct
 
 
-import os
+from utils import tracing
+from utils.gas_budget import BudgetExceeded
+from utils.config import get_config, PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
 
-from dotenv import load_dotenv
-load_dotenv()
-
-# import env keys that will need to be sent to the sdk to perform operations
-AGUNG_RPC_URL=os.getenv('AGUNG_RPC_URL')
-
-PEAQ_SERVICE_URL=os.getenv('PEAQ_SERVICE_URL')
-SERVICE_API_KEY=os.getenv('SERVICE_API_KEY')
-PROJECT_API_KEY=os.getenv('PROJECT_API_KEY')
-
-GAS_STATION_ADDRESS =os.getenv('GAS_STATION_ADDRESS')
-GAS_STATION_OWNER_PUBLIC_KEY=os.getenv('GAS_STATION_OWNER_PUBLIC_KEY')
-GAS_STATION_OWNER_PRIVATE_KEY=os.getenv('GAS_STATION_OWNER_PRIVATE_KEY')
-
-
-PRECOMPILE_ADDRESS_DID='0x0000000000000000000000000000000000000800'
-PRECOMPILE_ADDRESS_STORAGE='0x0000000000000000000000000000000000000801'
+# Settings are read from the environment (and .env) once per process
+config = get_config()
 
 # represents a user email and their externally owned account.
 USER_EMAIL='user_email@gmail.com'
 TAG='TEST'
 ITEM_TYPE='ITEM_TYPE'
 ITEM='MY_ITEM'
-EOA_PUBLIC_KEY=os.getenv('EOA_PUBLIC_KEY')
-EOA_PRIVATE_KEY=os.getenv('EOA_PRIVATE_KEY')
+EOA_PUBLIC_KEY=config.eoa_public_key
+EOA_PRIVATE_KEY=config.eoa_private_key
 
 # TODO should did name be set by user or admin/gasStation??
 DID_NAME="peaq"
 
     
 
-def generate_owner_signature(service_sdk, eoa, target, nonce):
-    owner_signature = service_sdk.generate_owner_signature(eoa["eoa_address"], target, eoa["calldata"], nonce)
-    return owner_signature
-
-def send_tx(eoa, eoa_signature, target, nonce):
-    service_sdk = peaq_service_sdk(
-        AGUNG_RPC_URL,
-        PEAQ_SERVICE_URL, 
-        SERVICE_API_KEY, 
-        PROJECT_API_KEY, 
-        GAS_STATION_ADDRESS, 
-        GAS_STATION_OWNER_PUBLIC_KEY, 
-        GAS_STATION_OWNER_PRIVATE_KEY
-    )
-    
-    # first need to register did 
-    owner_signature = generate_owner_signature(service_sdk, eoa, target, nonce)
+# Cheap local check of the EOA signature, run before the transaction is queued.
+# Returns an error message, or None when the signature matches the prepared transaction's message.
+@tracing.traced()
+def check_tx_signature(prepared, eoa_signature):
+    service_sdk = get_service_sdk()
+    try:
+        service_sdk.check_prepared_signature(prepared, eoa_signature)
+    except PreflightError as e:
+        return str(e)
+    return None
+
+# Cheap local check that the gas station (and the tag's quota) can pay for another transaction, run before
+# anything is queued. Returns an error message, or None when there is budget left.
+def check_budget(tag):
+    service_sdk = get_service_sdk()
+    try:
+        service_sdk.gas_budget.check(tag)
+    except BudgetExceeded as e:
+        return str(e)
+    return None
+
+# Executes the PreparedTransaction built by create_tx; its calldata, nonce and owner signature are reused as-is.
+@tracing.traced()
+def send_tx(prepared, eoa_signature):
+    service_sdk = get_service_sdk()
     
-    receipt = service_sdk.execute_funded_transaction(
-        eoa["eoa_address"],
-        eoa["machine_address"],
-        target,
-        eoa["calldata"],
-        nonce,
-        owner_signature,
-        eoa_signature
-    )
+    try:
+        receipt = service_sdk.execute_prepared_transaction(prepared, eoa_signature)
+    except PreflightError as e:
+        return {"status": "failure", "message": str(e)}
+    except (Web3Exception, requests.RequestException) as e:
+        # The node or the peaq service failed (send error, receipt timeout); report it like any other failure
+        return {"status": "failure", "message": "Transaction could not be completed: {}".format(e)}
     
     # Check the status of the transaction
     if receipt.get("status") == 1:
         return {"status": "success", "message": "Transaction executed successfully", "receipt": receipt}
     else:
         return {"status": "failure", "message": "Transaction failed", "receipt": receipt}
+
+# Executes the batch prepared by create_storage_txs. prepared_txs line up with eoa_signatures.
+@tracing.traced()
+def send_txs(prepared_txs, eoa_signatures):
+    service_sdk = get_service_sdk()
+
+    try:
+        executions = service_sdk.execute_prepared_transactions(prepared_txs, eoa_signatures)
+    except PreflightError as e:
+        return {"status": "failure", "results": [{"status": "failure", "message": str(e)} for _ in prepared_txs]}
+
+    results = [None] * len(prepared_txs)
+    try:
+        for index, receipt, error in executions:
+            if error is None and receipt.get("status") == 1:
+                results[index] = {"status": "success", "message": "Transaction executed successfully", "tx_hash": receipt["transactionHash"].hex()}
+            else:
+                results[index] = {"status": "failure", "message": str(error) if error is not None else "Transaction failed"}
+    except (Web3Exception, requests.RequestException) as e:
+        # Items that were not yielded yet are reported as failed, the ones already settled keep their result
+        message = "Transaction could not be completed: {}".format(e)
+        results = [result or {"status": "failure", "message": message} for result in results]
+
+    status = "success" if all(result["status"] == "success" for result in results) else "failure"
+    return {"status": status, "results": results}
+
+# Re-attaches receipt watchers to journaled in-flight transactions after a restart.
+# on_settled(record, machine_address) is called per transaction; machine_address is only set for confirmed deployments.
+def recover_txs(on_settled):
+    service_sdk = get_service_sdk()
+
+    def settled(record, receipt):
+        machine_address = None
+        if receipt is not None and receipt.get("status") == 1 and record.get("kind") == "deploy":
+            machine_address = service_sdk._machine_address_from_receipt(receipt)
+        on_settled(record, machine_address)
+
+    return service_sdk.recover_transactions(settled)
@@ -0,0 +1,220 @@
+import collections
+import email.utils
+import os
+import threading
+import time
+
+import requests
+
+from utils import metrics
+
+
+# Statuses that mean the service did not process the request and asks us to slow down
+RETRYABLE_STATUSES = frozenset([429, 503])
+# Longest Retry-After we honour, a bogus header must not stall every caller for hours
+MAX_RETRY_AFTER = 60.0
+
+limit_gauge = metrics.gauge("service_concurrency_limit", "Current adaptive concurrency limit for peaq service calls.", ["service"])
+in_flight_gauge = metrics.gauge("service_requests_in_flight", "peaq service calls currently in flight.", ["service"])
+queued_gauge = metrics.gauge("service_requests_queued", "Callers waiting for a peaq service slot.", ["service"])
+throttled_total = metrics.counter("service_throttled_total", "peaq service responses that made the limiter back off, by status (or 'timeout'/'latency').", ["service", "reason"])
+
+
+class ServiceOverloaded(requests.exceptions.RequestException):
+    """
+    Waited longer than the queue timeout for a peaq service slot.
+    """
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait for a Retry-After header (delta seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class AimdLimiter:
+    """
+    Client side adaptive concurrency limit (AIMD) with a FIFO wait queue.
+
+    The limit grows by one per limit's worth of fast successful calls (additive increase)
+    and shrinks when the service pushes back: halved on 429/5xx/timeouts, cut by 10% when
+    latency exceeds `latency_tolerance` times the fastest recently observed latency. At
+    most one decrease happens per average call latency, so one burst of errors from the
+    same overload does not collapse the limit.
+
+    A Retry-After on a 429/503 holds back every new call until it has passed, and the
+    call itself is retried up to `max_retries` times. Callers are admitted strictly in
+    arrival order, a freed slot is handed to the oldest waiter.
+    """
+    def __init__(self, name, initial=8, minimum=1, maximum=64, backoff=0.5, latency_tolerance=2.0,
+                 queue_timeout=30.0, max_retries=2, retry_delay=0.5):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._waiters = collections.deque()  # one Event per waiting caller, oldest first
+        self._blocked_until = 0.0
+        self._min_latency = None
+        self._avg_latency = None
+        self._last_decrease = 0.0
+        limit_gauge.set(self.limit, name)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn (a requests call) under the limit and returns its response.
+        429/503 responses are retried after their Retry-After; the last one is returned as is.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            start = time.monotonic()
+            try:
+                response = fn(*args, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                self.release(time.monotonic() - start, overloaded=True, reason="timeout")
+                raise
+            except BaseException:
+                self.release(None)
+                raise
+
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get("Retry-After")) if status in RETRYABLE_STATUSES else None
+            self.release(time.monotonic() - start, overloaded=status == 429 or status >= 500, reason=str(status), retry_after=retry_after)
+            if status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                return response
+            if retry_after is None:
+                # No hint from the service, back off exponentially ourselves
+                time.sleep(self.retry_delay * 2 ** attempt)
+        return response
+
+    def acquire(self):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._lock:
+            if not self._waiters and self._has_slot(time.monotonic()):
+                self._admit()
+                return
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            queued_gauge.set(len(self._waiters), self.name)
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                with self._lock:
+                    if waiter.is_set():
+                        # The slot was handed over just as we gave up
+                        return
+                    self._waiters.remove(waiter)
+                    queued_gauge.set(len(self._waiters), self.name)
+                raise ServiceOverloaded("Timed out waiting for a {} slot".format(self.name))
+            # Waiters also wake up when a Retry-After pause ends, nobody releases a slot then
+            wake_at = min(deadline, max(self._blocked_until, now + 0.05))
+            if waiter.wait(wake_at - now):
+                return
+            with self._lock:
+                self._dispatch()
+                if waiter.is_set():
+                    return
+
+    def release(self, latency, overloaded=False, reason=None, retry_after=None):
+        """
+        Frees a slot and adapts the limit. latency None means the call failed in a way
+        that says nothing about the service (the limit is left alone).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if latency is not None:
+                self._adapt(now, latency, overloaded, reason)
+            self._dispatch()
+            in_flight_gauge.set(self.in_flight, self.name)
+            limit_gauge.set(self.limit, self.name)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "min_latency": self._min_latency,
+                "avg_latency": self._avg_latency,
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+            }
+
+    def _adapt(self, now, latency, overloaded, reason):
+        self._avg_latency = latency if self._avg_latency is None else 0.9 * self._avg_latency + 0.1 * latency
+        if overloaded:
+            self._decrease(now, self.backoff, reason)
+            return
+        # The baseline creeps up slowly so a one-off fast response does not pin it forever
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        else:
+            self._min_latency = 0.99 * self._min_latency + 0.01 * latency
+        if latency > self._min_latency * self.latency_tolerance:
+            self._decrease(now, 0.9, "latency")
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, now, factor, reason):
+        throttled_total.inc(self.name, reason)
+        if now - self._last_decrease < (self._avg_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+
+    def _has_slot(self, now):
+        return self.in_flight < int(self.limit) and now >= self._blocked_until
+
+    def _admit(self):
+        self.in_flight += 1
+        in_flight_gauge.set(self.in_flight, self.name)
+
+    def _dispatch(self):
+        # Hand free slots to the oldest waiters
+        now = time.monotonic()
+        while self._waiters and self._has_slot(now):
+            self._admit()
+            self._waiters.popleft().set()
+        queued_gauge.set(len(self._waiters), self.name)
+
+
+# One limiter per service url, shared by every sdk instance in the process
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_service_limiter(service_url):
+    """
+    Returns the process wide limiter for a peaq service url. SERVICE_CONCURRENCY_INITIAL,
+    SERVICE_CONCURRENCY_MAX and SERVICE_QUEUE_TIMEOUT override the defaults.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(service_url)
+        if limiter is None:
+            limiter = AimdLimiter(
+                service_url,
+                initial=int(os.getenv("SERVICE_CONCURRENCY_INITIAL", "8")),
+                maximum=int(os.getenv("SERVICE_CONCURRENCY_MAX", "64")),
+                queue_timeout=float(os.getenv("SERVICE_QUEUE_TIMEOUT", "30")),
+            )
+            _limiters[service_url] = limiter
+    return limiter
@@ -0,0 +1,134 @@
+"""
+Cold start helpers for autoscaled workers.
+
+Run from the python directory:
+    python -m utils.startup profile                      # import-time report for the server
+    python -m utils.startup profile utils.bulk_import --top 40
+    python -m utils.startup extract-abi gas_station_abi  # refresh precompile_abi/gas_station_abi.min.json
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+
+
+# ABI entries the SDK actually uses; everything else in the compiler output is dead weight at startup
+GAS_STATION_ABI_NAMES = (
+    "deployMachineSmartAccount",
+    "executeTransaction",
+    "MachineSmartAccountDeployed",
+    "MetaTransactionExecuted",
+    "ECDSAInvalidSignature",
+    "ECDSAInvalidSignatureLength",
+    "ECDSAInvalidSignatureS",
+)
+
+ABI_DIR = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "precompile_abi"))
+
+
+def lazy(module_name, attr):
+    """
+    Returns a function that imports module_name on its first call and forwards to module_name.attr.
+    Lets the server bind its port before the web3 stack is loaded.
+    """
+    target = None
+
+    def call(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(module_name), attr)
+        return target(*args, **kwargs)
+
+    call.__name__ = attr
+    call.__qualname__ = attr
+    return call
+
+
+def prewarm(*module_names):
+    """
+    Imports module_names on a daemon thread so the first request does not pay for them.
+    A request that arrives earlier simply waits on the import lock.
+    """
+    def run():
+        for module_name in module_names:
+            importlib.import_module(module_name)
+
+    thread = threading.Thread(target=run, name="prewarm-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+def extract_abi(filename, names=GAS_STATION_ABI_NAMES):
+    """
+    Writes precompile_abi/<filename>.min.json: the named entries of the compiler output's ABI as a plain list.
+    """
+    with open(os.path.join(ABI_DIR, "{}.json".format(filename))) as f:
+        abi = json.load(f)['output']['abi']
+    minimal = [entry for entry in abi if entry.get("name") in names]
+    missing = set(names) - {entry["name"] for entry in minimal}
+    if missing:
+        raise ValueError("{} has no ABI entries named {}".format(filename, ", ".join(sorted(missing))))
+
+    path = os.path.join(ABI_DIR, "{}.min.json".format(filename))
+    with open(path, "w") as f:
+        json.dump(minimal, f, separators=(",", ":"))
+        f.write("\n")
+    return path
+
+
+def import_profile(module_name):
+    """
+    Imports module_name in a fresh interpreter with -X importtime.
+    Returns [(cumulative_us, self_us, module), ...] sorted by cumulative time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module_name)],
+        capture_output=True, text=True, cwd=os.path.dirname(ABI_DIR),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows
+
+
+def print_profile(module_name, top=25):
+    rows = import_profile(module_name)
+    total = rows[0][0] if rows else 0
+    print("Importing {} took {:.0f} ms".format(module_name, total / 1000))
+    print("{:>10} {:>10}  {}".format("cum ms", "self ms", "module"))
+    for cumulative_us, self_us, name in rows[:top]:
+        print("{:>10.1f} {:>10.1f}  {}".format(cumulative_us / 1000, self_us / 1000, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start tooling.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    profile = commands.add_parser("profile", help="import-time report")
+    profile.add_argument("module", nargs="?", default="python_server.event_listener")
+    profile.add_argument("--top", type=int, default=25, help="slowest imports to show")
+
+    abi = commands.add_parser("extract-abi", help="write the trimmed ABI the SDK loads at startup")
+    abi.add_argument("filename", nargs="?", default="gas_station_abi")
+
+    args = parser.parse_args()
+    if args.command == "profile":
+        print_profile(args.module, args.top)
+    else:
+        print("Wrote {}".format(extract_abi(args.filename)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Opt-in encoding of peaq storage items: compression plus chunking across item keys.
+
+What this buys is storing items above the precompile's size limit. Items that already fit
+cost no less gas encoded (benchmarks/bench_storage_codec.py), so small items are stored as-is.
+
+Items are compressed with zlib unless a caller passes codec="zstd", which needs the optional
+`zstandard` package (pip install zstandard) on every host that writes or reads those items.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is an explicit opt-in, zlib is always available
+    zstandard = None
+
+
+# Every encoded chunk starts with a 6 byte header:
+#   magic (2) | version (1) | flags (1) | chunk index (1) | chunk count (1)
+MAGIC = b"\xb5\x51"
+VERSION = 1
+HEADER_SIZE = 6
+
+FLAG_COMPRESSED = 0x01
+FLAG_ZSTD = 0x02  # set together with FLAG_COMPRESSED when zstd was used instead of zlib
+
+# peaq storage rejects items above this size, so bigger payloads are split across keys
+DEFAULT_MAX_ITEM_SIZE = 256
+# Below this size compression rarely pays for the header
+DEFAULT_COMPRESS_THRESHOLD = 64
+MAX_CHUNKS = 255
+# Fixed, so what goes on chain never depends on which packages the writing host has installed
+DEFAULT_CODEC = "zlib"
+
+
+def chunk_key(item_type, index):
+    """
+    Item type under which chunk `index` is stored. Chunk 0 keeps the original item type
+    so existing readers and the data key registered with the service still line up.
+    """
+    if index == 0:
+        return item_type
+    return "{}:{}".format(item_type, index)
+
+
+def encode_item(item, item_type, codec=DEFAULT_CODEC, compress_threshold=DEFAULT_COMPRESS_THRESHOLD,
+                max_item_size=DEFAULT_MAX_ITEM_SIZE):
+    """
+    Encodes an item for peaq storage. Returns a list of (item_type, payload bytes), one per chunk.
+
+    The payload is compressed with `codec` (zlib unless "zstd" is passed) when it is at
+    least `compress_threshold` bytes and compression actually shrinks it, then split so
+    every stored item (header included) fits in `max_item_size` bytes. Items that need
+    neither are stored without a header.
+    """
+    if isinstance(item, str):
+        item = item.encode("utf-8")
+
+    flags = 0
+    payload = item
+    if len(item) >= compress_threshold:
+        compressed = _compress(item, codec)
+        if len(compressed) < len(item):
+            payload = compressed
+            flags |= FLAG_COMPRESSED
+            if codec == "zstd":
+                flags |= FLAG_ZSTD
+
+    if not flags and len(payload) <= max_item_size and not payload.startswith(MAGIC):
+        # Small plain items are stored as-is, which also keeps them readable without the codec
+        return [(item_type, payload)]
+
+    chunk_size = max_item_size - HEADER_SIZE
+    if chunk_size <= 0:
+        raise ValueError("max_item_size must be larger than the {} byte header".format(HEADER_SIZE))
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)] or [b""]
+    if len(chunks) > MAX_CHUNKS:
+        raise ValueError("Item needs {} chunks, at most {} are supported".format(len(chunks), MAX_CHUNKS))
+
+    return [
+        (chunk_key(item_type, index), _header(flags, index, len(chunks)) + chunk)
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+def decode_item(item_type, read_item):
+    """
+    Reassembles and decompresses an item written by encode_item.
+
+    read_item(item_type) must return the stored bytes for a key. Items without the
+    codec header (small plain items, or items written without the codec) are
+    returned unchanged.
+    """
+    first = read_item(item_type)
+    if not is_encoded(first):
+        return first
+
+    _, flags, _, count = _parse_header(first)
+    chunks = [first[HEADER_SIZE:]]
+    for index in range(1, count):
+        stored = read_item(chunk_key(item_type, index))
+        if not is_encoded(stored):
+            raise ValueError("Chunk {} of {} is missing or corrupt".format(index, item_type))
+        _, _, chunk_index, _ = _parse_header(stored)
+        if chunk_index != index:
+            raise ValueError("Expected chunk {} of {}, found chunk {}".format(index, item_type, chunk_index))
+        chunks.append(stored[HEADER_SIZE:])
+
+    payload = b"".join(chunks)
+    if flags & FLAG_COMPRESSED:
+        payload = _decompress(payload, "zstd" if flags & FLAG_ZSTD else "zlib")
+    return payload
+
+
+def is_encoded(stored):
+    return stored is not None and len(stored) >= HEADER_SIZE and stored[:2] == MAGIC
+
+
+def chunk_index(stored):
+    """
+    Index of the chunk a stored payload holds, 0 for items stored without the codec header.
+    Only chunk 0 is stored under the item's own item type.
+    """
+    return stored[4] if is_encoded(stored) else 0
+
+
+def _header(flags, index, count):
+    return MAGIC + bytes([VERSION, flags, index, count])
+
+
+def _parse_header(stored):
+    version, flags, index, count = stored[2], stored[3], stored[4], stored[5]
+    if version != VERSION:
+        raise ValueError("Unsupported storage codec version {}".format(version))
+    return version, flags, index, count
+
+
+def _compress(data, codec):
+    if codec == "zlib":
+        # Raw deflate: our own header already carries the version, so skip zlib's 6 byte wrapper
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    raise ValueError("Unknown storage codec {}".format(codec))
+
+
+def _decompress(data, codec):
+    if codec == "zlib":
+        return zlib.decompress(data, -15)
+    if zstandard is None:
+        raise ImportError("Item was written with zstd, install the zstandard package to read it")
+    return zstandard.ZstdDecompressor().decompress(data)
@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# getItem calls per JSON-RPC batch when backfilling or reconciling
+READ_BATCH_SIZE = int(os.getenv("STORAGE_INDEX_BATCH_SIZE", "100"))
+
+index_items = metrics.gauge("storage_index_items", "peaq storage items known to the local index.")
+index_changes = metrics.counter("storage_index_changes_total", "Items added to or removed from the local storage index, by source.", ["source", "change"])
+
+
+class StorageIndex:
+    """
+    Which peaq storage item types exist for which machine address, kept locally.
+
+    Items get in when an addItem we sent is mined (record) or when a batched read against
+    the storage precompile finds them (backfill). The chain cannot list the items of an
+    address, so the index only knows about item types it was told about; count() is the
+    number of those that exist. The Reconciler re-reads every indexed item and drops the ones
+    the chain no longer has.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}  # { machine address (lower case): set of item types }
+        self._size = 0
+
+    def add(self, machine_address, item_type, source="record"):
+        with self._lock:
+            added = self._add(machine_address.lower(), item_type)
+        if added:
+            index_changes.inc(source, "added")
+
+    def exists(self, machine_address, item_type):
+        items = self._items.get(machine_address.lower())
+        return items is not None and item_type in items
+
+    def count(self, machine_address):
+        return len(self._items.get(machine_address.lower(), ()))
+
+    def item_types(self, machine_address):
+        with self._lock:
+            return sorted(self._items.get(machine_address.lower(), ()))
+
+    def machines(self):
+        with self._lock:
+            return list(self._items)
+
+    def apply(self, machine_address, found, source):
+        """
+        Applies the result of reading item types from the chain: { item_type: exists }.
+        """
+        added = removed = 0
+        key = machine_address.lower()
+        with self._lock:
+            for item_type, exists in found.items():
+                if exists:
+                    added += self._add(key, item_type)
+                else:
+                    removed += self._remove(key, item_type)
+        if added:
+            index_changes.inc(source, "added", amount=added)
+        if removed:
+            index_changes.inc(source, "removed", amount=removed)
+        return added, removed
+
+    def _add(self, key, item_type):
+        items = self._items.setdefault(key, set())
+        if item_type in items:
+            return 0
+        items.add(item_type)
+        self._size += 1
+        index_items.set(self._size)
+        return 1
+
+    def _remove(self, key, item_type):
+        items = self._items.get(key)
+        if not items or item_type not in items:
+            return 0
+        items.discard(item_type)
+        if not items:
+            del self._items[key]
+        self._size -= 1
+        index_items.set(self._size)
+        return 1
+
+
+class Reconciler:
+    """
+    Daemon thread re-reading every indexed item through sdk.backfill_storage_index
+    every `interval` seconds.
+    """
+    def __init__(self, sdk, index, interval):
+        self.sdk = sdk
+        self.index = index
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="storage-index-reconciler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def reconcile_once(self):
+        added = removed = 0
+        for machine_address in self.index.machines():
+            result = self.sdk.backfill_storage_index(machine_address, self.index.item_types(machine_address), source="reconcile")
+            added += result[0]
+            removed += result[1]
+        return added, removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            start = time.monotonic()
+            try:
+                added, removed = self.reconcile_once()
+            except Exception as e:
+                logger.warning("Storage index reconciliation failed: {}".format(e))
+                continue
+            if added or removed:
+                logger.info("Storage index reconciled in {:.1f}s: {} added, {} removed".format(time.monotonic() - start, added, removed))
+
+
+_storage_index = StorageIndex()
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+def get_storage_index():
+    return _storage_index
+
+def start_reconciler(sdk, interval=None):
+    """
+    Starts the process wide reconciler once. interval defaults to
+    STORAGE_INDEX_RECONCILE_SECONDS; does nothing when it is 0 (the default).
+    """
+    global _reconciler
+    if interval is None:
+        interval = float(os.getenv("STORAGE_INDEX_RECONCILE_SECONDS", "0"))
+    if not interval:
+        return None
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = Reconciler(sdk, _storage_index, interval).start()
+    return _reconciler
@@ -0,0 +1,297 @@
+"""
+Lightweight request tracing.
+
+The current span lives in a contextvar, so nested SDK calls, outbound RPC/HTTP calls and
+work handed to starlette's threadpool (which copies the context) all attach to the span
+of the API request that caused them. Finished traces are appended to TRACE_EXPORT_PATH
+as OTLP/JSON, one ExportTraceServiceRequest per line (the layout of the OpenTelemetry
+collector's file exporter), so they can be loaded into any OTLP tool or read with jq.
+
+Tracing is off unless TRACE_EXPORT_PATH is set; TRACE_SAMPLE_RATE (0.0-1.0, default 1.0)
+decides per root span whether a trace is recorded. Unsampled and disabled spans cost a
+contextvar lookup.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SERVICE_NAME = "get-real-wrappers"
+
+_current_span = contextvars.ContextVar("peaq_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "trace_id", "span_id", "parent_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "status_message", "_token")
+
+    def __init__(self, trace, trace_id, parent_id, name, kind, attributes):
+        self.trace = trace
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.start_ns = None
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.status = STATUS_ERROR
+            self.status_message = "{}: {}".format(exc_type.__name__, exc)
+        _current_span.reset(self._token)
+        self.trace.finished(self)
+        return False
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message} if self.status == STATUS_ERROR else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NonRecordingSpan:
+    """
+    Stands in for unsampled spans so their children know not to record either.
+    """
+    __slots__ = ("_token",)
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        return False
+
+
+class _Disabled:
+    """
+    Shared no-op span used when tracing is not configured.
+    """
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_DISABLED = _Disabled()
+
+
+class _Trace:
+    """
+    Collects the spans of one trace and exports them together once the root span ends.
+    Spans that end after that (e.g. receipt watchers) are exported on their own.
+    """
+    __slots__ = ("exporter", "spans", "root", "lock")
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.spans = []
+        self.root = None
+        self.lock = threading.Lock()
+
+    def finished(self, span):
+        with self.lock:
+            if self.root is None:
+                # The root already went out, export this straggler by itself
+                batch = [span]
+            elif span is self.root:
+                batch = self.spans + [span]
+                self.spans = []
+                self.root = None
+            else:
+                self.spans.append(span)
+                return
+        self.exporter.export(batch)
+
+
+class JsonlExporter:
+    """
+    Appends finished traces to a file, one OTLP/JSON ExportTraceServiceRequest per line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+        self.resource = {"attributes": [_otlp_attribute("service.name", SERVICE_NAME), _otlp_attribute("process.pid", os.getpid())]}
+
+    def export(self, spans):
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{"scope": {"name": "utils.tracing"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+_exporter = None
+_sample_rate = 1.0
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure(path=None, sample_rate=None):
+    """
+    Enables tracing to `path` (None disables it). Defaults to TRACE_EXPORT_PATH and TRACE_SAMPLE_RATE.
+    """
+    global _exporter, _sample_rate, _configured
+    with _configure_lock:
+        path = path if path is not None else os.getenv("TRACE_EXPORT_PATH")
+        if sample_rate is None:
+            sample_rate = float(os.getenv("TRACE_SAMPLE_RATE") or 1.0)
+        _exporter = JsonlExporter(path) if path else None
+        _sample_rate = sample_rate
+        _configured = True
+
+
+def span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """
+    Opens a span as a child of the current one: `with tracing.span("create_tx", eoa=...):`.
+    A span without a parent starts a new trace, sampled at TRACE_SAMPLE_RATE.
+    """
+    if not _configured:
+        configure()
+    if _exporter is None:
+        return _DISABLED
+
+    parent = _current_span.get()
+    if parent is None:
+        if random.random() >= _sample_rate:
+            return _NonRecordingSpan()
+        trace = _Trace(_exporter)
+        new_span = Span(trace, os.urandom(16).hex(), None, name, kind, attributes)
+        trace.root = new_span
+        return new_span
+    if isinstance(parent, _NonRecordingSpan):
+        return _NonRecordingSpan()
+    return Span(parent.trace, parent.trace_id, parent.span_id, name, kind, attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def set_attribute(key, value):
+    """
+    Sets an attribute on the current span, if one is being recorded.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+def traced(name=None, attributes=(), kind=SPAN_KIND_INTERNAL):
+    """
+    Decorator that runs a function inside a span. `attributes` names arguments to record,
+    either as "arg" or as ("arg", "attribute name").
+    """
+    def decorate(function):
+        if inspect.isgeneratorfunction(function):
+            # A span around a generator would close before iteration; trace the work it calls instead
+            return function
+        span_name = name or function.__qualname__
+        signature = inspect.signature(function)
+        recorded = [(attribute, attribute) if isinstance(attribute, str) else attribute for attribute in attributes]
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _configured and _exporter is None:
+                return function(*args, **kwargs)
+            span_attributes = {}
+            if recorded:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                for argument, attribute in recorded:
+                    value = bound.get(argument)
+                    if value is not None:
+                        span_attributes[attribute] = value if isinstance(value, (str, int, float, bool)) else str(value)
+            with span(span_name, kind, **span_attributes):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_methods(attributes=(), include=()):
+    """
+    Class decorator wrapping every public method (plus the private ones in `include`) with traced().
+    `attributes` are recorded for whichever methods take an argument of that name.
+    """
+    def decorate(cls):
+        for attr, function in list(vars(cls).items()):
+            if not inspect.isfunction(function) or (attr.startswith("_") and attr not in include):
+                continue
+            parameters = inspect.signature(function).parameters
+            method_attributes = [
+                attribute for attribute in attributes
+                if (attribute if isinstance(attribute, str) else attribute[0]) in parameters
+            ]
+            setattr(cls, attr, traced("{}.{}".format(cls.__name__, attr), method_attributes)(function))
+        return cls
+    return decorate
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
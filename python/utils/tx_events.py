@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+
+# Events a slow subscriber may have queued before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_subscribers = {}  # { eoa_address (lower case): set of (loop, asyncio.Queue) }
+_subscribers_lock = threading.Lock()
+
+
+def publish(eoa_address, status, **fields):
+    """
+    Publishes a transaction lifecycle event (queued, submitted, mined, failed) for a wallet.
+    Safe to call from any thread; a no-op when nobody is listening.
+    """
+    if not eoa_address:
+        return
+    with _subscribers_lock:
+        subscribers = list(_subscribers.get(eoa_address.lower(), ()))
+    if not subscribers:
+        return
+
+    event = {"status": status, "eoa_address": eoa_address, "ts": time.time()}
+    event.update(fields)
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(_put, queue, event)
+        except RuntimeError:
+            # The subscriber's loop is closed, it will be unsubscribed by its own cleanup
+            pass
+
+
+def publish_failure(eoa_address, error, **fields):
+    """
+    Publishes the failed event of an exception that is about to be raised, and marks it so
+    whoever catches it further up (the tx scheduler) does not publish it a second time.
+    """
+    error.failure_published = True
+    publish(eoa_address, "failed", error=str(error), **fields)
+
+
+def failure_published(error):
+    return getattr(error, "failure_published", False)
+
+
+# Set by the tx scheduler around each job: called once the job's transaction is on the network
+_on_sent = contextvars.ContextVar("tx_events_on_sent", default=None)
+
+
+def on_sent(callback):
+    """
+    Registers callback to be called by sent() in the current context.
+    """
+    _on_sent.set(callback)
+
+
+def sent():
+    """
+    Tells whoever runs the current job that its transaction is sent and only its receipt is left.
+    """
+    callback = _on_sent.get()
+    if callback is not None:
+        callback()
+
+
+def subscribe(eoa_address):
+    """
+    Registers a subscriber on the running event loop and returns its queue.
+    Call unsubscribe with the same queue once the client goes away.
+    """
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _subscribers_lock:
+        _subscribers.setdefault(eoa_address.lower(), set()).add((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(eoa_address, queue):
+    key = eoa_address.lower()
+    with _subscribers_lock:
+        subscribers = _subscribers.get(key, set())
+        subscribers.discard((asyncio.get_running_loop(), queue))
+        if not subscribers:
+            _subscribers.pop(key, None)
+
+
+def subscriber_count():
+    with _subscribers_lock:
+        return sum(len(subscribers) for subscribers in _subscribers.values())
+
+
+def _put(queue, event):
+    if queue.full():
+        # Keep the newest state; an idle client only cares where its transaction is now
+        queue.get_nowait()
+    queue.put_nowait(event)
@@ -0,0 +1,191 @@
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Rewrite the journal once this many settled transactions have piled up in it
+COMPACT_AFTER = 1000
+
+
+class TxJournal:
+    """
+    Append-only write-ahead journal of owner transactions, one JSON record per line.
+
+    A "submitted" record is written (and fsynced) before the raw transaction goes out,
+    and a "settled" record once its receipt is known, so after a crash the journal
+    tells exactly which transactions are still in flight. Concurrent appends share
+    one fsync (group commit). "eoa" records snapshot the server's per-wallet state.
+
+    Several worker processes may share one journal: appends and compaction take an
+    flock on `path`.lock, and a writer whose file was swapped out by another process's
+    compaction reopens the new one before appending.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._settled_since_compaction = 0
+        self.max_meta_nonce = None  # highest gas station meta-tx nonce seen by the last replay
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = open(path, "a")
+
+    def submitted(self, tx_hash, account_nonce, **meta):
+        """
+        Records a transaction that is about to be sent. meta holds eoa, target, meta-tx nonce, etc.
+        """
+        record = {"op": "submitted", "tx_hash": tx_hash, "account_nonce": account_nonce, "ts": time.time()}
+        record.update(meta)
+        self._append(record, durable=True)
+
+    def settled(self, tx_hash, status, **meta):
+        """
+        Records the outcome of a submitted transaction ("mined", "failed" or "dropped").
+        """
+        record = {"op": "settled", "tx_hash": tx_hash, "status": status, "ts": time.time()}
+        record.update(meta)
+        # Losing a settled record only means the receipt is fetched again on recovery
+        self._append(record, durable=False)
+        self._settled_since_compaction += 1
+        if self._settled_since_compaction >= COMPACT_AFTER:
+            self.compact()
+
+    def eoa(self, eoa_object):
+        """
+        Snapshots a wallet's server-side state (machine address, pending calldata).
+        """
+        self._append({"op": "eoa", "eoa": eoa_object}, durable=False)
+
+    def replay(self):
+        """
+        Returns (pending, eoa_objects): submitted records without a settled record, in
+        submission order, and the latest snapshot of every wallet. Also sets max_meta_nonce.
+        """
+        self._sync()
+        with self._lock, self._file_lock():
+            return self._read()
+
+    def compact(self):
+        """
+        Rewrites the journal with only the in-flight transactions and latest wallet snapshots.
+        """
+        with self._sync_lock, self._lock, self._file_lock():
+            self._reopen_if_replaced()
+            self._file.flush()
+            pending, eoa_objects = self._read()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                if self.max_meta_nonce is not None:
+                    # Settled records are dropped, their meta-tx nonces must still never be handed out again
+                    f.write(json.dumps({"op": "meta_nonce", "value": self.max_meta_nonce}) + "\n")
+                for eoa_object in eoa_objects.values():
+                    f.write(json.dumps({"op": "eoa", "eoa": eoa_object}, default=_json_default) + "\n")
+                for record in pending:
+                    f.write(json.dumps(record, default=_json_default) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file.close()
+            self._file = open(self.path, "a")
+            self._synced = self._written
+            self._settled_since_compaction = 0
+        logger.debug("Compacted tx journal to {} pending transactions".format(len(pending)))
+
+    def _read(self):
+        pending = {}
+        eoa_objects = {}
+        max_meta_nonce = None
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    continue
+                meta_nonce = record.get("value") if record["op"] == "meta_nonce" else record.get("meta_nonce")
+                if meta_nonce is not None and (max_meta_nonce is None or meta_nonce > max_meta_nonce):
+                    max_meta_nonce = meta_nonce
+                if record["op"] == "submitted":
+                    pending[record["tx_hash"]] = record
+                elif record["op"] == "settled":
+                    pending.pop(record["tx_hash"], None)
+                elif record["op"] == "eoa":
+                    eoa_objects[record["eoa"]["eoa_address"]] = record["eoa"]
+        self.max_meta_nonce = max_meta_nonce
+        return list(pending.values()), eoa_objects
+
+    def _append(self, record, durable):
+        line = json.dumps(record, default=_json_default) + "\n"
+        with self._lock:
+            with self._file_lock():
+                self._reopen_if_replaced()
+                self._file.write(line)
+                # Flushed while locked, so another worker's compaction never misses the record
+                self._file.flush()
+            self._written += 1
+            seq = self._written
+        if durable:
+            self._sync(seq)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reopen_if_replaced(self):
+        # Another worker compacted the journal; our file is the old, unlinked one
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._file.close()
+            self._file = open(self.path, "a")
+
+    def _sync(self, seq=None):
+        with self._sync_lock:
+            with self._lock:
+                if seq is not None and self._synced >= seq:
+                    # Another writer's fsync already covered this record
+                    return
+                self._file.flush()
+                written = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self._synced = written
+
+
+def _json_default(value):
+    # PreparedTransaction and friends know how to serialize themselves
+    to_json = getattr(value, "to_json", None)
+    if to_json is not None:
+        return to_json()
+    return str(value)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_tx_journal():
+    """
+    Returns the process wide journal at TX_JOURNAL_PATH, or None when journaling is not configured.
+    """
+    global _journal
+    path = os.getenv("TX_JOURNAL_PATH")
+    if not path:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = TxJournal(path)
+        return _journal
@@ -1,37 +1,26 @@
-from utils.sdk import peaq_service_sdk
+from utils.sdk import get_service_sdk, PreflightError
 from web3 import Web3
+from web3.exceptions import Web3Exception
 import requests
 
-import os
+from utils import tracing
+from utils import gas_budget
+from utils.config import get_config, PRECOMPILE_ADDRESS_DID, PRECOMPILE_ADDRESS_STORAGE
 
-from dotenv import load_dotenv
-load_dotenv()
-
-# import env keys that will need to be sent to the sdk to perform operations
-AGUNG_RPC_URL=os.getenv('AGUNG_RPC_URL')
-
-PEAQ_SERVICE_URL=os.getenv('PEAQ_SERVICE_URL')
-SERVICE_API_KEY=os.getenv('SERVICE_API_KEY')
-PROJECT_API_KEY=os.getenv('PROJECT_API_KEY')
-
-GAS_STATION_ADDRESS =os.getenv('GAS_STATION_ADDRESS')
-GAS_STATION_OWNER_PUBLIC_KEY=os.getenv('GAS_STATION_OWNER_PUBLIC_KEY')
-GAS_STATION_OWNER_PRIVATE_KEY=os.getenv('GAS_STATION_OWNER_PRIVATE_KEY')
-
-
-PRECOMPILE_ADDRESS_DID='0x0000000000000000000000000000000000000800'
-PRECOMPILE_ADDRESS_STORAGE='0x0000000000000000000000000000000000000801'
+# Settings are read from the environment (and .env) once per process
+config = get_config()
 
 # represents a user email and their externally owned account.
 USER_EMAIL='user_email@gmail.com'
 TAG='TEST'
 ITEM_TYPE='ITEM_TYPE'
 ITEM='MY_ITEM'
-EOA_PUBLIC_KEY=os.getenv('EOA_PUBLIC_KEY')
-EOA_PRIVATE_KEY=os.getenv('EOA_PRIVATE_KEY')
+EOA_PUBLIC_KEY=config.eoa_public_key
+EOA_PRIVATE_KEY=config.eoa_private_key
 
 DID_NAME="peaq"
 
+@tracing.traced(attributes=("nonce",))
 def create_smart_account(service_sdk, eoa_event, nonce):
     eoa_address = Web3.to_checksum_address(eoa_event["eoa_address"])
     # Read peaq storage to see if a machine_address was returned; if not then there is none present so we can create one. 
@@ -49,19 +38,47 @@ def create_smart_account(service_sdk, eoa_event, nonce):
 # 
 # 1. Received user registration event trigger.
 # 2. User creates deployment signature & then creates a machine smart account after verification.
+@tracing.traced(attributes=("nonce",))
 def user_signup(eoa_event, nonce):
-    service_sdk = peaq_service_sdk(
-        AGUNG_RPC_URL,
-        PEAQ_SERVICE_URL, 
-        SERVICE_API_KEY, 
-        PROJECT_API_KEY, 
-        GAS_STATION_ADDRESS, 
-        GAS_STATION_OWNER_PUBLIC_KEY, 
-        GAS_STATION_OWNER_PRIVATE_KEY
-    )
+    service_sdk = get_service_sdk()
+    # The deployment is charged to the user's tag
+    gas_budget.assign_tag(eoa_event["eoa_address"], eoa_event.get("tag"))
     
-    eoa = create_smart_account(service_sdk, eoa_event, nonce)
+    try:
+        eoa = create_smart_account(service_sdk, eoa_event, nonce)
+    except PreflightError as e:
+        return {"status": "failure", "message": str(e)}
+    except (Web3Exception, requests.RequestException) as e:
+        # The node or the peaq service failed (send error, receipt timeout); report it like any other failure
+        return {"status": "failure", "message": "Deployment could not be completed: {}".format(e)}
     message = service_sdk.create_id_to_sign(eoa["machine_address"])
     
     return {"status": "success", "message": message}
+
+# Bulk version of user_signup for onboarding waves of users.
+#
+# eoa_events and nonces line up one to one; nonces is the block of gas station nonces reserved by the caller.
+# Deploy authorizations are all signed up front and the deployments are pipelined, so results are yielded
+# per eoa as they confirm (not in input order).
+def user_signup_many(eoa_events, nonces):
+    service_sdk = get_service_sdk()
+
+    eoa_addresses = [Web3.to_checksum_address(eoa_event["eoa_address"]) for eoa_event in eoa_events]
+    events_by_address = dict(zip(eoa_addresses, eoa_events))
+    for eoa_event in eoa_events:
+        gas_budget.assign_tag(eoa_event["eoa_address"], eoa_event.get("tag"))
+    deploy_signatures = service_sdk.generate_owner_deploy_signatures(eoa_addresses, nonces)
+
+    for eoa_address, machine_address, error in service_sdk.deploy_machine_smart_accounts(eoa_addresses, nonces, deploy_signatures):
+        eoa_event = events_by_address[eoa_address]
+        if error is not None:
+            yield {"status": "failure", "eoa_address": eoa_event["eoa_address"], "message": str(error)}
+            continue
+        eoa_event["machine_address"] = machine_address
+        message = service_sdk.create_id_to_sign(machine_address)
+        yield {"status": "success", "eoa_address": eoa_event["eoa_address"], "machine_address": machine_address, "message": message}
     
+
+# user_signup_many run to completion, for callers that queue each chunk of a batch as one scheduler job.
+def user_signup_chunk(eoa_events, nonces):
+    return list(user_signup_many(eoa_events, nonces))
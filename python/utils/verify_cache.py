@@ -0,0 +1,121 @@
+import collections
+import os
+import threading
+import time
+
+from utils import metrics
+
+
+# A verified DID/storage stays verified, anything else may flip as soon as a write lands
+POSITIVE_TTL = float(os.getenv("VERIFY_CACHE_POSITIVE_TTL", "600"))
+NEGATIVE_TTL = float(os.getenv("VERIFY_CACHE_NEGATIVE_TTL", "5"))
+MAX_ENTRIES = int(os.getenv("VERIFY_CACHE_MAX_ENTRIES", "10000"))
+
+cache_requests = metrics.counter("verify_cache_requests_total", "Verification lookups by endpoint and cache result (hit/miss).", ["endpoint", "result"])
+cache_invalidations = metrics.counter("verify_cache_invalidations_total", "Cached verification results dropped because one of our writes confirmed.")
+
+
+def is_positive(response):
+    data = response.get("data") if isinstance(response, dict) else None
+    return response.get("status") == "success" and isinstance(data, dict) and data.get("verified") is True
+
+
+class VerifyCache:
+    """
+    Results of the peaq service verify endpoints, keyed by (endpoint, request body).
+
+    Positive results live for POSITIVE_TTL, negative/pending ones for NEGATIVE_TTL.
+    Every entry of an (email, tag) is dropped when one of our DID/storage transactions for
+    a machine address remembered with that (email, tag) confirms. A result fetched while
+    such an invalidation happened is returned but not stored, so it cannot undo it.
+    """
+    def __init__(self, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # { key: (expires_at, response) }, least recently used first
+        self._keys = {}                            # { (email, tag): set of keys }
+        self._generations = {}                     # { (email, tag): invalidation count }
+        self._owners = collections.OrderedDict()   # { machine address (lower case): set of (email, tag) }
+
+    def get(self, endpoint, data, fetch):
+        """
+        Returns the cached response for this verify request, or fetch() and caches it.
+        Errors raised by fetch are not cached.
+        """
+        owner = (data.get("address"), data.get("tag"))
+        key = (owner, endpoint, tuple(sorted((name, str(value)) for name, value in data.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                cache_requests.inc(endpoint, "hit")
+                return entry[1]
+            generation = self._generations.get(owner, 0)
+        cache_requests.inc(endpoint, "miss")
+
+        response = fetch()
+        ttl = self.positive_ttl if is_positive(response) else self.negative_ttl
+        with self._lock:
+            if self._generations.get(owner, 0) == generation:
+                self._entries[key] = (time.monotonic() + ttl, response)
+                self._entries.move_to_end(key)
+                self._keys.setdefault(owner, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    self._discard(next(iter(self._entries)))
+        return response
+
+    def remember(self, machine_address, email, tag):
+        """
+        Records that writes for machine_address change what verify answers for (email, tag).
+        """
+        if not machine_address:
+            return
+        with self._lock:
+            owners = self._owners.setdefault(machine_address.lower(), set())
+            owners.add((email, tag))
+            self._owners.move_to_end(machine_address.lower())
+            while len(self._owners) > self.max_entries:
+                self._owners.popitem(last=False)
+
+    def invalidate_machine(self, machine_address):
+        """
+        Drops the cached results of every (email, tag) remembered for machine_address.
+        """
+        if not machine_address:
+            return
+        with self._lock:
+            owners = self._owners.get(machine_address.lower(), ())
+            for owner in owners:
+                self._invalidate(owner)
+        if owners:
+            cache_invalidations.inc()
+
+    def invalidate(self, email, tag):
+        with self._lock:
+            self._invalidate((email, tag))
+
+    def _invalidate(self, owner):
+        self._generations[owner] = self._generations.get(owner, 0) + 1
+        for key in list(self._keys.get(owner, ())):
+            self._discard(key)
+
+    def _discard(self, key):
+        del self._entries[key]
+        keys = self._keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys[key[0]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+
+_verify_cache = VerifyCache()
+
+def get_verify_cache():
+    return _verify_cache